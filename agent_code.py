@@ -6,7 +6,7 @@ os.environ['HTTP_PROXY'] = os.environ["PROXY"]
 os.environ['HTTPS_PROXY'] = os.environ["PROXY"]
 
 from smolagents import CodeAgent, HfApiModel, Tool
-from smolagents import OpenAIServerModel
+from agent_runtime.models import create_model
 import base64
 # 画图工具
 image_generation_tool = Tool.from_space(
@@ -20,12 +20,8 @@ image_generation_tool = Tool.from_space(
 #import shutil
 #shutil.move(image_path, os.getcwd())
 
-# Initialize the model
-amodel = OpenAIServerModel(
-    model_id=os.environ["MODEL_NAME"],
-    api_base="https://openrouter.ai/api/v1",
-    api_key=os.environ["OPENAI_TOKEN"],
-)
+# Initialize the model(可通过AGENT_MODEL_BACKEND切换后端)
+amodel = create_model("openai")
 
 # Initialize the agent
 agent = CodeAgent(model=amodel,tools=[image_generation_tool])
@@ -0,0 +1,6 @@
+"""
+智能体运行时辅助模块
+
+该包会被复制到py-sandbox镜像的/opt/agent_runtime(PYTHONPATH包含/opt)，
+代码模板和仓库根目录下的智能体脚本都可以直接import使用。
+"""
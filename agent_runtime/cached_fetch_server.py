@@ -0,0 +1,49 @@
+"""
+带缓存的mcp_server_fetch
+
+把mcp_server_fetch中实际发出请求的fetch_url替换为经过agent_runtime.http_cache的版本，
+其余行为(robots.txt检查、HTML转markdown、分段读取)保持不变。
+
+用法(参数与mcp_server_fetch相同):
+    python -m agent_runtime.cached_fetch_server [--ignore-robots-txt] [--user-agent UA]
+"""
+import asyncio
+from typing import Optional, Tuple
+
+import mcp_server_fetch
+import requests
+from mcp_server_fetch import server
+from mcp.shared.exceptions import McpError
+from mcp.types import ErrorData, INTERNAL_ERROR
+
+from agent_runtime import http_cache
+
+
+async def cached_fetch_url(url: str, user_agent: str, force_raw: bool = False,
+                           proxy_url: Optional[str] = None) -> Tuple[str, str]:
+    """与mcp_server_fetch.server.fetch_url相同，但通过共享缓存抓取(代理取自HTTP(S)_PROXY环境变量)"""
+    try:
+        response = await asyncio.to_thread(http_cache.fetch, url, 30, {"User-Agent": user_agent})
+    except requests.RequestException as e:
+        raise McpError(ErrorData(code=INTERNAL_ERROR, message=f"Failed to fetch {url}: {e!r}"))
+    if response.status_code >= 400:
+        raise McpError(ErrorData(
+            code=INTERNAL_ERROR,
+            message=f"Failed to fetch {url} - status code {response.status_code}",
+        ))
+
+    page_raw = response.text
+    content_type = response.headers.get("Content-Type", "")
+    is_page_html = "<html" in page_raw[:100] or "text/html" in content_type or not content_type
+    if is_page_html and not force_raw:
+        return server.extract_content_from_html(page_raw), ""
+    return (
+        page_raw,
+        f"Content type {content_type} cannot be simplified to markdown, but here is the raw content:\n",
+    )
+
+
+server.fetch_url = cached_fetch_url
+
+if __name__ == "__main__":
+    mcp_server_fetch.main()
@@ -0,0 +1,220 @@
+"""
+磁盘HTTP抓取缓存
+
+所有抓取网页的工具(VisitWebpageTool的缓存版本、带缓存的mcp_server_fetch)共用这个缓存。
+缓存目录由环境变量AGENT_HTTP_CACHE_DIR指定，沙盒容器中是从主机挂载的共享目录，
+因此同一天内不同任务、不同容器抓取的相同网页只需要下载一次。
+
+- TTL(AGENT_HTTP_CACHE_TTL，默认1天)内直接使用缓存
+- 过期后如果有ETag/Last-Modified则发送条件请求，304时沿用缓存内容
+- 同一URL的并发抓取只有一个真正发出请求：进程内用线程锁，跨进程/容器用文件锁，
+  其他请求等待后直接读取刚写入的缓存
+- 只缓存200响应；超过大小上限的响应不缓存
+"""
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Optional, Dict, Iterator
+
+import requests
+
+try:
+    import fcntl
+except ImportError:  # Windows主机上只做进程内去重
+    fcntl = None
+
+CACHE_DIR = os.getenv("AGENT_HTTP_CACHE_DIR", "/tmp/agent_http_cache")
+CACHE_TTL = float(os.getenv("AGENT_HTTP_CACHE_TTL", str(24 * 3600)))
+# 单个响应的缓存大小上限
+MAX_BODY_BYTES = 10 * 1024 * 1024
+# 超过该时间没有被使用的条目在清理时删除
+PRUNE_AGE = 7 * 24 * 3600
+USER_AGENT = "Mozilla/5.0 (compatible; smolagent-sandbox)"
+
+_locks: Dict[str, threading.Lock] = {}
+_locks_guard = threading.Lock()
+_pruned = False
+_session = requests.Session()
+_CHARSET_RE = re.compile(rb'charset=["\']?([\w-]+)', re.IGNORECASE)
+
+
+@dataclass
+class CachedResponse:
+    """
+    抓取结果
+
+    属性:
+        url: 请求的URL
+        status_code: HTTP状态码(使用缓存时为200)
+        headers: 响应头中的Content-Type、ETag和Last-Modified
+        content: 响应体
+        from_cache: 内容是否来自缓存(包括304重新验证)
+    """
+    url: str
+    status_code: int
+    headers: Dict[str, str] = field(default_factory=dict)
+    content: bytes = b""
+    from_cache: bool = False
+
+    @property
+    def encoding(self) -> str:
+        """按Content-Type或页面中的charset声明确定编码，默认utf-8"""
+        for source in (self.headers.get("Content-Type", "").encode("latin-1", "ignore"), self.content[:2048]):
+            match = _CHARSET_RE.search(source)
+            if match:
+                return match.group(1).decode("ascii")
+        return "utf-8"
+
+    @property
+    def text(self) -> str:
+        try:
+            return self.content.decode(self.encoding, errors="replace")
+        except LookupError:
+            return self.content.decode("utf-8", errors="replace")
+
+    def raise_for_status(self) -> None:
+        if self.status_code >= 400:
+            raise requests.HTTPError(f"{self.status_code} Error for url: {self.url}")
+
+
+def _key(url: str) -> str:
+    return hashlib.sha256(url.encode("utf-8")).hexdigest()
+
+
+def _paths(cache_dir: str, key: str):
+    base = os.path.join(cache_dir, key[:2], key)
+    return base + ".json", base + ".body", base + ".lock"
+
+
+@contextmanager
+def _url_lock(cache_dir: str, key: str) -> Iterator[None]:
+    """同一URL同时只允许一个抓取：线程锁加文件锁"""
+    with _locks_guard:
+        lock = _locks.setdefault(key, threading.Lock())
+    with lock:
+        if fcntl is None:
+            yield
+            return
+        _, _, lock_path = _paths(cache_dir, key)
+        os.makedirs(os.path.dirname(lock_path), exist_ok=True)
+        with open(lock_path, "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _load(cache_dir: str, key: str):
+    meta_path, body_path, _ = _paths(cache_dir, key)
+    try:
+        with open(meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        with open(body_path, "rb") as f:
+            return meta, f.read()
+    except (OSError, ValueError):
+        return None, None
+
+
+def _write_atomic(path: str, data: bytes) -> None:
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def _store(cache_dir: str, key: str, meta: Dict, body: Optional[bytes] = None) -> None:
+    meta_path, body_path, _ = _paths(cache_dir, key)
+    os.makedirs(os.path.dirname(meta_path), exist_ok=True)
+    if body is not None:
+        _write_atomic(body_path, body)
+    _write_atomic(meta_path, json.dumps(meta, ensure_ascii=False).encode("utf-8"))
+
+
+def prune(cache_dir: str = CACHE_DIR, max_age: float = PRUNE_AGE) -> None:
+    """删除超过max_age没有更新的缓存文件"""
+    cutoff = time.time() - max_age
+    for root, _, files in os.walk(cache_dir):
+        for name in files:
+            path = os.path.join(root, name)
+            try:
+                if os.stat(path).st_mtime < cutoff:
+                    os.unlink(path)
+            except OSError:
+                pass
+
+
+def _maybe_prune(cache_dir: str) -> None:
+    global _pruned
+    if not _pruned:
+        _pruned = True
+        threading.Thread(target=prune, args=(cache_dir,), daemon=True).start()
+
+
+def fetch(url: str, timeout: float = 20, headers: Optional[Dict[str, str]] = None,
+          ttl: Optional[float] = None, cache_dir: Optional[str] = None) -> CachedResponse:
+    """
+    通过缓存抓取URL
+
+    参数:
+        url: 要抓取的URL
+        timeout: 请求超时秒数
+        headers: 额外的请求头(不参与缓存键)
+        ttl: 缓存有效期秒数，默认为AGENT_HTTP_CACHE_TTL
+        cache_dir: 缓存目录，默认为AGENT_HTTP_CACHE_DIR
+
+    返回:
+        CachedResponse，非200响应不会写入缓存
+
+    异常:
+        requests.RequestException: 请求失败且没有可用的缓存
+    """
+    cache_dir = cache_dir or CACHE_DIR
+    ttl = CACHE_TTL if ttl is None else ttl
+    key = _key(url)
+    with _url_lock(cache_dir, key):
+        # 等待锁期间其他请求可能已经写入了缓存
+        meta, body = _load(cache_dir, key)
+        if meta is not None and time.time() - meta["fetched_at"] < ttl:
+            return CachedResponse(url, 200, meta["headers"], body, from_cache=True)
+
+        request_headers = {"User-Agent": USER_AGENT, **(headers or {})}
+        if meta is not None:
+            if meta["headers"].get("ETag"):
+                request_headers["If-None-Match"] = meta["headers"]["ETag"]
+            if meta["headers"].get("Last-Modified"):
+                request_headers["If-Modified-Since"] = meta["headers"]["Last-Modified"]
+        try:
+            response = _session.get(url, headers=request_headers, timeout=timeout)
+        except requests.RequestException:
+            if meta is not None:
+                # 网络失败时退回使用过期的缓存
+                return CachedResponse(url, 200, meta["headers"], body, from_cache=True)
+            raise
+
+        if response.status_code == 304 and meta is not None:
+            meta["fetched_at"] = time.time()
+            _store(cache_dir, key, meta)
+            return CachedResponse(url, 200, meta["headers"], body, from_cache=True)
+
+        kept_headers = {name: response.headers[name] for name in ("Content-Type", "ETag", "Last-Modified")
+                        if name in response.headers}
+        result = CachedResponse(response.url or url, response.status_code, kept_headers, response.content)
+        if response.status_code == 200 and len(response.content) <= MAX_BODY_BYTES:
+            _store(cache_dir, key, {"url": url, "fetched_at": time.time(), "headers": kept_headers},
+                   response.content)
+            _maybe_prune(cache_dir)
+        return result
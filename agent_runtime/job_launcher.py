@@ -0,0 +1,99 @@
+"""
+容器内的任务启动器
+
+在新的进程组中运行任务命令，并把进程组ID记录到/tmp/sandbox_jobs/<job_id>.pgid，
+这样宿主机可以只结束这一个任务的全部进程，而不必停止整个容器。
+可选地用RLIMIT_CPU限制任务的CPU时间。
+
+用法:
+    python -m agent_runtime.job_launcher --job-id ID [--cpu-seconds N] -- <命令...>
+    python -m agent_runtime.job_launcher --kill ID
+"""
+import argparse
+import os
+import re
+import resource
+import signal
+import subprocess
+import sys
+from typing import List, Optional
+
+JOBS_DIR = "/tmp/sandbox_jobs"
+# CPU软限制到期后内核先发送SIGXCPU，超出这段宽限时间后发送SIGKILL
+CPU_HARD_GRACE = 5
+
+_JOB_ID_RE = re.compile(r"^[A-Za-z0-9_.-]+$")
+
+
+def _pgid_file(job_id: str) -> str:
+    if not _JOB_ID_RE.match(job_id):
+        raise ValueError(f"无效的任务ID: {job_id}")
+    return os.path.join(JOBS_DIR, f"{job_id}.pgid")
+
+
+def launch(job_id: str, cmd: List[str], cpu_seconds: Optional[int] = None) -> int:
+    """
+    在新进程组中运行命令并等待结束
+
+    返回:
+        命令的退出码，被信号结束时为128+信号值
+    """
+    pgid_file = _pgid_file(job_id)
+    os.makedirs(JOBS_DIR, exist_ok=True)
+
+    def limit_cpu():
+        resource.setrlimit(resource.RLIMIT_CPU, (cpu_seconds, cpu_seconds + CPU_HARD_GRACE))
+
+    proc = subprocess.Popen(cmd, start_new_session=True,
+                            preexec_fn=limit_cpu if cpu_seconds else None)
+    # start_new_session使子进程成为新进程组的组长，进程组ID等于其PID
+    with open(pgid_file, "w") as f:
+        f.write(str(proc.pid))
+
+    def forward(signum, _frame):
+        try:
+            os.killpg(proc.pid, signum)
+        except ProcessLookupError:
+            pass
+
+    signal.signal(signal.SIGTERM, forward)
+    signal.signal(signal.SIGINT, forward)
+    try:
+        returncode = proc.wait()
+    finally:
+        try:
+            os.unlink(pgid_file)
+        except OSError:
+            pass
+    return returncode if returncode >= 0 else 128 - returncode
+
+
+def kill(job_id: str, signum: int = signal.SIGKILL) -> bool:
+    """结束任务的整个进程组，任务不存在时返回False"""
+    try:
+        with open(_pgid_file(job_id)) as f:
+            pgid = int(f.read().strip())
+        os.killpg(pgid, signum)
+        return True
+    except (OSError, ValueError):
+        return False
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Run or kill a sandbox job in its own process group")
+    parser.add_argument("--job-id", help="job id used to record the process group")
+    parser.add_argument("--cpu-seconds", type=int, default=None, help="CPU time limit (RLIMIT_CPU)")
+    parser.add_argument("--kill", metavar="JOB_ID", help="kill the process group of a running job")
+    parser.add_argument("cmd", nargs=argparse.REMAINDER, help="command to run, after --")
+    args = parser.parse_args()
+
+    if args.kill:
+        return 0 if kill(args.kill) else 1
+    cmd = args.cmd[1:] if args.cmd and args.cmd[0] == "--" else args.cmd
+    if not args.job_id or not cmd:
+        parser.error("--job-id and a command are required")
+    return launch(args.job_id, cmd, args.cpu_seconds)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,201 @@
+"""
+MCP集成的性能基准
+
+默认连接本地替身服务agent_runtime.mock_mcp_server，不访问网络，结果可以重复比较:
+
+- startup: ToolCollection.from_mcp的进入耗时(启动子进程、initialize、list_tools)和退出耗时；
+  以及像原来mcp_web_agent.py那样嵌套启动3个服务与MCPServerManager并发启动3个服务的对比
+- latency: 零延迟工具(get_current_time)的串行往返耗时，即stdio、JSON-RPC和适配层本身的开销；
+  fetch在不同返回大小下的往返耗时
+- throughput: 服务端每次调用有固定延迟时，不同并发数下的调用吞吐(次/秒)和理想值(并发数/延迟)
+
+用法:
+    python -m agent_runtime.mcp_benchmark --iterations 200 --concurrency 1,4,16 --json mcp_bench.json
+    python -m agent_runtime.mcp_benchmark --client manager      # 通过MCPServerManager取得工具
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack, contextmanager
+from typing import Dict, List, Any, Iterator
+
+from mcp import StdioServerParameters
+from smolagents import ToolCollection
+
+from agent_runtime.mcp_manager import MCPServerManager
+from agent_runtime.step_trace import percentile
+
+# agent_runtime所在的目录，子进程需要它才能以-m方式运行替身服务
+_PACKAGE_PARENT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def mock_parameters(latency_ms: float = 0, payload_bytes: int = 5000,
+                    startup_delay: float = 0) -> StdioServerParameters:
+    """返回启动替身服务的参数"""
+    python_path = os.pathsep.join(filter(None, [_PACKAGE_PARENT, os.environ.get("PYTHONPATH")]))
+    return StdioServerParameters(
+        command=sys.executable,
+        args=["-m", "agent_runtime.mock_mcp_server", "--latency-ms", str(latency_ms),
+              "--payload-bytes", str(payload_bytes), "--startup-delay", str(startup_delay)],
+        env={"PYTHONPATH": python_path},
+    )
+
+
+def summarize(samples: List[float]) -> Dict[str, float]:
+    """耗时样本(秒)的统计，单位毫秒"""
+    if not samples:
+        return {"n": 0}
+    return {
+        "n": len(samples),
+        "mean_ms": round(sum(samples) / len(samples) * 1000, 3),
+        "p50_ms": round(percentile(samples, 0.5) * 1000, 3),
+        "p95_ms": round(percentile(samples, 0.95) * 1000, 3),
+        "p99_ms": round(percentile(samples, 0.99) * 1000, 3),
+        "max_ms": round(max(samples) * 1000, 3),
+    }
+
+
+@contextmanager
+def open_tools(parameters: StdioServerParameters, client: str) -> Iterator[Dict[str, Any]]:
+    """按client(collection或manager)连接服务，产出工具名称到工具的映射"""
+    if client == "manager":
+        with MCPServerManager({"bench": parameters}) as manager:
+            yield {tool.name: tool for tool in manager.tools("bench").tools}
+    else:
+        with ToolCollection.from_mcp(parameters, trust_remote_code=True) as collection:
+            yield {tool.name: tool for tool in collection.tools}
+
+
+def bench_startup(runs: int, servers: int = 3, startup_delay: float = 0) -> Dict[str, Any]:
+    """测量服务启动和关闭的耗时，startup_delay模拟服务启动时等待I/O的秒数"""
+    enter, exit_ = [], []
+    for _ in range(runs):
+        start = time.perf_counter()
+        collection = ToolCollection.from_mcp(mock_parameters(startup_delay=startup_delay), trust_remote_code=True)
+        collection.__enter__()
+        enter.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        collection.__exit__(None, None, None)
+        exit_.append(time.perf_counter() - start)
+
+    nested, concurrent = [], []
+    for _ in range(runs):
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            for _ in range(servers):
+                stack.enter_context(ToolCollection.from_mcp(mock_parameters(startup_delay=startup_delay),
+                                                            trust_remote_code=True))
+            nested.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        with MCPServerManager({f"s{i}": mock_parameters(startup_delay=startup_delay)
+                               for i in range(servers)}) as manager:
+            manager.tools()
+            concurrent.append(time.perf_counter() - start)
+    return {
+        "from_mcp_enter": summarize(enter),
+        "from_mcp_exit": summarize(exit_),
+        f"nested_{servers}_servers": summarize(nested),
+        f"manager_{servers}_servers": summarize(concurrent),
+    }
+
+
+def bench_latency(client: str, iterations: int, payload_sizes: List[int]) -> Dict[str, Any]:
+    """串行调用，测量单次往返耗时"""
+    results = {}
+    with open_tools(mock_parameters(payload_bytes=max(payload_sizes)), client) as tools:
+        for _ in range(5):  # 预热
+            tools["get_current_time"](timezone="Asia/Shanghai")
+        samples = []
+        for _ in range(iterations):
+            start = time.perf_counter()
+            tools["get_current_time"](timezone="Asia/Shanghai")
+            samples.append(time.perf_counter() - start)
+        results["get_current_time"] = summarize(samples)
+        for size in payload_sizes:
+            samples = []
+            for i in range(max(iterations // 4, 10)):
+                start = time.perf_counter()
+                tools["fetch"](url=f"https://example.com/{i}", max_length=size)
+                samples.append(time.perf_counter() - start)
+            results[f"fetch_{size}"] = summarize(samples)
+    return results
+
+
+def bench_throughput(client: str, latency_ms: float, levels: List[int], calls: int) -> Dict[str, Any]:
+    """服务端有固定延迟时，不同并发数下的吞吐"""
+    results = {}
+    with open_tools(mock_parameters(latency_ms=latency_ms), client) as tools:
+        fetch = tools["fetch"]
+        fetch(url="https://example.com/warmup")
+        for level in levels:
+            samples: List[float] = []
+
+            def call(i: int) -> None:
+                start = time.perf_counter()
+                fetch(url=f"https://example.com/{i}", max_length=2000)
+                samples.append(time.perf_counter() - start)
+
+            total = max(calls, level * 4)
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=level) as executor:
+                list(executor.map(call, range(total)))
+            elapsed = time.perf_counter() - start
+            results[f"concurrency_{level}"] = {
+                "calls": total,
+                "calls_per_second": round(total / elapsed, 2),
+                "ideal_calls_per_second": round(level / (latency_ms / 1000), 2) if latency_ms else None,
+                **summarize(samples),
+            }
+    return results
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="MCP集成的性能基准(使用本地替身服务)")
+    parser.add_argument("--client", choices=["collection", "manager"], default="collection",
+                        help="通过ToolCollection.from_mcp还是MCPServerManager取得工具(默认collection)")
+    parser.add_argument("--iterations", type=int, default=200, help="串行往返测试的调用次数(默认200)")
+    parser.add_argument("--startup-runs", type=int, default=5, help="启动测试的次数(默认5)")
+    parser.add_argument("--startup-delay", type=float, default=0,
+                        help="启动测试中替身服务启动前等待的秒数，模拟真实服务的启动耗时(默认0)")
+    parser.add_argument("--payload-sizes", default="1000,20000,200000", help="fetch返回大小，逗号分隔")
+    parser.add_argument("--latency-ms", type=float, default=50, help="吞吐测试中服务端的延迟(默认50ms)")
+    parser.add_argument("--concurrency", default="1,4,16", help="吞吐测试的并发数，逗号分隔")
+    parser.add_argument("--calls", type=int, default=100, help="每个并发数下的调用次数(默认100)")
+    parser.add_argument("--skip", default="", help="跳过的测试，逗号分隔(startup,latency,throughput)")
+    parser.add_argument("--json", dest="json_path", help="结果另存为JSON文件")
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    skip = set(filter(None, args.skip.split(",")))
+    report: Dict[str, Any] = {"client": args.client, "python": sys.version.split()[0]}
+    if "startup" not in skip:
+        print("测量启动耗时...", flush=True)
+        report["startup"] = bench_startup(args.startup_runs, startup_delay=args.startup_delay)
+    if "latency" not in skip:
+        print("测量往返耗时...", flush=True)
+        report["latency"] = bench_latency(args.client, args.iterations,
+                                          [int(size) for size in args.payload_sizes.split(",")])
+    if "throughput" not in skip:
+        print("测量并发吞吐...", flush=True)
+        report["throughput"] = bench_throughput(args.client, args.latency_ms,
+                                                [int(level) for level in args.concurrency.split(",")], args.calls)
+
+    for section in ("startup", "latency", "throughput"):
+        if section not in report:
+            continue
+        print(f"\n== {section} ==")
+        for name, values in report[section].items():
+            print(f"{name:<28}" + "  ".join(f"{key}={value}" for key, value in values.items()))
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\n结果已写入{args.json_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,299 @@
+"""
+共享的MCP服务管理器
+
+原来每个脚本/模板都用嵌套的ToolCollection.from_mcp逐个启动自己的stdio MCP服务，
+即使其中的工具并没有交给智能体使用，每次启动都要额外花几秒。MCPServerManager改为:
+
+- 服务只登记参数，第一次通过tools()/start()取用时才启动；同时请求的多个服务并发启动
+- 服务在后台事件循环中常驻，多个智能体、多次run(以及worker中的多个任务)共用同一个子进程
+- 定期ping做健康检查；服务退出或ping失败时自动重启(指数退避)，工具对象保持不变
+- tools()返回smolagents的ToolCollection，可以直接把.tools交给智能体
+
+用法:
+    mcp_servers = shared_manager()          # 进程内共享，登记了fetch、time(以及配置了密钥时的baidu_maps)
+    tools = mcp_servers.tools("fetch", "time")
+    agent = CodeAgent(tools=[*tools.tools], model=model)
+"""
+import asyncio
+import atexit
+import concurrent.futures
+import os
+import sys
+import threading
+import time
+from typing import Dict, Optional, Any, List
+
+from mcp import ClientSession, StdioServerParameters
+from mcp.client.stdio import stdio_client
+from smolagents import ToolCollection
+
+# 健康检查的间隔秒数
+HEALTH_INTERVAL = float(os.getenv("AGENT_MCP_HEALTH_INTERVAL", "30"))
+# 重启的最长退避秒数
+MAX_RESTART_DELAY = 30
+
+
+class MCPServerError(RuntimeError):
+    """MCP服务无法启动"""
+
+
+class _Server:
+    """一个登记的MCP服务及其运行状态"""
+
+    def __init__(self, name: str, parameters: StdioServerParameters):
+        self.name = name
+        self.parameters = parameters
+        self.session: Optional[ClientSession] = None
+        self.tools: Optional[List[Any]] = None
+        self.ready: Optional[concurrent.futures.Future] = None  # 第一次启动的结果
+        self.task: Optional[concurrent.futures.Future] = None
+        self.up: Optional[asyncio.Event] = None      # 会话可用
+        self.check: Optional[asyncio.Event] = None   # 要求立即健康检查(或关闭)
+        self.restarts = 0
+        self.started_at: Optional[float] = None
+        self.last_error: Optional[str] = None
+
+
+class MCPServerManager:
+    """
+    按需启动、常驻并自动重启的MCP服务池
+
+    属性:
+        health_interval: 健康检查的间隔秒数
+        start_timeout: 等待服务启动的秒数
+        call_timeout: 单次工具调用的超时秒数
+    """
+
+    def __init__(self, servers: Optional[Dict[str, StdioServerParameters]] = None,
+                 health_interval: float = HEALTH_INTERVAL, start_timeout: float = 60,
+                 call_timeout: float = 300):
+        """
+        参数:
+            servers: 服务名称到启动参数的映射，也可以之后用add()登记
+            health_interval: 健康检查的间隔秒数
+            start_timeout: 等待服务启动的秒数
+            call_timeout: 单次工具调用的超时秒数
+        """
+        self.health_interval = health_interval
+        self.start_timeout = start_timeout
+        self.call_timeout = call_timeout
+        self._servers: Dict[str, _Server] = {}
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._closed = False
+        for name, parameters in (servers or {}).items():
+            self.add(name, parameters)
+
+    def add(self, name: str, parameters: StdioServerParameters) -> None:
+        """登记服务(不启动)；同名服务已经启动时保持不变"""
+        with self._lock:
+            current = self._servers.get(name)
+            if current is None or current.ready is None:
+                self._servers[name] = _Server(name, parameters)
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        if self._loop is None:
+            self._loop = asyncio.new_event_loop()
+            self._thread = threading.Thread(target=self._loop.run_forever, name="mcp-manager", daemon=True)
+            self._thread.start()
+        return self._loop
+
+    def start(self, *names: str) -> None:
+        """
+        并发启动指定的服务(默认全部)并等待就绪，已经在运行的服务直接返回
+
+        异常:
+            KeyError: 服务没有登记
+            MCPServerError: 服务启动失败或超时(下次调用时会重新尝试启动)
+        """
+        with self._lock:
+            if self._closed:
+                raise MCPServerError("MCP服务管理器已关闭")
+            loop = self._ensure_loop()
+            servers = []
+            for name in names or tuple(self._servers):
+                if name not in self._servers:
+                    raise KeyError(f"未登记的MCP服务: {name}")
+                server = self._servers[name]
+                if server.ready is None:
+                    server.ready = concurrent.futures.Future()
+                    server.task = asyncio.run_coroutine_threadsafe(self._serve(server), loop)
+                servers.append(server)
+
+        for server in servers:
+            ready = server.ready
+            try:
+                ready.result(timeout=self.start_timeout)
+            except Exception as e:
+                with self._lock:
+                    if server.ready is ready and ready.done():
+                        server.ready = None
+                raise MCPServerError(f"MCP服务{server.name}启动失败: {e}") from e
+
+    def tools(self, *names: str) -> ToolCollection:
+        """
+        返回指定服务(默认全部)的工具，需要时先并发启动这些服务
+
+        返回的工具在服务重启后仍然可用，不需要重新获取
+        """
+        names = names or tuple(self._servers)
+        self.start(*names)
+        return ToolCollection([tool for name in names for tool in self._servers[name].tools])
+
+    def status(self) -> Dict[str, Dict[str, Any]]:
+        """各服务的运行状态"""
+        return {
+            name: {
+                "started": server.ready is not None,
+                "up": server.session is not None,
+                "restarts": server.restarts,
+                "started_at": server.started_at,
+                "tools": len(server.tools or []),
+                "last_error": server.last_error,
+            }
+            for name, server in self._servers.items()
+        }
+
+    def restart(self, name: str) -> None:
+        """让正在运行的服务立即做一次健康检查，检查失败时重启"""
+        server = self._servers[name]
+        if self._loop is not None and server.check is not None:
+            self._loop.call_soon_threadsafe(server.check.set)
+
+    async def _serve(self, server: _Server) -> None:
+        """在后台事件循环中持有服务的会话，断开后按退避时间重启"""
+        server.up = asyncio.Event()
+        server.check = asyncio.Event()
+        failures = 0
+        while not self._closed:
+            try:
+                async with stdio_client(server.parameters) as (read, write):
+                    async with ClientSession(read, write) as session:
+                        await session.initialize()
+                        listed = await session.list_tools()
+                        if server.tools is None:
+                            server.tools = [self._adapt(server, tool) for tool in listed.tools]
+                        server.session = session
+                        server.started_at = time.time()
+                        failures = 0
+                        server.up.set()
+                        if not server.ready.done():
+                            server.ready.set_result(None)
+                        await self._watch(server, session)
+            except Exception as e:
+                server.last_error = f"{type(e).__name__}: {e}"
+                if not server.ready.done():
+                    server.ready.set_exception(e)
+                    return
+            finally:
+                server.up.clear()
+                server.session = None
+            if self._closed:
+                return
+            failures += 1
+            server.restarts += 1
+            delay = min(2 ** failures, MAX_RESTART_DELAY)
+            print(f"MCP服务{server.name}已断开({server.last_error})，{delay}秒后重启", file=sys.stderr)
+            await asyncio.sleep(delay)
+
+    async def _watch(self, server: _Server, session: ClientSession) -> None:
+        """定期ping服务，失败时抛出异常以触发重启；管理器关闭时正常返回"""
+        while not self._closed:
+            try:
+                await asyncio.wait_for(server.check.wait(), self.health_interval)
+            except asyncio.TimeoutError:
+                pass
+            server.check.clear()
+            if self._closed:
+                return
+            await asyncio.wait_for(session.send_ping(), 10)
+
+    async def _call(self, server: _Server, tool_name: str, arguments: Optional[dict]):
+        await asyncio.wait_for(server.up.wait(), self.start_timeout)
+        try:
+            return await asyncio.wait_for(server.session.call_tool(tool_name, arguments), self.call_timeout)
+        except Exception:
+            # 调用失败可能是服务已经退出，立即做一次健康检查
+            server.check.set()
+            raise
+
+    def _adapt(self, server: _Server, mcp_tool) -> Any:
+        """把MCP工具转换成smolagents工具，调用时使用服务当前的会话"""
+        from mcpadapt.smolagents_adapter import SmolAgentsAdapter
+
+        def call(arguments: Optional[dict]):
+            future = asyncio.run_coroutine_threadsafe(self._call(server, mcp_tool.name, arguments), self._loop)
+            return future.result()
+
+        return SmolAgentsAdapter().adapt(call, mcp_tool)
+
+    def close(self) -> None:
+        """关闭全部服务和后台事件循环"""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            servers = list(self._servers.values())
+        if self._loop is None:
+            return
+        for server in servers:
+            if server.check is not None:
+                self._loop.call_soon_threadsafe(server.check.set)
+        for server in servers:
+            if server.task is None:
+                continue
+            try:
+                server.task.result(timeout=5)
+            except Exception:
+                server.task.cancel()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout=5)
+
+    def __enter__(self) -> "MCPServerManager":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.close()
+
+
+def default_servers(proxy: Optional[str] = None) -> Dict[str, StdioServerParameters]:
+    """
+    默认登记的服务：带缓存的fetch、time(Asia/Shanghai)，设置了BAIDU_MAPS_API_KEY时还有baidu_maps
+
+    参数:
+        proxy: HTTP代理地址，默认为环境变量PROXY
+    """
+    from agent_runtime.web_tools import fetch_server_parameters
+
+    proxy = os.environ.get("PROXY") if proxy is None else proxy
+    proxy_env = {"HTTP_PROXY": proxy, "HTTPS_PROXY": proxy} if proxy else {}
+    servers = {
+        "fetch": fetch_server_parameters(proxy),
+        "time": StdioServerParameters(
+            command=sys.executable,
+            args=["-m", "mcp_server_time", "--local-timezone", "Asia/Shanghai"],
+            env=proxy_env,
+        ),
+    }
+    if os.environ.get("BAIDU_MAPS_API_KEY"):
+        servers["baidu_maps"] = StdioServerParameters(
+            command=sys.executable,
+            args=["-m", "mcp_server_baidu_maps"],
+            env={"BAIDU_MAPS_API_KEY": os.environ["BAIDU_MAPS_API_KEY"], **proxy_env},
+        )
+    return servers
+
+
+_shared: Optional[MCPServerManager] = None
+_shared_lock = threading.Lock()
+
+
+def shared_manager() -> MCPServerManager:
+    """进程内共享的管理器，登记了default_servers()，进程退出时关闭"""
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = MCPServerManager(default_servers())
+            atexit.register(_shared.close)
+        return _shared
@@ -0,0 +1,162 @@
+"""
+智能体记忆的有界导出
+
+模板原来在运行结束时逐条打印agent.memory.steps中的全部消息，长任务会产生几MB的输出，
+全部经过exec传回宿主机并解码。这里改为:
+
+- 标准输出只打印一段简短的摘要(步数、耗时、token用量、调用过的工具、错误)
+- 需要完整记录时(环境变量AGENT_MEMORY_EXPORT=1，宿主机上对应SANDBOX_MEMORY_EXPORT=1)，
+  把每一步写成一行JSON，gzip压缩后保存到/app/output/agent_memory.jsonl.gz。
+  每条消息和观察结果单独截断，写入的总量有上限，超过后只记录被省略的步数
+"""
+import gzip
+import json
+import os
+from typing import Any, Dict, List, Optional
+
+EXPORT_ENABLED = os.getenv("AGENT_MEMORY_EXPORT", "0") == "1"
+EXPORT_PATH = os.getenv("AGENT_MEMORY_EXPORT_PATH", "/app/output/agent_memory.jsonl.gz")
+# 每条消息/观察结果保留的最大字符数
+MAX_FIELD_CHARS = 4000
+# 写入文件的未压缩内容上限
+MAX_EXPORT_BYTES = 4 * 1024 * 1024
+
+
+def _truncate(text: Any, limit: int) -> Optional[str]:
+    if text is None:
+        return None
+    text = str(text)
+    if len(text) <= limit:
+        return text
+    return text[:limit] + f"...[省略{len(text) - limit}字符]"
+
+
+def _message_text(content: Any) -> str:
+    """消息内容可能是字符串或[{"type": "text", "text": ...}]形式的列表"""
+    if isinstance(content, list):
+        return "\n".join(str(part.get("text", "")) if isinstance(part, dict) else str(part) for part in content)
+    return "" if content is None else str(content)
+
+
+def _message(message: Any, limit: int) -> Dict[str, Any]:
+    if isinstance(message, dict):
+        role, content = message.get("role"), message.get("content")
+    else:
+        role, content = getattr(message, "role", None), getattr(message, "content", message)
+    return {"role": str(getattr(role, "value", role)), "content": _truncate(_message_text(content), limit)}
+
+
+def step_tokens(step: Any):
+    """返回步骤的(输入token, 输出token)，兼容新旧版本smolagents的字段"""
+    usage = getattr(step, "token_usage", None)
+    if usage is not None:
+        return getattr(usage, "input_tokens", None), getattr(usage, "output_tokens", None)
+    return getattr(step, "input_token_count", None), getattr(step, "output_token_count", None)
+
+
+def step_duration(step: Any) -> Optional[float]:
+    """返回步骤耗时(秒)"""
+    timing = getattr(step, "timing", None)
+    duration = getattr(timing, "duration", None) if timing is not None else getattr(step, "duration", None)
+    return round(duration, 3) if isinstance(duration, (int, float)) else None
+
+
+def step_tool_names(step: Any) -> List[str]:
+    """返回步骤中调用的工具名称"""
+    return [getattr(call, "name", str(call)) for call in getattr(step, "tool_calls", None) or []]
+
+
+def step_record(index: int, step: Any, limit: int = MAX_FIELD_CHARS) -> Dict[str, Any]:
+    """把一个记忆步骤转换成可序列化的字典，长文本按limit截断"""
+    input_tokens, output_tokens = step_tokens(step)
+    error = getattr(step, "error", None)
+    try:
+        messages = [_message(message, limit) for message in step.to_messages()]
+    except Exception as e:
+        messages = [{"role": "error", "content": f"to_messages失败: {e}"}]
+    return {
+        "index": index,
+        "type": type(step).__name__,
+        "step_number": getattr(step, "step_number", None),
+        "duration": step_duration(step),
+        "input_tokens": input_tokens,
+        "output_tokens": output_tokens,
+        "tool_calls": step_tool_names(step),
+        "error": _truncate(error, limit),
+        "observations": _truncate(getattr(step, "observations", None), limit),
+        "messages": messages,
+    }
+
+
+def export_memory(agent: Any, path: str = EXPORT_PATH, max_field_chars: int = MAX_FIELD_CHARS,
+                  max_bytes: int = MAX_EXPORT_BYTES) -> Dict[str, Any]:
+    """
+    把agent.memory.steps写成gzip压缩的JSONL文件
+
+    参数:
+        agent: smolagents智能体
+        path: 输出文件路径
+        max_field_chars: 每条消息/观察结果保留的最大字符数
+        max_bytes: 写入的未压缩内容上限，超过后剩余步骤只记录数量
+
+    返回:
+        {"path", "steps", "written_steps", "bytes", "compressed_bytes"}
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    steps = list(agent.memory.steps)
+    written = 0
+    total = 0
+    with gzip.open(path, "wt", encoding="utf-8") as f:
+        for index, step in enumerate(steps):
+            line = json.dumps(step_record(index, step, max_field_chars), ensure_ascii=False) + "\n"
+            if total + len(line.encode("utf-8")) > max_bytes:
+                f.write(json.dumps({"truncated": True, "omitted_steps": len(steps) - index}) + "\n")
+                break
+            f.write(line)
+            total += len(line.encode("utf-8"))
+            written += 1
+    return {"path": path, "steps": len(steps), "written_steps": written, "bytes": total,
+            "compressed_bytes": os.path.getsize(path)}
+
+
+def summarize_memory(agent: Any) -> str:
+    """生成记忆的简短摘要：步数、耗时、token用量、工具调用次数和错误"""
+    steps = list(agent.memory.steps)
+    duration = 0.0
+    input_tokens = output_tokens = 0
+    tools: Dict[str, int] = {}
+    errors = []
+    for index, step in enumerate(steps):
+        duration += step_duration(step) or 0
+        step_in, step_out = step_tokens(step)
+        input_tokens += step_in or 0
+        output_tokens += step_out or 0
+        for name in step_tool_names(step):
+            tools[name] = tools.get(name, 0) + 1
+        if getattr(step, "error", None) is not None:
+            errors.append(f"  步骤{getattr(step, 'step_number', index)}: {_truncate(step.error, 200)}")
+    lines = [
+        f"步数: {len(steps)}  耗时: {duration:.1f}s  输入token: {input_tokens}  输出token: {output_tokens}",
+        "工具调用: " + (", ".join(f"{name}×{count}" for name, count in sorted(tools.items())) or "无"),
+    ]
+    if errors:
+        lines.append(f"错误({len(errors)}):")
+        lines.extend(errors[-5:])
+    return "\n".join(lines)
+
+
+def report_memory(agent: Any, export: Optional[bool] = None, path: str = EXPORT_PATH) -> None:
+    """
+    打印记忆摘要，export(默认取AGENT_MEMORY_EXPORT)为真时同时导出完整记录
+
+    用在代码模板的末尾，替代逐条打印全部消息
+    """
+    print("==============memory==================")
+    print(summarize_memory(agent))
+    if EXPORT_ENABLED if export is None else export:
+        try:
+            result = export_memory(agent, path)
+            print(f"完整记录已写入{result['path']} ({result['written_steps']}/{result['steps']}步, "
+                  f"压缩后{result['compressed_bytes']}字节)")
+        except Exception as e:
+            print(f"导出记忆失败: {e}")
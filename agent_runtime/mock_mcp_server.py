@@ -0,0 +1,118 @@
+"""
+用于性能测试的本地MCP替身服务
+
+提供与mcp_server_fetch、mcp_server_time、mcp_server_baidu_maps同名同参数的工具，
+但不访问网络：每次调用等待设定的延迟后返回指定大小的确定性内容。
+配合agent_runtime.mcp_benchmark可以在离线环境中重复测量MCP集成本身的开销。
+
+用法:
+    python -m agent_runtime.mock_mcp_server --latency-ms 50 --payload-bytes 20000
+
+参数也可以通过环境变量设置(命令行优先):
+    MOCK_MCP_LATENCY_MS      每次工具调用的延迟(毫秒)
+    MOCK_MCP_JITTER_MS       延迟的随机抖动上限(毫秒)
+    MOCK_MCP_PAYLOAD_BYTES   fetch返回的内容大小(字节)
+    MOCK_MCP_STARTUP_DELAY   启动前的等待秒数，模拟真实服务导入依赖的耗时
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import random
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from mcp.server.fastmcp import FastMCP
+
+# 拼接fetch返回内容用的中英文片段
+_TEXT = ("The quick brown fox jumps over the lazy dog. 敏捷的棕色狐狸跳过了懒狗。"
+         "Markets moved sharply today as investors weighed new data. 今日市场因新的数据而大幅波动。\n")
+
+
+def build_server(latency_ms: float = 0, jitter_ms: float = 0, payload_bytes: int = 5000) -> FastMCP:
+    """
+    创建替身服务
+
+    参数:
+        latency_ms: 每次工具调用的延迟(毫秒)
+        jitter_ms: 延迟的随机抖动上限(毫秒)
+        payload_bytes: fetch返回内容的大小(字节，按UTF-8计)
+    """
+    app = FastMCP("mock-mcp", log_level="WARNING")
+
+    async def delay() -> None:
+        seconds = (latency_ms + random.uniform(0, jitter_ms)) / 1000
+        if seconds > 0:
+            await asyncio.sleep(seconds)
+
+    def payload(seed: str, size: int) -> str:
+        # 内容由URL决定，同一URL每次返回相同的文本
+        offset = int(hashlib.md5(seed.encode("utf-8")).hexdigest(), 16) % len(_TEXT)
+        data = (_TEXT[offset:] + _TEXT * (size // len(_TEXT.encode("utf-8")) + 2)).encode("utf-8")[:size]
+        return data.decode("utf-8", errors="ignore")
+
+    @app.tool()
+    async def fetch(url: str, max_length: int = 5000, start_index: int = 0, raw: bool = False) -> str:
+        """Fetches a URL from the internet and optionally extracts its contents as markdown."""
+        await delay()
+        content = payload(url, payload_bytes)
+        return f"Contents of {url}:\n{content[start_index:start_index + max_length]}"
+
+    @app.tool()
+    async def get_current_time(timezone: str) -> str:
+        """Get current time in a specific timezone"""
+        await delay()
+        now = datetime.now(dt_timezone(timedelta(hours=8)))
+        return json.dumps({"timezone": timezone, "datetime": now.isoformat(timespec="seconds"),
+                           "is_dst": False})
+
+    @app.tool()
+    async def convert_time(source_timezone: str, time: str, target_timezone: str) -> str:
+        """Convert time between timezones"""
+        await delay()
+        return json.dumps({"source": {"timezone": source_timezone, "time": time},
+                           "target": {"timezone": target_timezone, "time": time}})
+
+    @app.tool()
+    async def map_geocode(address: str) -> str:
+        """Convert an address into latitude and longitude"""
+        await delay()
+        digest = int(hashlib.md5(address.encode("utf-8")).hexdigest(), 16)
+        return json.dumps({"address": address, "location": {"lat": 23 + digest % 1000 / 1000,
+                                                             "lng": 113 + digest // 1000 % 1000 / 1000}},
+                          ensure_ascii=False)
+
+    @app.tool()
+    async def map_search_places(query: str, region: str = "广州") -> str:
+        """Search places of interest in a region"""
+        await delay()
+        return json.dumps({"results": [{"name": f"{region}{query}{i}", "address": f"{region}某路{i}号"}
+                                       for i in range(10)]}, ensure_ascii=False)
+
+    @app.tool()
+    async def map_directions(origin: str, destination: str, mode: str = "transit") -> str:
+        """Plan a route between two places"""
+        await delay()
+        steps = [{"instruction": f"第{i + 1}段: 从{origin}乘坐{mode}前往{destination}", "duration": 300 * (i + 1)}
+                 for i in range(5)]
+        return json.dumps({"origin": origin, "destination": destination, "mode": mode, "steps": steps},
+                          ensure_ascii=False)
+
+    return app
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="用于性能测试的本地MCP替身服务(stdio)")
+    parser.add_argument("--latency-ms", type=float, default=float(os.getenv("MOCK_MCP_LATENCY_MS", "0")))
+    parser.add_argument("--jitter-ms", type=float, default=float(os.getenv("MOCK_MCP_JITTER_MS", "0")))
+    parser.add_argument("--payload-bytes", type=int, default=int(os.getenv("MOCK_MCP_PAYLOAD_BYTES", "5000")))
+    parser.add_argument("--startup-delay", type=float, default=float(os.getenv("MOCK_MCP_STARTUP_DELAY", "0")))
+    args = parser.parse_args()
+    if args.startup_delay > 0:
+        time.sleep(args.startup_delay)
+    build_server(args.latency_ms, args.jitter_ms, args.payload_bytes).run()
+
+
+if __name__ == "__main__":
+    main()
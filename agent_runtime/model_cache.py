@@ -0,0 +1,295 @@
+"""
+模型调用的录制/回放缓存
+
+CachedModel包装任意smolagents模型(OpenAIServerModel、LiteLLMModel等)。缓存键是下面这些内容的哈希:
+模型名称、生成参数、消息、停止序列、输出格式和工具schema。模型响应保存在本地SQLite文件中:
+
+- record: 命中时直接返回缓存的响应，未命中时调用模型并写入缓存
+- replay: 只使用缓存，未命中时抛出ModelCacheMiss，不访问模型接口(调试时可以完全确定地重放一次运行)
+- passthrough: 不读也不写缓存，与未包装时相同
+
+条目数超过上限时淘汰最久未用的条目(LRU)。多个进程和沙盒容器可以共用同一个缓存文件。
+设置AGENT_MODEL_CACHE时，agent_runtime.models.create_model自动包装创建的模型:
+
+    AGENT_MODEL_CACHE              record | replay | passthrough
+    AGENT_MODEL_CACHE_PATH         缓存文件，默认<SANDBOX_CACHE_DIR>/model/responses.sqlite(~/.cache/py-sandbox)
+    AGENT_MODEL_CACHE_MAX_ENTRIES  条目数上限，默认20000
+
+维护:
+    python -m agent_runtime.model_cache stats
+    python -m agent_runtime.model_cache clear
+"""
+import argparse
+import dataclasses
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from enum import Enum
+from typing import Optional, Dict, Any, List
+
+from smolagents import Model
+from smolagents.models import ChatMessage
+
+from agent_runtime.models import assistant_message
+
+MODES = ("record", "replay", "passthrough")
+# 与docker-sandbox的缓存根目录(SANDBOX_CACHE_DIR)一致，沙盒容器挂载的是同一个目录
+CACHE_ROOT = os.getenv("SANDBOX_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "py-sandbox"))
+DEFAULT_PATH = os.path.join(CACHE_ROOT, "model", "responses.sqlite")
+DEFAULT_MAX_ENTRIES = 20000
+# 缓存格式版本，键或响应格式变化时旧条目自动失效
+_FORMAT_VERSION = 1
+
+
+class ModelCacheMiss(LookupError):
+    """replay模式下请求的响应不在缓存中"""
+
+
+def _default(value: Any) -> Any:
+    """把消息和参数中json无法直接处理的对象转换成确定的值"""
+    if isinstance(value, Enum):
+        return value.value
+    if dataclasses.is_dataclass(value) and not isinstance(value, type):
+        return dataclasses.asdict(value)
+    if isinstance(value, (bytes, bytearray)):
+        return hashlib.sha256(value).hexdigest()
+    if hasattr(value, "tobytes"):  # PIL图片等
+        return hashlib.sha256(value.tobytes()).hexdigest()
+    return str(value)
+
+
+def _message_dict(message: Any) -> Any:
+    if isinstance(message, ChatMessage):
+        data = message.dict() if hasattr(message, "dict") else dataclasses.asdict(message)
+    elif isinstance(message, dict):
+        data = dict(message)
+    else:
+        return message
+    # raw和token_usage每次调用都不同，不参与缓存键
+    data.pop("raw", None)
+    data.pop("token_usage", None)
+    return data
+
+
+def _tool_schema(tool: Any) -> Dict[str, Any]:
+    try:
+        from smolagents.models import get_tool_json_schema
+        return get_tool_json_schema(tool)
+    except ImportError:
+        return {"name": tool.name, "description": tool.description, "inputs": tool.inputs,
+                "output_type": tool.output_type}
+
+
+def request_key(model_id: Optional[str], messages: List[Any], stop_sequences: Optional[List[str]] = None,
+                response_format: Optional[Dict[str, Any]] = None, tools_to_call_from: Optional[List[Any]] = None,
+                **kwargs) -> str:
+    """计算一次模型调用的缓存键"""
+    payload = {
+        "version": _FORMAT_VERSION,
+        "model_id": model_id,
+        "messages": [_message_dict(m) for m in messages],
+        "stop_sequences": stop_sequences,
+        "response_format": response_format,
+        "tools": [_tool_schema(tool) for tool in tools_to_call_from or []],
+        "kwargs": kwargs,
+    }
+    text = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=_default)
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _response_dict(message: ChatMessage, input_tokens: int, output_tokens: int) -> Dict[str, Any]:
+    tool_calls = []
+    for call in message.tool_calls or []:
+        function = call.function
+        tool_calls.append({"id": call.id, "name": function.name, "arguments": function.arguments})
+    return {"content": message.content, "tool_calls": tool_calls,
+            "input_tokens": input_tokens, "output_tokens": output_tokens}
+
+
+def _token_counts(model: Any, message: ChatMessage):
+    usage = getattr(message, "token_usage", None)
+    if usage is not None:
+        return usage.input_tokens, usage.output_tokens
+    # 旧版本smolagents把token用量记在模型上
+    return getattr(model, "last_input_token_count", 0) or 0, getattr(model, "last_output_token_count", 0) or 0
+
+
+class ResponseStore:
+    """
+    SQLite中的模型响应存储，按最近使用时间淘汰
+
+    属性:
+        path: 缓存文件路径
+        max_entries: 条目数上限
+    """
+
+    def __init__(self, path: Optional[str] = None, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.path = os.path.abspath(path or DEFAULT_PATH)
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        created = not os.path.exists(self.path)
+        self._db = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                model_id TEXT,
+                response TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_used REAL NOT NULL,
+                hits INTEGER NOT NULL DEFAULT 0
+            )""")
+        self._db.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)")
+        if created:
+            try:
+                # 沙盒容器中以nobody用户读写主机上创建的缓存文件
+                os.chmod(self.path, 0o666)
+            except OSError:
+                pass
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """读取响应并更新最近使用时间，不存在时返回None"""
+        with self._lock:
+            row = self._db.execute("SELECT response FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            self._db.execute("UPDATE responses SET last_used = ?, hits = hits + 1 WHERE key = ?",
+                             (time.time(), key))
+        return json.loads(row[0])
+
+    def put(self, key: str, model_id: Optional[str], response: Dict[str, Any]) -> None:
+        """写入响应，然后淘汰超出上限的最久未用条目"""
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses (key, model_id, response, created_at, last_used) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, model_id, json.dumps(response, ensure_ascii=False), now, now))
+            self._db.execute(
+                "DELETE FROM responses WHERE key IN "
+                "(SELECT key FROM responses ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,))
+
+    def stats(self) -> Dict[str, Any]:
+        """条目数、累计命中次数和各模型的条目数"""
+        with self._lock:
+            entries, hits = self._db.execute("SELECT COUNT(*), COALESCE(SUM(hits), 0) FROM responses").fetchone()
+            models = dict(self._db.execute(
+                "SELECT COALESCE(model_id, ''), COUNT(*) FROM responses GROUP BY model_id").fetchall())
+        return {"path": self.path, "entries": entries, "hits": hits, "models": models}
+
+    def clear(self) -> None:
+        """删除所有条目"""
+        with self._lock:
+            self._db.execute("DELETE FROM responses")
+            self._db.execute("VACUUM")
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+
+class CachedModel(Model):
+    """
+    带录制/回放缓存的模型包装
+
+    属性:
+        model: 被包装的模型
+        mode: record、replay或passthrough，可以在运行中修改
+        store: 响应存储
+        hits: 本实例的缓存命中次数
+        misses: 本实例的未命中次数(record模式下即实际调用模型的次数)
+    """
+
+    def __init__(self, model: Model, mode: str = "record", path: Optional[str] = None,
+                 max_entries: int = DEFAULT_MAX_ENTRIES, store: Optional[ResponseStore] = None):
+        """
+        参数:
+            model: 被包装的模型
+            mode: record、replay或passthrough
+            path: 缓存文件路径，默认为DEFAULT_PATH
+            max_entries: 条目数上限
+            store: 可选的共享存储，设置后忽略path和max_entries
+        """
+        if mode not in MODES:
+            raise ValueError(f"未知的模型缓存模式: {mode}，可选: {', '.join(MODES)}")
+        super().__init__(model_id=model.model_id)
+        self.model = model
+        self.mode = mode
+        self.store = store or ResponseStore(path, max_entries)
+        self.hits = 0
+        self.misses = 0
+        # parse_tool_calls等基类方法使用这些设置
+        for name in ("flatten_messages_as_text", "tool_name_key", "tool_arguments_key"):
+            if hasattr(model, name):
+                setattr(self, name, getattr(model, name))
+
+    def __getattr__(self, name: str) -> Any:
+        # 只在本对象上找不到属性时调用，其余属性(api_base、client等)取自被包装的模型
+        if name == "model":
+            raise AttributeError(name)
+        return getattr(self.model, name)
+
+    def generate(self, messages: List[Any], stop_sequences: Optional[List[str]] = None,
+                 response_format: Optional[Dict[str, str]] = None, tools_to_call_from: Optional[List[Any]] = None,
+                 **kwargs) -> ChatMessage:
+        if self.mode == "passthrough":
+            return self._generate(messages, stop_sequences, response_format, tools_to_call_from, **kwargs)
+
+        key = request_key(self.model_id, messages, stop_sequences, response_format, tools_to_call_from,
+                          model_kwargs=getattr(self.model, "kwargs", None), **kwargs)
+        cached = self.store.get(key)
+        if cached is not None:
+            self.hits += 1
+            self.last_input_token_count = cached["input_tokens"]
+            self.last_output_token_count = cached["output_tokens"]
+            return assistant_message(cached["content"], cached["tool_calls"],
+                                     cached["input_tokens"], cached["output_tokens"])
+        self.misses += 1
+        if self.mode == "replay":
+            raise ModelCacheMiss(f"模型缓存中没有这次调用的响应(键{key[:12]})，"
+                                 f"请先用AGENT_MODEL_CACHE=record录制")
+
+        message = self._generate(messages, stop_sequences, response_format, tools_to_call_from, **kwargs)
+        input_tokens, output_tokens = _token_counts(self.model, message)
+        self.store.put(key, self.model_id, _response_dict(message, input_tokens, output_tokens))
+        return message
+
+    def _generate(self, messages, stop_sequences, response_format, tools_to_call_from, **kwargs) -> ChatMessage:
+        message = self.model.generate(messages, stop_sequences=stop_sequences, response_format=response_format,
+                                      tools_to_call_from=tools_to_call_from, **kwargs)
+        self.last_input_token_count, self.last_output_token_count = _token_counts(self.model, message)
+        return message
+
+    def __call__(self, *args, **kwargs) -> ChatMessage:
+        return self.generate(*args, **kwargs)
+
+
+def wrap_from_env(model: Model) -> Model:
+    """按AGENT_MODEL_CACHE等环境变量包装模型，未设置时原样返回"""
+    mode = os.getenv("AGENT_MODEL_CACHE")
+    if not mode:
+        return model
+    return CachedModel(model, mode, path=os.getenv("AGENT_MODEL_CACHE_PATH"),
+                       max_entries=int(os.getenv("AGENT_MODEL_CACHE_MAX_ENTRIES", str(DEFAULT_MAX_ENTRIES))))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="查看或清空模型调用缓存")
+    parser.add_argument("command", choices=["stats", "clear"])
+    parser.add_argument("--path", default=os.getenv("AGENT_MODEL_CACHE_PATH"), help="缓存文件，默认为DEFAULT_PATH")
+    args = parser.parse_args()
+    store = ResponseStore(args.path)
+    if args.command == "clear":
+        store.clear()
+        print(f"已清空{store.path}")
+    else:
+        print(json.dumps(store.stats(), ensure_ascii=False, indent=2))
+    store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,375 @@
+"""
+共享的模型调用网关
+
+每个智能体脚本和每个沙盒任务原来各自创建模型客户端，直接请求https://openrouter.ai/api/v1，
+并发任务之间没有任何协调：突发请求触发429后，各个客户端同时重试，吞吐被重试风暴拖垮。
+这个网关是一个OpenAI兼容的HTTP转发服务，主机上的脚本和沙盒容器都把模型请求发给它:
+
+- 到上游的连接使用keep-alive连接池复用
+- 令牌桶限制发往上游的请求速率(包括重试)，另外限制同时进行的上游请求数
+- 上游返回429/5xx或连接失败时按带随机抖动的指数退避重试，优先遵守Retry-After；
+  429同时让令牌桶暂停，所有请求一起退让，而不是各自立即重试
+- 内容完全相同的并发请求(非流式)合并为一次上游调用，结果分发给所有等待的请求
+
+启动(在主机上):
+    python -m agent_runtime.model_gateway --port 8765 --rate 2 --burst 4 --concurrency 8
+
+客户端通过环境变量使用(见agent_runtime.models.create_model):
+    AGENT_MODEL_GATEWAY=http://127.0.0.1:8765                      # 主机上的脚本
+    AGENT_MODEL_GATEWAY_IN_DOCKER=http://host.docker.internal:8765 # 由dockersandbox传入容器
+
+网关把请求路径拼接到上游地址之后转发(POST /chat/completions -> <upstream>/chat/completions)，
+Authorization等请求头原样转发；请求没有带Authorization时使用网关进程的OPENAI_TOKEN。
+GET /gateway/stats返回JSON格式的统计。
+"""
+import argparse
+import hashlib
+import json
+import os
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional, Dict, Any, Tuple, Iterator
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from agent_runtime.models import OPENROUTER_API_BASE
+
+# 可以重试的上游状态码
+RETRY_STATUS = {429, 500, 502, 503, 504}
+# 转发给上游的请求头
+FORWARD_HEADERS = ("Authorization", "Content-Type", "Accept", "HTTP-Referer", "X-Title", "User-Agent")
+# 不转发给客户端的响应头(由网关重新生成)
+HOP_HEADERS = {"connection", "keep-alive", "transfer-encoding", "content-length", "content-encoding"}
+
+
+class TokenBucket:
+    """
+    线程安全的令牌桶
+
+    属性:
+        rate: 每秒补充的令牌数，0表示不限速
+        burst: 桶的容量，即允许的突发请求数
+    """
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self) -> float:
+        """取得一个令牌，必要时等待，返回等待的秒数"""
+        if self.rate <= 0 and not self._paused_until:
+            return 0.0
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    delay = self._paused_until - now
+                elif self.rate <= 0:
+                    return waited
+                else:
+                    self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                    self._updated = now
+                    if self._tokens >= 1:
+                        self._tokens -= 1
+                        return waited
+                    delay = (1 - self._tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+    def pause(self, seconds: float) -> None:
+        """在接下来的seconds秒内不发放令牌(上游限流时所有请求一起退让)"""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self._tokens = 0.0
+            self._updated = time.monotonic()
+
+
+class _Call:
+    """一次进行中的上游调用，合并的请求在这里等待结果"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Optional[Tuple[int, Dict[str, str], bytes]] = None
+        self.error: Optional[BaseException] = None
+
+
+class ModelGateway:
+    """
+    转发、限速、重试和合并模型请求
+
+    属性:
+        upstream: 上游API地址
+        bucket: 上游请求的令牌桶
+        max_retries: 单个请求的最多重试次数
+        backoff_base: 退避的基础秒数
+        backoff_max: 单次退避的最长秒数
+        coalesce: 是否合并相同的并发请求
+        timeout: 上游请求的超时秒数
+    """
+
+    def __init__(self, upstream: str = OPENROUTER_API_BASE, rate: float = 0, burst: int = 4,
+                 concurrency: int = 8, max_retries: int = 6, backoff_base: float = 0.5,
+                 backoff_max: float = 30.0, coalesce: bool = True, timeout: float = 600,
+                 api_key: Optional[str] = None):
+        """
+        参数:
+            upstream: 上游API地址，默认为openrouter
+            rate: 每秒发往上游的请求数上限，0表示不限速
+            burst: 令牌桶容量
+            concurrency: 同时进行的上游请求数上限
+            max_retries: 单个请求的最多重试次数
+            backoff_base: 退避的基础秒数
+            backoff_max: 单次退避的最长秒数
+            coalesce: 是否合并相同的并发请求
+            timeout: 上游请求的超时秒数
+            api_key: 请求没有带Authorization时使用的密钥，默认为环境变量OPENAI_TOKEN
+        """
+        self.upstream = upstream.rstrip("/")
+        self.bucket = TokenBucket(rate, burst)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.coalesce = coalesce
+        self.timeout = timeout
+        self.api_key = api_key if api_key is not None else os.getenv("OPENAI_TOKEN")
+        self._slots = threading.BoundedSemaphore(concurrency)
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=max(concurrency, 1))
+        self._session.mount("https://", adapter)
+        self._session.mount("http://", adapter)
+        self._inflight: Dict[str, _Call] = {}
+        self._lock = threading.Lock()
+        self._stats = {"requests": 0, "upstream_calls": 0, "coalesced": 0, "retries": 0,
+                       "throttled": 0, "errors": 0, "rate_wait_seconds": 0.0}
+
+    def _count(self, name: str, value: float = 1) -> None:
+        with self._lock:
+            self._stats[name] += value
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {**self._stats, "rate_wait_seconds": round(self._stats["rate_wait_seconds"], 3),
+                    "inflight": len(self._inflight)}
+
+    def _headers(self, headers: Dict[str, str]) -> Dict[str, str]:
+        forwarded = {name: headers[name] for name in FORWARD_HEADERS if headers.get(name)}
+        if "Authorization" not in forwarded and self.api_key:
+            forwarded["Authorization"] = f"Bearer {self.api_key}"
+        return forwarded
+
+    def _backoff(self, attempt: int, response: Optional[requests.Response]) -> float:
+        """第attempt次重试前等待的秒数：指数退避的全抖动，不少于Retry-After"""
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+        retry_after = response.headers.get("Retry-After") if response is not None else None
+        if retry_after:
+            try:
+                delay = max(delay, min(float(retry_after), self.backoff_max))
+            except ValueError:
+                pass
+        return delay
+
+    def _send(self, method: str, path: str, headers: Dict[str, str], body: bytes,
+              stream: bool = False) -> requests.Response:
+        """发送上游请求，按需限速和重试，返回最终的响应(可能仍是错误状态)"""
+        url = self.upstream + path
+        attempt = 0
+        while True:
+            self._count("rate_wait_seconds", self.bucket.acquire())
+            response = None
+            try:
+                with self._slots:
+                    self._count("upstream_calls")
+                    response = self._session.request(method, url, headers=headers, data=body or None,
+                                                     stream=stream, timeout=self.timeout)
+                if response.status_code not in RETRY_STATUS or attempt >= self.max_retries:
+                    return response
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt >= self.max_retries:
+                    raise
+            delay = self._backoff(attempt, response)
+            if response is not None:
+                if response.status_code == 429:
+                    self._count("throttled")
+                    # 上游限流时所有请求一起退让
+                    self.bucket.pause(delay)
+                response.close()
+            self._count("retries")
+            attempt += 1
+            time.sleep(delay)
+
+    def forward(self, method: str, path: str, headers: Dict[str, str],
+                body: bytes) -> Tuple[int, Dict[str, str], bytes]:
+        """
+        转发一个非流式请求，返回(状态码, 响应头, 响应体)
+
+        内容相同的并发请求只发送一次，结果分发给所有等待的请求
+        """
+        self._count("requests")
+        headers = self._headers(headers)
+        if not self.coalesce or method != "POST":
+            return self._complete(method, path, headers, body)
+
+        digest = hashlib.sha256()
+        for part in (method, path, headers.get("Authorization", "")):
+            digest.update(part.encode("utf-8"))
+            digest.update(b"\0")
+        digest.update(body)
+        key = digest.hexdigest()
+        with self._lock:
+            call = self._inflight.get(key)
+            leader = call is None
+            if leader:
+                call = self._inflight[key] = _Call()
+            else:
+                self._stats["coalesced"] += 1
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = self._complete(method, path, headers, body)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._inflight[key]
+            call.done.set()
+
+    def _complete(self, method: str, path: str, headers: Dict[str, str],
+                  body: bytes) -> Tuple[int, Dict[str, str], bytes]:
+        response = self._send(method, path, headers, body)
+        if response.status_code >= 400:
+            self._count("errors")
+        return response.status_code, _response_headers(response), response.content
+
+    def forward_stream(self, method: str, path: str, headers: Dict[str, str],
+                       body: bytes) -> Tuple[int, Dict[str, str], Iterator[bytes]]:
+        """转发一个流式请求(不合并)，返回(状态码, 响应头, 响应体分块)"""
+        self._count("requests")
+        response = self._send(method, path, self._headers(headers), body, stream=True)
+        if response.status_code >= 400:
+            self._count("errors")
+
+        def chunks() -> Iterator[bytes]:
+            try:
+                yield from response.iter_content(chunk_size=None)
+            finally:
+                response.close()
+
+        return response.status_code, _response_headers(response), chunks()
+
+
+def _response_headers(response: requests.Response) -> Dict[str, str]:
+    return {name: value for name, value in response.headers.items() if name.lower() not in HOP_HEADERS}
+
+
+def _is_stream(body: bytes) -> bool:
+    try:
+        return bool(json.loads(body).get("stream"))
+    except (ValueError, AttributeError):
+        return False
+
+
+def start_gateway(gateway: ModelGateway, port: int = 8765, host: str = "0.0.0.0") -> ThreadingHTTPServer:
+    """
+    在后台线程中启动网关的HTTP服务
+
+    返回:
+        HTTP服务器实例，调用shutdown()停止
+    """
+    class Handler(BaseHTTPRequestHandler):
+        # HTTP/1.1使客户端到网关的连接也可以复用
+        protocol_version = "HTTP/1.1"
+
+        def _handle(self, method: str) -> None:
+            length = int(self.headers.get("Content-Length") or 0)
+            body = self.rfile.read(length) if length else b""
+            try:
+                if method == "POST" and _is_stream(body):
+                    status, headers, chunks = gateway.forward_stream(method, self.path, self.headers, body)
+                    self._send_head(status, headers, chunked=True)
+                    for chunk in chunks:
+                        if chunk:
+                            self.wfile.write(b"%x\r\n%s\r\n" % (len(chunk), chunk))
+                            self.wfile.flush()
+                    self.wfile.write(b"0\r\n\r\n")
+                    return
+                status, headers, content = gateway.forward(method, self.path, self.headers, body)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                status, headers = 502, {"Content-Type": "application/json"}
+                content = json.dumps({"error": {"message": f"上游不可用: {e}", "type": "gateway_error"}},
+                                     ensure_ascii=False).encode("utf-8")
+            self._send_head(status, headers, length=len(content))
+            self.wfile.write(content)
+
+        def _send_head(self, status: int, headers: Dict[str, str], length: Optional[int] = None,
+                       chunked: bool = False) -> None:
+            self.send_response(status)
+            for name, value in headers.items():
+                self.send_header(name, value)
+            if chunked:
+                self.send_header("Transfer-Encoding", "chunked")
+            else:
+                self.send_header("Content-Length", str(length))
+            self.end_headers()
+
+        def do_GET(self):
+            if self.path.split("?")[0] == "/gateway/stats":
+                content = json.dumps(gateway.stats()).encode("utf-8")
+                self._send_head(200, {"Content-Type": "application/json"}, length=len(content))
+                self.wfile.write(content)
+                return
+            self._handle("GET")
+
+        def do_POST(self):
+            self._handle("POST")
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="model-gateway", daemon=True).start()
+    return server
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="共享的模型调用网关(OpenAI兼容)")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--upstream", default=os.getenv("AGENT_MODEL_API_BASE", OPENROUTER_API_BASE),
+                        help="上游API地址(默认openrouter)")
+    parser.add_argument("--rate", type=float, default=0, help="每秒发往上游的请求数上限，0为不限速(默认0)")
+    parser.add_argument("--burst", type=int, default=4, help="令牌桶容量(默认4)")
+    parser.add_argument("--concurrency", type=int, default=8, help="同时进行的上游请求数上限(默认8)")
+    parser.add_argument("--max-retries", type=int, default=6, help="单个请求的最多重试次数(默认6)")
+    parser.add_argument("--no-coalesce", action="store_true", help="不合并相同的并发请求")
+    args = parser.parse_args()
+
+    gateway = ModelGateway(args.upstream, rate=args.rate, burst=args.burst, concurrency=args.concurrency,
+                           max_retries=args.max_retries, coalesce=not args.no_coalesce)
+    server = start_gateway(gateway, args.port, args.host)
+    print(f"模型网关已启动: http://{args.host}:{args.port} -> {gateway.upstream}", flush=True)
+    try:
+        while True:
+            time.sleep(60)
+            print(json.dumps(gateway.stats()), file=sys.stderr, flush=True)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
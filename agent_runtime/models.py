@@ -0,0 +1,211 @@
+"""
+模型工厂和脚本化模型
+
+各个智能体脚本和代码模板原来都直接创建指向openrouter.ai的OpenAIServerModel/LiteLLMModel，
+无法离线测量端到端耗时。create_model按环境变量选择模型后端:
+
+    AGENT_MODEL_BACKEND   openai | litellm | scripted，未设置时使用调用方给出的默认后端
+    AGENT_MODEL_API_BASE  openai/litellm后端的API地址，默认https://openrouter.ai/api/v1
+    AGENT_MODEL_GATEWAY   共享模型网关的地址(见agent_runtime.model_gateway)，设置时优先于AGENT_MODEL_API_BASE
+    AGENT_MODEL_SCRIPT    scripted后端回放的响应文件(JSON列表或JSONL)，未设置时使用DEFAULT_SCRIPT
+    AGENT_MODEL_LATENCY   scripted后端每次调用前等待的秒数，模拟模型延迟
+    AGENT_MODEL_CACHE     record | replay | passthrough，为创建的模型加上调用缓存(见agent_runtime.model_cache)
+
+ScriptedModel按顺序回放预先写好的响应(文本或工具调用)，结果完全确定，
+用于测量沙盒启动、工具调度和记忆处理等与模型无关的开销。其他后端可以用register_backend登记。
+"""
+import json
+import os
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, List, Optional, Union
+
+from smolagents import Model
+from smolagents.models import ChatMessage, ChatMessageToolCall, MessageRole
+
+try:
+    from smolagents.models import ChatMessageToolCallFunction
+except ImportError:  # 旧版本smolagents中的名称
+    from smolagents.models import ChatMessageToolCallDefinition as ChatMessageToolCallFunction
+try:
+    from smolagents.monitoring import TokenUsage
+except ImportError:
+    TokenUsage = None
+
+OPENROUTER_API_BASE = "https://openrouter.ai/api/v1"
+
+# 默认回放脚本：一步用pandas计算，一步给出最终答案
+DEFAULT_SCRIPT: List[Union[str, Dict[str, Any]]] = [
+    "Thought: 先用pandas计算结果。\n"
+    "```py\n"
+    "import pandas as pd\n"
+    "df = pd.DataFrame({'city': [f'city{i}' for i in range(21)], 'value': range(21)})\n"
+    "print(df['value'].sum())\n"
+    "```<end_code>",
+    "Thought: 已经得到结果，给出最终答案。\n"
+    "```py\n"
+    "final_answer('210')\n"
+    "```<end_code>",
+]
+
+
+def assistant_message(content: Optional[str], tool_calls: Optional[List[Dict[str, Any]]] = None,
+                      input_tokens: int = 0, output_tokens: int = 0) -> ChatMessage:
+    """
+    构造模型返回的ChatMessage，兼容新旧版本的smolagents
+
+    参数:
+        content: 文本内容
+        tool_calls: 工具调用列表，每项为{"id": ..., "name": ..., "arguments": ...}
+        input_tokens: 输入token数
+        output_tokens: 输出token数
+    """
+    calls = [
+        ChatMessageToolCall(id=call["id"], type="function",
+                            function=ChatMessageToolCallFunction(name=call["name"], arguments=call["arguments"]))
+        for call in tool_calls or []
+    ] or None
+    message = {"role": MessageRole.ASSISTANT, "content": content, "tool_calls": calls}
+    if TokenUsage is not None:
+        message["token_usage"] = TokenUsage(input_tokens=input_tokens, output_tokens=output_tokens)
+    try:
+        return ChatMessage(**message)
+    except TypeError:
+        message.pop("token_usage", None)
+        return ChatMessage(**message)
+
+
+class ScriptedModel(Model):
+    """
+    按顺序回放固定响应的模型
+
+    每个响应可以是字符串(作为模型输出的文本)，或者字典:
+        {"content": "...", "tool_calls": [{"name": "...", "arguments": {...}}],
+         "input_tokens": 100, "output_tokens": 20}
+    响应用完后从头循环。
+    """
+
+    def __init__(self, responses: Optional[List[Union[str, Dict[str, Any]]]] = None, latency: float = 0.0,
+                 model_id: str = "scripted", **kwargs):
+        """
+        参数:
+            responses: 依次返回的响应，默认为DEFAULT_SCRIPT
+            latency: 每次调用前等待的秒数
+            model_id: 模型名称
+        """
+        super().__init__(model_id=model_id, **kwargs)
+        self.responses = list(responses or DEFAULT_SCRIPT)
+        self.latency = latency
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_file(cls, path: str, **kwargs) -> "ScriptedModel":
+        """从JSON列表或JSONL文件(每行一个响应)读取响应"""
+        with open(path, "r", encoding="utf-8") as f:
+            text = f.read()
+        try:
+            responses = json.loads(text)
+        except json.JSONDecodeError:
+            responses = [json.loads(line) for line in text.splitlines() if line.strip()]
+        if not isinstance(responses, list):
+            raise ValueError(f"{path}应为响应的列表")
+        return cls(responses, **kwargs)
+
+    def reset(self) -> None:
+        """从第一个响应重新开始回放"""
+        with self._lock:
+            self.calls = 0
+
+    def generate(self, messages: List[Any], stop_sequences: Optional[List[str]] = None,
+                 response_format: Optional[Dict[str, str]] = None, tools_to_call_from: Optional[List[Any]] = None,
+                 **kwargs) -> ChatMessage:
+        with self._lock:
+            response = self.responses[self.calls % len(self.responses)]
+            self.calls += 1
+        if self.latency > 0:
+            time.sleep(self.latency)
+        if isinstance(response, str):
+            response = {"content": response}
+
+        content = response.get("content")
+        if content and stop_sequences:
+            # 与真实接口一样在停止序列处截断
+            for stop in stop_sequences:
+                if stop and stop in content:
+                    content = content[:content.index(stop)]
+        tool_calls = [
+            {"id": call.get("id") or f"call_{uuid.uuid4().hex[:8]}", "name": call["name"],
+             "arguments": call.get("arguments", {})}
+            for call in response.get("tool_calls") or []
+        ]
+        input_tokens = response.get("input_tokens", sum(len(str(m)) for m in messages) // 4)
+        output_tokens = response.get("output_tokens", len(content or "") // 4)
+        # 旧版本smolagents从这两个属性读取token用量
+        self.last_input_token_count = input_tokens
+        self.last_output_token_count = output_tokens
+        return assistant_message(content, tool_calls, input_tokens, output_tokens)
+
+    def __call__(self, *args, **kwargs) -> ChatMessage:
+        return self.generate(*args, **kwargs)
+
+
+def _server_kwargs(model_id: Optional[str]) -> Dict[str, Any]:
+    return {
+        "model_id": model_id or os.environ["MODEL_NAME"],
+        # 设置了共享网关(agent_runtime.model_gateway)时经网关转发，由网关统一限速和重试
+        "api_base": os.getenv("AGENT_MODEL_GATEWAY") or os.getenv("AGENT_MODEL_API_BASE", OPENROUTER_API_BASE),
+        "api_key": os.environ["OPENAI_TOKEN"],
+    }
+
+
+def _openai_model(model_id: Optional[str] = None, **kwargs) -> Model:
+    from smolagents import OpenAIServerModel
+    return OpenAIServerModel(**_server_kwargs(model_id), **kwargs)
+
+
+def _litellm_model(model_id: Optional[str] = None, **kwargs) -> Model:
+    from smolagents import LiteLLMModel
+    return LiteLLMModel(**_server_kwargs(model_id), **kwargs)
+
+
+def _scripted_model(model_id: Optional[str] = None, **kwargs) -> Model:
+    kwargs.setdefault("latency", float(os.getenv("AGENT_MODEL_LATENCY", "0")))
+    script = os.getenv("AGENT_MODEL_SCRIPT")
+    if script:
+        return ScriptedModel.from_file(script, model_id=model_id or "scripted", **kwargs)
+    return ScriptedModel(model_id=model_id or "scripted", **kwargs)
+
+
+MODEL_BACKENDS: Dict[str, Callable[..., Model]] = {
+    "openai": _openai_model,
+    "litellm": _litellm_model,
+    "scripted": _scripted_model,
+}
+
+
+def register_backend(name: str, factory: Callable[..., Model]) -> None:
+    """登记(或替换)一个模型后端，factory(model_id=None, **kwargs)返回smolagents模型"""
+    MODEL_BACKENDS[name] = factory
+
+
+def create_model(default_backend: str = "openai", model_id: Optional[str] = None, **kwargs) -> Model:
+    """
+    创建模型
+
+    参数:
+        default_backend: 未设置AGENT_MODEL_BACKEND时使用的后端
+        model_id: 模型名称，默认为环境变量MODEL_NAME
+        kwargs: 传给后端的其他参数
+
+    异常:
+        ValueError: 后端名称未登记，或AGENT_MODEL_CACHE不是有效的缓存模式
+    """
+    backend = os.getenv("AGENT_MODEL_BACKEND") or default_backend
+    if backend not in MODEL_BACKENDS:
+        raise ValueError(f"未知的模型后端: {backend}，可选: {', '.join(sorted(MODEL_BACKENDS))}")
+    model = MODEL_BACKENDS[backend](model_id=model_id, **kwargs)
+    # 设置AGENT_MODEL_CACHE时包装录制/回放缓存(见agent_runtime.model_cache)
+    from agent_runtime.model_cache import wrap_from_env
+    return wrap_from_env(model)
@@ -0,0 +1,62 @@
+"""
+预热脚本：制作快照镜像前在容器中执行
+
+以root身份导入模板常用的重量级依赖并编译site-packages，使__pycache__写入镜像层；
+沙盒用户nobody没有写权限，否则每个新容器都要在导入时重新编译。
+结束前清理/tmp，避免把临时文件带进快照。
+
+用法:
+    python -m agent_runtime.preload [--no-compile]
+"""
+import argparse
+import compileall
+import importlib
+import sysconfig
+import time
+
+from agent_runtime.reset import clean_tmp
+
+# 模板和worker会导入的模块，按依赖顺序排列
+PRELOAD_MODULES = [
+    "openai",
+    "litellm",
+    "mcp",
+    "mcp_server_fetch",
+    "pandas",
+    "openpyxl",
+    "smolagents",
+    "agent_runtime.worker",
+]
+
+
+def compile_site_packages() -> bool:
+    """编译site-packages和agent_runtime中缺少.pyc的模块"""
+    ok = True
+    for path in sorted({sysconfig.get_paths()["purelib"], sysconfig.get_paths()["platlib"], "/opt/agent_runtime"}):
+        ok = compileall.compile_dir(path, quiet=1, workers=0) and ok
+    return ok
+
+
+def import_modules() -> None:
+    """逐个导入模块，失败的模块只打印提示"""
+    for name in PRELOAD_MODULES:
+        start = time.perf_counter()
+        try:
+            importlib.import_module(name)
+            print(f"preload {name}: {time.perf_counter() - start:.2f}s")
+        except Exception as e:
+            print(f"preload {name} failed: {e}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="预热沙盒镜像")
+    parser.add_argument("--no-compile", action="store_true", help="不编译site-packages")
+    args = parser.parse_args()
+    if not args.no_compile:
+        compile_site_packages()
+    import_modules()
+    clean_tmp()
+
+
+if __name__ == "__main__":
+    main()
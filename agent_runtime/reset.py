@@ -0,0 +1,77 @@
+"""
+容器池归还容器时执行的重置脚本
+
+结束上一个任务遗留的进程并清理/tmp，但保留容器的1号进程
+以及常驻worker所在的进程组(worker及其MCP子进程)和worker目录。
+worker中的任务没有正常结束(被取消或超时)时，worker进程组也一起结束，下一个任务会重新启动worker。
+
+用法:
+    python -m agent_runtime.reset
+"""
+import os
+import shutil
+import signal
+
+from agent_runtime.worker import WORKER_DIR, PID_FILE, BUSY_FILE, SOCKET_PATH
+
+TMP_DIR = "/tmp"
+
+
+def _worker_pgid():
+    try:
+        with open(PID_FILE) as f:
+            return os.getpgid(int(f.read().strip()))
+    except (OSError, ValueError):
+        return None
+
+
+def _discard_busy_worker() -> bool:
+    """worker仍在执行任务时删除它的文件，使其进程组不再被保留，返回是否删除"""
+    if not os.path.exists(BUSY_FILE):
+        return False
+    for path in (BUSY_FILE, PID_FILE, SOCKET_PATH):
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+    return True
+
+
+def kill_leftover_processes() -> None:
+    """结束除1号进程、自身和空闲worker进程组以外的所有可见进程"""
+    keep_pgid = _worker_pgid()
+    if _discard_busy_worker():
+        keep_pgid = None
+    me = os.getpid()
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        pid = int(entry)
+        if pid in (1, me):
+            continue
+        try:
+            if keep_pgid is not None and os.getpgid(pid) == keep_pgid:
+                continue
+            os.kill(pid, signal.SIGKILL)
+        except (ProcessLookupError, PermissionError):
+            pass
+
+
+def clean_tmp() -> None:
+    """删除/tmp中除worker目录外的文件"""
+    for name in os.listdir(TMP_DIR):
+        path = os.path.join(TMP_DIR, name)
+        if os.path.abspath(path) == os.path.abspath(WORKER_DIR):
+            continue
+        try:
+            if os.path.isdir(path) and not os.path.islink(path):
+                shutil.rmtree(path, ignore_errors=True)
+            else:
+                os.unlink(path)
+        except OSError:
+            pass
+
+
+if __name__ == "__main__":
+    kill_leftover_processes()
+    clean_tmp()
@@ -0,0 +1,358 @@
+"""
+智能体步骤的token和耗时记录
+
+StepTracer通过smolagents的step_callbacks机制(ui_agent.py也用它给每一步添加截图)在每一步结束时
+写一行JSON，记录该步骤的耗时、token用量、模型调用延迟、各工具调用的耗时以及是否出错重试。
+模型调用和工具调用的耗时通过包装模型的generate/generate_stream和工具的forward得到；
+托管智能体(managed_agents)的步骤单独记录，并作为一次工具调用计入上层步骤。
+每次run结束时再写一行整次运行的汇总。
+
+记录格式(每行一个JSON对象):
+    {"event": "step", "run_id", "agent", "type", "step", "duration", "input_tokens", "output_tokens",
+     "model_calls", "model_latency", "model_errors", "tools": [{"name", "duration", "error"}],
+     "retries", "error"}
+    {"event": "run", "run_id", "parent_run", "agent", "task", "task_hash", "status", "duration",
+     "steps", "input_tokens", "output_tokens", "model_calls", "model_latency", ...标签}
+
+用法:
+    tracer = instrument(agent, "agent_trace.jsonl", script="mcp_web_agent")
+    agent.run(...)
+
+汇总:
+    python -m agent_runtime.step_trace agent_trace.jsonl [--top 10]
+"""
+import argparse
+import functools
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+from agent_runtime.memory_export import step_duration, step_tokens
+
+# 未指定路径时的记录文件；沙盒中由宿主机的SANDBOX_STEP_TRACE=1设置
+TRACE_PATH = os.getenv("AGENT_STEP_TRACE")
+
+
+def _unwrap(func):
+    """去掉之前的StepTracer加上的包装，避免同一个模型/工具在worker中被反复包装"""
+    while getattr(func, "_step_tracer", None) is not None:
+        func = func.__wrapped__
+    return func
+
+
+def _usage(message: Any):
+    usage = getattr(message, "token_usage", None)
+    if usage is None:
+        return None, None
+    return getattr(usage, "input_tokens", None), getattr(usage, "output_tokens", None)
+
+
+def _error_text(error: BaseException) -> str:
+    return f"{type(error).__name__}: {error}"[:300]
+
+
+class StepTracer:
+    """
+    记录智能体每一步的token用量和耗时
+
+    属性:
+        path: JSONL记录文件
+        labels: 附加到每条run记录上的标签(例如脚本名)
+    """
+
+    def __init__(self, path: str, labels: Optional[Dict[str, Any]] = None):
+        """
+        参数:
+            path: JSONL记录文件，追加写入
+            labels: 附加到每条run记录上的标签
+        """
+        self.path = path
+        self.labels = dict(labels or {})
+        self._lock = threading.Lock()
+        # 正在运行的run(托管智能体嵌套在上层run中)，栈顶收集当前步骤的模型和工具调用
+        self._frames: List[Dict[str, Any]] = []
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    # ---- 记录 ----
+
+    def write(self, record: Dict[str, Any]) -> None:
+        line = json.dumps(record, ensure_ascii=False, default=str) + "\n"
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line)
+
+    def _add(self, kind: str, event: Dict[str, Any]) -> None:
+        with self._lock:
+            if self._frames:
+                self._frames[-1][kind].append(event)
+
+    # ---- 包装模型、工具和智能体 ----
+
+    def wrap_model(self, model: Any) -> None:
+        """包装模型的generate和generate_stream，记录每次调用的延迟和token"""
+        for method, stream in (("generate", False), ("generate_stream", True)):
+            original = getattr(model, method, None)
+            if original is None:
+                continue
+            original = _unwrap(original)
+            setattr(model, method, self._timed_model(original, stream))
+
+    def _timed_model(self, original, stream: bool):
+        @functools.wraps(original)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                result = original(*args, **kwargs)
+            except BaseException as e:
+                self._add("model_calls", {"latency": time.perf_counter() - start, "error": _error_text(e)})
+                raise
+            if stream:
+                return self._timed_stream(result, start)
+            input_tokens, output_tokens = _usage(result)
+            self._add("model_calls", {"latency": time.perf_counter() - start,
+                                      "input_tokens": input_tokens, "output_tokens": output_tokens})
+            return result
+
+        wrapper._step_tracer = self
+        return wrapper
+
+    def _timed_stream(self, deltas, start: float):
+        event: Dict[str, Any] = {"input_tokens": 0, "output_tokens": 0}
+        try:
+            for delta in deltas:
+                if "first_token" not in event:
+                    event["first_token"] = time.perf_counter() - start
+                input_tokens, output_tokens = _usage(delta)
+                event["input_tokens"] += input_tokens or 0
+                event["output_tokens"] += output_tokens or 0
+                yield delta
+        except Exception as e:
+            event["error"] = _error_text(e)
+            raise
+        finally:
+            event["latency"] = time.perf_counter() - start
+            self._add("model_calls", event)
+
+    def wrap_tool(self, tool: Any) -> None:
+        """包装工具的forward，记录每次调用的耗时和异常"""
+        original = _unwrap(tool.forward)
+        name = getattr(tool, "name", type(tool).__name__)
+
+        @functools.wraps(original)
+        def forward(*args, **kwargs):
+            start = time.perf_counter()
+            error = None
+            try:
+                return original(*args, **kwargs)
+            except BaseException as e:
+                error = _error_text(e)
+                raise
+            finally:
+                self._add("tools", {"name": name, "duration": round(time.perf_counter() - start, 3),
+                                    "error": error})
+
+        forward._step_tracer = self
+        tool.forward = forward
+
+    def wrap_agent(self, agent: Any, managed: bool = False) -> None:
+        """包装智能体的模型、工具、托管智能体和run，并注册步骤回调"""
+        self.wrap_model(agent.model)
+        for tool in agent.tools.values():
+            self.wrap_tool(tool)
+        for sub_agent in (getattr(agent, "managed_agents", None) or {}).values():
+            self.wrap_agent(sub_agent, managed=True)
+
+        callbacks = agent.step_callbacks
+        if hasattr(callbacks, "register"):
+            # 新版smolagents的CallbackRegistry按步骤类型注册
+            from smolagents.memory import MemoryStep
+            callbacks.register(MemoryStep, self)
+        else:
+            # 重复instrument同一个智能体时只保留最新的记录器
+            callbacks[:] = [callback for callback in callbacks if not isinstance(callback, StepTracer)]
+            callbacks.append(self)
+        agent.run = self._traced_run(agent, _unwrap(agent.run), managed)
+
+    def _traced_run(self, agent: Any, original, managed: bool):
+        agent_name = getattr(agent, "name", None) or type(agent).__name__
+
+        @functools.wraps(original)
+        def run(task, *args, **kwargs):
+            if kwargs.get("stream"):
+                # 流式运行返回生成器，不记录整次运行的汇总
+                return original(task, *args, **kwargs)
+            frame = {"run_id": uuid.uuid4().hex[:12], "agent": agent_name, "model_calls": [], "tools": [],
+                     "steps": 0, "input_tokens": 0, "output_tokens": 0, "model_count": 0, "model_latency": 0.0}
+            with self._lock:
+                parent = self._frames[-1]["run_id"] if self._frames else None
+                self._frames.append(frame)
+            start = time.perf_counter()
+            status = "succeeded"
+            try:
+                return original(task, *args, **kwargs)
+            except BaseException:
+                status = "failed"
+                raise
+            finally:
+                duration = round(time.perf_counter() - start, 3)
+                with self._lock:
+                    self._frames.remove(frame)
+                task_text = str(task)
+                self.write({
+                    "event": "run", "ts": time.time(), "run_id": frame["run_id"], "parent_run": parent,
+                    "agent": agent_name, "task": task_text[:200],
+                    "task_hash": hashlib.sha1(task_text.encode("utf-8")).hexdigest()[:12],
+                    "status": status, "duration": duration, "steps": frame["steps"],
+                    "input_tokens": frame["input_tokens"], "output_tokens": frame["output_tokens"],
+                    "model_calls": frame["model_count"], "model_latency": round(frame["model_latency"], 3),
+                    **self.labels,
+                })
+                if managed:
+                    # 托管智能体在上层步骤中相当于一次工具调用
+                    self._add("tools", {"name": agent_name, "duration": duration,
+                                        "error": None if status == "succeeded" else status, "managed_agent": True})
+
+        run._step_tracer = self
+        return run
+
+    # ---- 步骤回调 ----
+
+    def __call__(self, memory_step: Any, agent: Any = None) -> None:
+        with self._lock:
+            frame = self._frames[-1] if self._frames else None
+            model_calls, tools = (frame["model_calls"], frame["tools"]) if frame else ([], [])
+            if frame:
+                frame["model_calls"], frame["tools"] = [], []
+
+        input_tokens, output_tokens = step_tokens(memory_step)
+        if input_tokens is None and model_calls:
+            input_tokens = sum(call.get("input_tokens") or 0 for call in model_calls)
+            output_tokens = sum(call.get("output_tokens") or 0 for call in model_calls)
+        model_latency = sum(call["latency"] for call in model_calls)
+        model_errors = sum(1 for call in model_calls if call.get("error"))
+        error = getattr(memory_step, "error", None)
+        record = {
+            "event": "step",
+            "ts": time.time(),
+            "run_id": frame["run_id"] if frame else None,
+            "agent": frame["agent"] if frame else None,
+            "type": type(memory_step).__name__,
+            "step": getattr(memory_step, "step_number", None),
+            "duration": step_duration(memory_step),
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+            "model_calls": len(model_calls),
+            "model_latency": round(model_latency, 3),
+            "model_errors": model_errors,
+            "tools": tools,
+            # 出错的步骤会由智能体在下一步重试
+            "retries": 1 if error is not None else 0,
+            "error": _error_text(error) if isinstance(error, BaseException) else (str(error)[:300] if error else None),
+        }
+        if frame:
+            with self._lock:
+                frame["steps"] += 1
+                frame["input_tokens"] += input_tokens or 0
+                frame["output_tokens"] += output_tokens or 0
+                frame["model_count"] += len(model_calls)
+                frame["model_latency"] += model_latency
+        self.write(record)
+
+
+def instrument(agent: Any, path: Optional[str] = None, **labels: Any) -> Optional[StepTracer]:
+    """
+    为智能体开启步骤记录；需要在替换完agent.tools之后、run之前调用
+
+    参数:
+        agent: smolagents智能体(托管智能体一并记录)
+        path: JSONL记录文件，默认为环境变量AGENT_STEP_TRACE；都没有时不做记录
+        labels: 附加到run记录上的标签
+
+    返回:
+        StepTracer，未开启时为None
+    """
+    path = path or TRACE_PATH
+    if not path:
+        return None
+    tracer = StepTracer(path, labels)
+    tracer.wrap_agent(agent)
+    return tracer
+
+
+# ---- 汇总 ----
+
+def load_trace(paths: List[str]) -> List[Dict[str, Any]]:
+    records = []
+    for path in paths:
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except json.JSONDecodeError:
+                    continue
+    return records
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, max(0, int(round(q * len(values) + 0.5)) - 1))]
+
+
+def summarize(records: List[Dict[str, Any]], top: int = 10) -> str:
+    """把记录汇总成文本报告：总览、最慢的运行、各工具耗时和最慢的步骤"""
+    runs = [r for r in records if r.get("event") == "run"]
+    steps = [r for r in records if r.get("event") == "step"]
+    latencies = [s["model_latency"] for s in steps if s.get("model_calls")]
+    lines = [
+        "== 总览 ==",
+        f"运行: {sum(1 for r in runs if not r.get('parent_run'))} (含托管智能体 {len(runs)})  步骤: {len(steps)}  "
+        f"出错重试的步骤: {sum(s.get('retries', 0) for s in steps)}  模型调用失败: "
+        f"{sum(s.get('model_errors', 0) for s in steps)}",
+        f"token: 输入 {sum(s.get('input_tokens') or 0 for s in steps)}  "
+        f"输出 {sum(s.get('output_tokens') or 0 for s in steps)}",
+        f"模型调用: {sum(s.get('model_calls', 0) for s in steps)}次  每步模型耗时 p50 {percentile(latencies, 0.5):.2f}s  "
+        f"p95 {percentile(latencies, 0.95):.2f}s  合计 {sum(latencies):.1f}s",
+        "",
+        f"== 最慢的运行(前{top}) ==",
+    ]
+    for run in sorted((r for r in runs if not r.get("parent_run")), key=lambda r: r["duration"], reverse=True)[:top]:
+        lines.append(f"{run['duration']:8.1f}s  {run['steps']:3d}步  token {run['input_tokens']}/"
+                     f"{run['output_tokens']}  模型 {run['model_latency']:.1f}s  [{run['status']}] "
+                     f"{run['task'][:60].replace(chr(10), ' ')}")
+
+    tools: Dict[str, List[Dict[str, Any]]] = {}
+    for step in steps:
+        for call in step.get("tools", []):
+            tools.setdefault(call["name"], []).append(call)
+    lines += ["", "== 工具 ==", f"{'名称':<24}{'次数':>6}{'合计s':>10}{'p50':>8}{'p95':>8}{'最大':>8}{'失败':>6}"]
+    for name, calls in sorted(tools.items(), key=lambda item: -sum(c["duration"] for c in item[1])):
+        durations = [c["duration"] for c in calls]
+        lines.append(f"{name:<24}{len(calls):>6}{sum(durations):>10.1f}{percentile(durations, 0.5):>8.2f}"
+                     f"{percentile(durations, 0.95):>8.2f}{max(durations):>8.2f}"
+                     f"{sum(1 for c in calls if c.get('error')):>6}")
+
+    lines += ["", f"== 最慢的步骤(前{top}) =="]
+    for step in sorted(steps, key=lambda s: s.get("duration") or 0, reverse=True)[:top]:
+        tool_names = ", ".join(call["name"] for call in step.get("tools", [])) or "-"
+        lines.append(f"{step.get('duration') or 0:8.1f}s  {step.get('agent')}#{step.get('step')}  "
+                     f"模型 {step['model_latency']:.1f}s  token {step.get('input_tokens')}/{step.get('output_tokens')}  "
+                     f"工具: {tool_names}{'  [出错]' if step.get('error') else ''}")
+    return "\n".join(lines)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="汇总智能体步骤记录(JSONL)")
+    parser.add_argument("paths", nargs="+", help="StepTracer写入的记录文件")
+    parser.add_argument("--top", type=int, default=10, help="列出最慢的运行和步骤的数量(默认10)")
+    args = parser.parse_args(argv)
+    print(summarize(load_trace(args.paths), args.top))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+"""
+使用共享HTTP缓存(agent_runtime.http_cache)的网页工具
+
+- CachedVisitWebpageTool: 与smolagents的VisitWebpageTool接口相同，抓取经过缓存
+- VisitWebpagesTool: visit_webpages工具，并行抓取多个网页(总并发和单个主机的并发都有上限)
+- fetch_server_parameters: 启动带缓存的mcp_server_fetch(agent_runtime.cached_fetch_server)的参数
+"""
+import asyncio
+import os
+import re
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, List, Dict
+from urllib.parse import urlsplit
+
+import requests
+from mcp import StdioServerParameters
+from smolagents import Tool, VisitWebpageTool
+
+from agent_runtime import http_cache
+
+# 传给MCP子进程的环境变量：stdio客户端只继承少量默认变量，缓存目录和包路径需要显式传递
+_FORWARDED_ENV = ("PYTHONPATH", "AGENT_HTTP_CACHE_DIR", "AGENT_HTTP_CACHE_TTL")
+
+
+def page_to_markdown(html: str, max_length: Optional[int] = None) -> str:
+    """把网页转换为markdown并压缩多余的空行，超过max_length时截断"""
+    from markdownify import markdownify
+    from smolagents.utils import truncate_content
+
+    markdown_content = markdownify(html).strip()
+    markdown_content = re.sub(r"\n{3,}", "\n\n", markdown_content)
+    return truncate_content(markdown_content, max_length) if max_length else markdown_content
+
+
+def visit_webpage(url: str, max_length: Optional[int] = 40000, timeout: float = 20) -> str:
+    """通过缓存抓取网页并返回markdown，出错时返回与smolagents的visit_webpage相同的错误信息"""
+    try:
+        response = http_cache.fetch(url, timeout=timeout)
+        response.raise_for_status()
+        return page_to_markdown(response.text, max_length)
+    except requests.exceptions.Timeout:
+        return "The request timed out. Please try again later or check the URL."
+    except requests.RequestException as e:
+        return f"Error fetching the webpage: {str(e)}"
+    except Exception as e:
+        return f"An unexpected error occurred: {str(e)}"
+
+
+class CachedVisitWebpageTool(VisitWebpageTool):
+    """抓取经过共享磁盘缓存的visit_webpage工具"""
+
+    def forward(self, url: str) -> str:
+        return visit_webpage(url, getattr(self, "max_output_length", 40000))
+
+
+class VisitWebpagesTool(Tool):
+    """
+    并行抓取多个网页的visit_webpages工具
+
+    抓取在有界的asyncio任务池中进行：总并发不超过max_concurrency，同一主机不超过per_host，
+    每个网页的markdown单独截断，按输入顺序返回。
+    """
+    name = "visit_webpages"
+    description = (
+        "Visits several webpages in parallel and returns their content as markdown, in the same order as "
+        "the given urls. Much faster than calling visit_webpage once per url; use it whenever you need "
+        "to read more than one page."
+    )
+    inputs = {
+        "urls": {
+            "type": "array",
+            "description": "The list of webpage urls to visit.",
+        }
+    }
+    output_type = "string"
+
+    def __init__(self, max_concurrency: int = 8, per_host: int = 2, max_length_per_page: int = 10000,
+                 max_total_length: int = 80000, timeout: float = 20):
+        """
+        参数:
+            max_concurrency: 同时抓取的网页数上限
+            per_host: 同一主机同时抓取的网页数上限
+            max_length_per_page: 每个网页markdown的最大长度
+            max_total_length: 全部网页的总长度预算，网页较多时每页的长度按此均分
+            timeout: 每个请求的超时秒数
+        """
+        super().__init__()
+        self.max_concurrency = max_concurrency
+        self.per_host = per_host
+        self.max_length_per_page = max_length_per_page
+        self.max_total_length = max_total_length
+        self.timeout = timeout
+
+    async def visit_all(self, urls: List[str]) -> List[str]:
+        """并行抓取urls，返回与输入顺序一致的markdown列表"""
+        max_length = min(self.max_length_per_page, max(1000, self.max_total_length // max(len(urls), 1)))
+        limit = asyncio.Semaphore(self.max_concurrency)
+        host_limits: Dict[str, asyncio.Semaphore] = {}
+        loop = asyncio.get_running_loop()
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+            async def visit(url: str) -> str:
+                host = urlsplit(url).netloc.lower()
+                host_limit = host_limits.setdefault(host, asyncio.Semaphore(self.per_host))
+                async with limit, host_limit:
+                    return await loop.run_in_executor(executor, visit_webpage, url, max_length, self.timeout)
+
+            return await asyncio.gather(*(visit(url) for url in urls))
+
+    def forward(self, urls: List[str]) -> str:
+        if isinstance(urls, str):
+            urls = [urls]
+        urls = [str(url).strip() for url in urls if str(url).strip()]
+        if not urls:
+            return "No urls given."
+        pages = _run_async(self.visit_all(urls))
+        return "\n\n---\n\n".join(f"## [{index}] {url}\n\n{page}"
+                                    for index, (url, page) in enumerate(zip(urls, pages), 1))
+
+
+def _run_async(coro):
+    """在同步代码中运行协程；当前线程已有事件循环时在新线程中运行"""
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coro)
+    result = {}
+
+    def run():
+        try:
+            result["value"] = asyncio.run(coro)
+        except BaseException as e:
+            result["error"] = e
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    thread.join()
+    if "error" in result:
+        raise result["error"]
+    return result["value"]
+
+
+def fetch_server_parameters(proxy: Optional[str] = None) -> StdioServerParameters:
+    """
+    返回带缓存的fetch MCP服务器的启动参数，用于ToolCollection.from_mcp
+
+    参数:
+        proxy: 可选的HTTP代理地址
+    """
+    env = {name: os.environ[name] for name in _FORWARDED_ENV if name in os.environ}
+    if proxy:
+        env.update({"HTTP_PROXY": proxy, "HTTPS_PROXY": proxy, "USE_PROXY": "true"})
+    return StdioServerParameters(
+        command=sys.executable,
+        args=["-m", "agent_runtime.cached_fetch_server"],
+        env=env,
+    )
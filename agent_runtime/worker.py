@@ -0,0 +1,263 @@
+"""
+容器内常驻的智能体worker
+
+worker进程启动时导入smolagents/litellm/mcp，创建模型客户端、启动mcp_server_fetch，
+之后通过本地unix socket接收渲染好的代码模板并在同一进程中执行。
+这样每个问题不再需要重新导入依赖、重建模型和重启MCP子进程。
+
+宿主机通过exec运行agent_runtime.worker_client把请求桥接到worker，
+输出按块流式返回，因此DockerSandbox.run_code_stream的用法不变。
+
+任务在worker的线程中执行，无法单独结束。任务被取消(客户端断开)或超出CPU时间上限时，
+worker结束自己的整个进程组(包括MCP子进程和任务启动的子进程)，下一个任务由worker_client重新启动worker。
+
+协议(每行一个JSON对象):
+    请求: {"code": "<python代码>", "cpu_seconds": 60}      # cpu_seconds可选
+    响应: {"stream": "stdout"|"stderr", "data": "..."} ... {"exit_code": 0}
+"""
+import contextlib
+import io
+import json
+import os
+import select
+import signal
+import socket
+import sys
+import threading
+import time
+import traceback
+
+WORKER_DIR = os.environ.get("AGENT_WORKER_DIR", "/tmp/agent_worker")
+SOCKET_PATH = os.path.join(WORKER_DIR, "worker.sock")
+PID_FILE = os.path.join(WORKER_DIR, "worker.pid")
+LOG_FILE = os.path.join(WORKER_DIR, "worker.log")
+LOCK_FILE = os.path.join(WORKER_DIR, "worker.lock")
+# 任务执行期间存在的标记文件；重置容器时仍然存在说明任务没有正常结束(见agent_runtime.reset)
+BUSY_FILE = os.path.join(WORKER_DIR, "worker.busy")
+# 检查客户端连接和任务CPU时间的间隔秒数
+WATCH_INTERVAL = 0.5
+
+
+class WorkerResources:
+    """
+    worker中只初始化一次的共享资源，以WORKER变量注入到每个任务的代码中
+
+    属性:
+        model: 模型客户端(默认LiteLLMModel，见agent_runtime.models.create_model)
+        mcp_servers: MCPServerManager，MCP服务按需启动并在任务之间常驻、自动重启
+        fetch_tools: 带缓存的mcp_server_fetch提供的工具列表
+        search_tool: DuckDuckGoSearchTool实例
+        visit_tool: 使用共享HTTP缓存的VisitWebpageTool实例
+        visit_many_tool: 并行抓取多个网页的VisitWebpagesTool实例
+        workspace_tool: 检索工作目录文本的SearchWorkspaceTool实例(索引在任务之间增量更新)
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._mcp_servers = None
+        self._model = None
+        self._fetch_tools = None
+        self._search_tool = None
+        self._visit_tool = None
+        self._visit_many_tool = None
+        self._workspace_tool = None
+
+    @property
+    def model(self):
+        with self._lock:
+            if self._model is None:
+                from agent_runtime.models import create_model
+                self._model = create_model("litellm")
+            return self._model
+
+    @property
+    def mcp_servers(self):
+        with self._lock:
+            if self._mcp_servers is None:
+                from agent_runtime.mcp_manager import shared_manager
+                self._mcp_servers = shared_manager()
+            return self._mcp_servers
+
+    @property
+    def fetch_tools(self):
+        mcp_servers = self.mcp_servers
+        with self._lock:
+            if self._fetch_tools is None:
+                self._fetch_tools = list(mcp_servers.tools("fetch").tools)
+            return self._fetch_tools
+
+    @property
+    def search_tool(self):
+        with self._lock:
+            if self._search_tool is None:
+                from smolagents import DuckDuckGoSearchTool
+                self._search_tool = DuckDuckGoSearchTool()
+            return self._search_tool
+
+    @property
+    def visit_tool(self):
+        with self._lock:
+            if self._visit_tool is None:
+                from agent_runtime.web_tools import CachedVisitWebpageTool
+                self._visit_tool = CachedVisitWebpageTool()
+            return self._visit_tool
+
+    @property
+    def visit_many_tool(self):
+        with self._lock:
+            if self._visit_many_tool is None:
+                from agent_runtime.web_tools import VisitWebpagesTool
+                self._visit_many_tool = VisitWebpagesTool()
+            return self._visit_many_tool
+
+    @property
+    def workspace_tool(self):
+        with self._lock:
+            if self._workspace_tool is None:
+                from agent_runtime.workspace_index import SearchWorkspaceTool
+                self._workspace_tool = SearchWorkspaceTool()
+            return self._workspace_tool
+
+    def preload(self) -> None:
+        """预先初始化全部资源，失败的资源留到第一次使用时再重试"""
+        for name in ("model", "fetch_tools", "search_tool", "visit_tool", "visit_many_tool",
+                     "workspace_tool"):
+            try:
+                getattr(self, name)
+            except Exception as e:
+                print(f"预加载{name}失败: {e}", flush=True)
+
+    def close(self) -> None:
+        """关闭MCP子进程等资源"""
+        if self._mcp_servers is not None:
+            self._mcp_servers.close()
+
+
+class _SocketWriter(io.TextIOBase):
+    """把写入的文本作为输出消息发送给客户端的文件对象"""
+
+    def __init__(self, conn: socket.socket, stream: str):
+        self._conn = conn
+        self._stream = stream
+
+    def writable(self) -> bool:
+        return True
+
+    def isatty(self) -> bool:
+        return False
+
+    def write(self, text: str) -> int:
+        if text:
+            send_message(self._conn, {"stream": self._stream, "data": text})
+        return len(text)
+
+
+def send_message(conn: socket.socket, message: dict) -> None:
+    conn.sendall(json.dumps(message, ensure_ascii=False).encode("utf-8") + b"\n")
+
+
+# 同一时间只执行一个任务：任务共享标准输出重定向和WORKER资源
+_job_lock = threading.Lock()
+
+
+def _abort(reason: str) -> None:
+    """结束worker的整个进程组，正在执行的任务随之结束"""
+    print(f"结束worker: {reason}", file=sys.__stderr__, flush=True)
+    for path in (BUSY_FILE, PID_FILE, SOCKET_PATH):
+        with contextlib.suppress(OSError):
+            os.unlink(path)
+    os.killpg(os.getpgrp(), signal.SIGKILL)
+
+
+def _client_gone(conn: socket.socket) -> bool:
+    """客户端是否已经关闭连接(请求之后客户端不再发送数据，可读即表示断开)"""
+    readable, _, _ = select.select([conn], [], [], 0)
+    if not readable:
+        return False
+    try:
+        return conn.recv(1, socket.MSG_PEEK) == b""
+    except OSError:
+        return True
+
+
+def _thread_cpu_time(thread_id: int) -> float:
+    return time.clock_gettime(time.pthread_getcpuclockid(thread_id))
+
+
+def _watch_job(conn: socket.socket, thread_id: int, cpu_seconds: int, done: threading.Event) -> None:
+    """任务执行期间检查客户端是否断开(任务被取消)以及任务线程的CPU时间"""
+    while not done.wait(WATCH_INTERVAL):
+        if _client_gone(conn):
+            # 客户端在收到退出码后才会断开，因此先确认任务确实还没结束
+            if not done.is_set():
+                _abort("客户端已断开，任务被取消")
+            return
+        if cpu_seconds and _thread_cpu_time(thread_id) > cpu_seconds:
+            _abort(f"任务超出CPU时间上限{cpu_seconds}秒")
+
+
+def _run_job(conn: socket.socket, resources: WorkerResources) -> None:
+    with conn, conn.makefile("rb") as reader:
+        line = reader.readline()
+        if not line:
+            return
+        request = json.loads(line)
+        code = request["code"]
+        exit_code = 0
+        with _job_lock:
+            done = threading.Event()
+            with open(BUSY_FILE, "w") as f:
+                f.write(str(os.getpid()))
+            watch_args = (conn, threading.get_ident(), request.get("cpu_seconds"), done)
+            threading.Thread(target=_watch_job, args=watch_args, name="job-watch", daemon=True).start()
+            stdout, stderr = _SocketWriter(conn, "stdout"), _SocketWriter(conn, "stderr")
+            try:
+                with contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(stderr):
+                    namespace = {"__name__": "__main__", "WORKER": resources}
+                    try:
+                        exec(compile(code, "<sandbox-job>", "exec"), namespace)
+                    except SystemExit as e:
+                        exit_code = e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+                    except BaseException:
+                        exit_code = 1
+                        with contextlib.suppress(OSError):
+                            traceback.print_exc()
+            finally:
+                done.set()
+                with contextlib.suppress(OSError):
+                    os.unlink(BUSY_FILE)
+        # 客户端已断开(任务被取消)时无需再发送退出码
+        with contextlib.suppress(OSError):
+            send_message(conn, {"exit_code": exit_code})
+
+
+def serve() -> None:
+    """初始化共享资源并在unix socket上循环接收任务"""
+    os.makedirs(WORKER_DIR, exist_ok=True)
+    if os.environ.get("PROXY"):
+        # 与代码模板一致，设置HTTP代理
+        os.environ['HTTP_PROXY'] = os.environ["PROXY"]
+        os.environ['HTTPS_PROXY'] = os.environ["PROXY"]
+    resources = WorkerResources()
+    resources.preload()
+
+    if os.path.exists(SOCKET_PATH):
+        os.unlink(SOCKET_PATH)
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(SOCKET_PATH)
+    server.listen(16)
+    with open(PID_FILE, "w") as f:
+        f.write(str(os.getpid()))
+    print(f"worker已就绪: {SOCKET_PATH}", flush=True)
+
+    try:
+        while True:
+            conn, _ = server.accept()
+            threading.Thread(target=_run_job, args=(conn, resources), daemon=True).start()
+    finally:
+        server.close()
+        resources.close()
+
+
+if __name__ == "__main__":
+    serve()
@@ -0,0 +1,118 @@
+"""
+常驻worker的命令行客户端
+
+由宿主机通过exec调用，把代码转发给容器内的agent_runtime.worker，
+并把worker返回的输出原样写到自己的stdout/stderr，退出码与任务一致。
+worker未运行时自动在后台启动它(用文件锁保证只启动一个)。
+
+用法:
+    python -m agent_runtime.worker_client "<python代码>"
+    python -m agent_runtime.worker_client --start   # 只确保worker已启动
+"""
+import argparse
+import fcntl
+import json
+import os
+import resource
+import socket
+import subprocess
+import sys
+import time
+from typing import Optional
+
+from agent_runtime.worker import WORKER_DIR, SOCKET_PATH, LOG_FILE, LOCK_FILE
+
+# 首次启动worker需要导入smolagents并启动MCP子进程，等待时间要足够长
+START_TIMEOUT = float(os.environ.get("AGENT_WORKER_START_TIMEOUT", "180"))
+
+
+def _connect() -> socket.socket:
+    conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        conn.connect(SOCKET_PATH)
+    except OSError:
+        conn.close()
+        raise
+    return conn
+
+
+def ensure_worker(timeout: float = START_TIMEOUT) -> socket.socket:
+    """
+    连接worker，worker未运行时在后台启动并等待其就绪
+
+    返回:
+        已连接的socket
+
+    异常:
+        TimeoutError: worker在超时时间内没有就绪
+    """
+    try:
+        return _connect()
+    except OSError:
+        pass
+
+    os.makedirs(WORKER_DIR, exist_ok=True)
+    with open(LOCK_FILE, "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            return _connect()
+        except OSError:
+            pass
+        with open(LOG_FILE, "ab") as log:
+            # 新会话中启动，worker不随本次exec结束，也不会被取消任务时的进程组信号波及
+            subprocess.Popen(
+                [sys.executable, "-m", "agent_runtime.worker"],
+                stdin=subprocess.DEVNULL, stdout=log, stderr=subprocess.STDOUT,
+                start_new_session=True, close_fds=True,
+            )
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            try:
+                return _connect()
+            except OSError:
+                time.sleep(0.2)
+    raise TimeoutError(f"worker在{timeout}秒内没有就绪，请查看{LOG_FILE}")
+
+
+def _cpu_limit() -> Optional[int]:
+    """job_launcher为本进程设置的CPU时间上限，转交给worker对任务线程执行"""
+    soft, _ = resource.getrlimit(resource.RLIMIT_CPU)
+    return None if soft == resource.RLIM_INFINITY else soft
+
+
+def run(code: str) -> int:
+    """
+    把代码交给worker执行并转发输出，返回任务退出码
+
+    本进程被取消(结束进程组)时连接随之关闭，worker检测到后结束正在执行的任务
+    """
+    conn = ensure_worker()
+    request = {"code": code, "cpu_seconds": _cpu_limit()}
+    with conn, conn.makefile("rb") as reader:
+        conn.sendall(json.dumps(request, ensure_ascii=False).encode("utf-8") + b"\n")
+        for line in reader:
+            message = json.loads(line)
+            if "exit_code" in message:
+                return message["exit_code"]
+            out = sys.stderr if message["stream"] == "stderr" else sys.stdout
+            out.write(message["data"])
+            out.flush()
+    print("worker连接意外断开", file=sys.stderr)
+    return 1
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Run code in the resident agent worker")
+    parser.add_argument("code", nargs="?", help="Python code to execute")
+    parser.add_argument("--start", action="store_true", help="only make sure the worker is running")
+    args = parser.parse_args()
+    if args.start:
+        ensure_worker().close()
+        return 0
+    if args.code is None:
+        parser.error("code is required unless --start is given")
+    return run(args.code)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
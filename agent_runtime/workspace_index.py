@@ -0,0 +1,214 @@
+"""
+工作目录文本索引
+
+智能体经常把大量网页内容拼接写入工作目录(例如几百KB的result.txt)，之后再整体读回放进上下文。
+这里把工作目录中的文本文件切成块并建立BM25索引，search_workspace(query, k)只返回最相关的k个块，
+减少每一步的提示词长度。
+
+- 按段落切块，单块约CHUNK_SIZE个字符，相邻块有少量重叠
+- 分词：英文/数字按单词，中日韩文字按单字和相邻双字(n-gram)，无需分词词典
+- 索引按文件的修改时间和大小增量更新，文件变化后下次检索时只重建该文件
+"""
+import math
+import os
+import re
+import threading
+from collections import Counter
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from smolagents import Tool
+
+WORKSPACE_DIR = os.getenv("AGENT_WORKSPACE_DIR", "/app/output")
+TEXT_EXTENSIONS = {".txt", ".md", ".markdown", ".csv", ".tsv", ".json", ".jsonl", ".html", ".htm", ".xml",
+                   ".log", ".py", ".yaml", ".yml"}
+CHUNK_SIZE = 1200
+CHUNK_OVERLAP = 150
+# 超过该大小的文件不建立索引
+MAX_FILE_BYTES = 50 * 1024 * 1024
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+_WORD_RE = re.compile(r"[a-z0-9]+(?:['_.-][a-z0-9]+)*")
+_CJK_RE = re.compile(r"[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff]+")
+
+
+def tokenize(text: str) -> List[str]:
+    """英文/数字取单词，中日韩文字取单字和双字"""
+    text = text.lower()
+    tokens = _WORD_RE.findall(text)
+    for run in _CJK_RE.findall(text):
+        tokens.extend(run)
+        tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
+
+
+def split_chunks(text: str, size: int = CHUNK_SIZE, overlap: int = CHUNK_OVERLAP) -> List[Tuple[int, int]]:
+    """把文本切成约size个字符的块，尽量在段落或句子边界处切分，返回(起点, 终点)列表"""
+    spans = []
+    start = 0
+    length = len(text)
+    while start < length:
+        end = min(start + size, length)
+        if end < length:
+            # 在块的后半段寻找最后一个段落/换行/句末标点作为切分点
+            window = text[start + size // 2:end]
+            for separator in ("\n\n", "\n", "。", ". ", "！", "？", "; ", "；"):
+                cut = window.rfind(separator)
+                if cut != -1:
+                    end = start + size // 2 + cut + len(separator)
+                    break
+        spans.append((start, end))
+        if end >= length:
+            break
+        start = max(end - overlap, start + 1)
+    return spans
+
+
+@dataclass
+class Chunk:
+    """索引中的一个文本块"""
+    path: str
+    index: int
+    start: int
+    end: int
+    text: str
+    term_freqs: Counter
+    length: int
+
+
+class WorkspaceIndex:
+    """
+    工作目录的BM25索引
+
+    属性:
+        root: 建立索引的目录
+    """
+
+    def __init__(self, root: Optional[str] = None, chunk_size: int = CHUNK_SIZE, overlap: int = CHUNK_OVERLAP):
+        """
+        参数:
+            root: 建立索引的目录，默认为AGENT_WORKSPACE_DIR(/app/output)
+            chunk_size: 每块的字符数
+            overlap: 相邻块重叠的字符数
+        """
+        self.root = os.path.abspath(root or WORKSPACE_DIR)
+        self.chunk_size = chunk_size
+        self.overlap = overlap
+        self._lock = threading.Lock()
+        self._files: Dict[str, Tuple[float, int, List[Chunk]]] = {}  # 路径 -> (mtime, 大小, 块)
+        self._doc_freqs: Counter = Counter()
+
+    def _scan(self) -> Dict[str, os.stat_result]:
+        found = {}
+        for root, _, files in os.walk(self.root):
+            for name in files:
+                if os.path.splitext(name)[1].lower() not in TEXT_EXTENSIONS:
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                if st.st_size <= MAX_FILE_BYTES:
+                    found[path] = st
+        return found
+
+    def _index_file(self, path: str) -> List[Chunk]:
+        try:
+            with open(path, "r", encoding="utf-8", errors="replace") as f:
+                text = f.read()
+        except OSError:
+            return []
+        chunks = []
+        for index, (start, end) in enumerate(split_chunks(text, self.chunk_size, self.overlap)):
+            tokens = tokenize(text[start:end])
+            chunks.append(Chunk(path, index, start, end, text[start:end], Counter(tokens), len(tokens)))
+        return chunks
+
+    def refresh(self) -> None:
+        """按文件修改时间和大小增量更新索引"""
+        with self._lock:
+            found = self._scan()
+            for path in list(self._files):
+                if path not in found:
+                    self._forget(path)
+            for path, st in found.items():
+                cached = self._files.get(path)
+                if cached and cached[0] == st.st_mtime and cached[1] == st.st_size:
+                    continue
+                if cached:
+                    self._forget(path)
+                chunks = self._index_file(path)
+                self._files[path] = (st.st_mtime, st.st_size, chunks)
+                for chunk in chunks:
+                    self._doc_freqs.update(chunk.term_freqs.keys())
+
+    def _forget(self, path: str) -> None:
+        _, _, chunks = self._files.pop(path)
+        for chunk in chunks:
+            self._doc_freqs.subtract(chunk.term_freqs.keys())
+        self._doc_freqs += Counter()  # 去掉计数为0的词
+
+    def search(self, query: str, k: int = 5) -> List[Tuple[float, Chunk]]:
+        """
+        检索与query最相关的k个块
+
+        返回:
+            按得分从高到低排列的(得分, 块)列表
+        """
+        self.refresh()
+        terms = set(tokenize(query))
+        with self._lock:
+            chunks = [chunk for _, _, file_chunks in self._files.values() for chunk in file_chunks]
+            if not chunks or not terms:
+                return []
+            total = len(chunks)
+            avg_length = sum(chunk.length for chunk in chunks) / total or 1
+            idf = {term: math.log(1 + (total - self._doc_freqs[term] + 0.5) / (self._doc_freqs[term] + 0.5))
+                   for term in terms if self._doc_freqs[term]}
+            scored = []
+            for chunk in chunks:
+                score = 0.0
+                for term, weight in idf.items():
+                    freq = chunk.term_freqs.get(term)
+                    if freq:
+                        norm = BM25_K1 * (1 - BM25_B + BM25_B * chunk.length / avg_length)
+                        score += weight * freq * (BM25_K1 + 1) / (freq + norm)
+                if score > 0:
+                    scored.append((score, chunk))
+        scored.sort(key=lambda item: item[0], reverse=True)
+        return scored[:k]
+
+
+class SearchWorkspaceTool(Tool):
+    """search_workspace工具：在工作目录的文本文件中检索相关片段"""
+    name = "search_workspace"
+    description = (
+        "Searches the text files in the working directory (/app/output) and returns only the chunks most "
+        "relevant to the query, with their file path and character range. Use it instead of reading large "
+        "files (such as collected web page dumps) back in full."
+    )
+    inputs = {
+        "query": {"type": "string", "description": "Keywords or a question describing what to look for."},
+        "k": {"type": "integer", "description": "Number of chunks to return, default 5.", "nullable": True},
+    }
+    output_type = "string"
+
+    def __init__(self, root: Optional[str] = None):
+        """
+        参数:
+            root: 建立索引的目录，默认为AGENT_WORKSPACE_DIR(/app/output)
+        """
+        super().__init__()
+        self.index = WorkspaceIndex(root)
+
+    def forward(self, query: str, k: Optional[int] = 5) -> str:
+        results = self.index.search(query, max(1, int(k or 5)))
+        if not results:
+            return f"No matching text found in {self.index.root}."
+        parts = []
+        for score, chunk in results:
+            path = os.path.relpath(chunk.path, self.index.root)
+            parts.append(f"### {path} [chars {chunk.start}-{chunk.end}] score={score:.2f}\n{chunk.text.strip()}")
+        return "\n\n".join(parts)
@@ -1,16 +1,13 @@
-from smolagents import ToolCollection, CodeAgent
-from smolagents import OpenAIServerModel
+from smolagents import CodeAgent
+from agent_runtime.models import create_model
 import os
 
 # 设置HTTP代理
 os.environ['HTTP_PROXY'] = os.environ["PROXY"]
 os.environ['HTTPS_PROXY'] = os.environ["PROXY"]
 
-amodel = OpenAIServerModel(
-    model_id=os.environ["MODEL_NAME"],
-    api_base="https://openrouter.ai/api/v1",
-    api_key=os.environ["OPENAI_TOKEN"],
-)
+# 默认为openrouter上的OpenAIServerModel，可通过AGENT_MODEL_BACKEND切换(例如scripted离线回放)
+amodel = create_model("openai")
 
 
 agent = CodeAgent(
@@ -0,0 +1,241 @@
+"""
+智能体端到端的离线基准
+
+模型换成agent_runtime.models.ScriptedModel按固定脚本回放响应，不访问模型接口，
+重复运行完整的智能体任务，测量与模型无关的开销(智能体构建、代码执行、工具调度、记忆处理、沙盒启动):
+
+- host: 在当前进程中构建与默认模板相同结构的CodeAgent(不含联网搜索)并运行，
+  记录每次的耗时、tracemalloc内存峰值和进程RSS
+- sandbox: 通过DockerSandbox用默认模板执行(容器内AGENT_MODEL_BACKEND=scripted)，
+  记录每次的耗时、各阶段耗时和容器内存峰值(来自sandbox_metrics的stats采样)
+
+用法:
+    python agent_benchmark.py --mode both --iterations 20 --json agent_bench.json
+    python agent_benchmark.py --mode sandbox --worker --script my_script.json --latency 0.2
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Optional, Dict, Any, List
+
+# agent_runtime位于仓库根目录
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from agent_runtime.models import ScriptedModel
+from agent_runtime.step_trace import percentile
+
+QUESTION = "计算广东省21个地市指标值的合计"
+
+
+def summarize(samples: List[float], scale: float = 1.0, unit: str = "ms") -> Dict[str, Any]:
+    """样本的统计，scale为换算到unit的倍数"""
+    if not samples:
+        return {"n": 0}
+    return {
+        "n": len(samples),
+        f"mean_{unit}": round(sum(samples) / len(samples) * scale, 3),
+        f"p50_{unit}": round(percentile(samples, 0.5) * scale, 3),
+        f"p95_{unit}": round(percentile(samples, 0.95) * scale, 3),
+        f"max_{unit}": round(max(samples) * scale, 3),
+    }
+
+
+def current_rss() -> int:
+    """当前进程的常驻内存(字节)，无法读取时返回0"""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+def build_host_agent(model: ScriptedModel, workdir: str):
+    """构建与默认模板结构相同的智能体；搜索工具需要联网，这里不包含"""
+    from smolagents import CodeAgent, ToolCallingAgent
+    from agent_runtime.web_tools import CachedVisitWebpageTool, VisitWebpagesTool
+    from agent_runtime.workspace_index import SearchWorkspaceTool
+
+    visit_tool = CachedVisitWebpageTool()
+    visit_many_tool = VisitWebpagesTool()
+    search_agent = ToolCallingAgent(
+        tools=[visit_tool, visit_many_tool],
+        model=model,
+        name="search_agent",
+        description="This is an agent that can do web search.",
+    )
+    agent = CodeAgent(
+        tools=[visit_many_tool, SearchWorkspaceTool(workdir)],
+        model=model,
+        managed_agents=[search_agent],
+        additional_authorized_imports=["*"],
+    )
+    agent.tools["visit_webpage"] = visit_tool
+    return agent
+
+
+def bench_host(responses: Optional[List[Any]], latency: float, iterations: int, warmup: int,
+               trace_memory: bool = True) -> Dict[str, Any]:
+    """在当前进程中重复构建并运行智能体"""
+    workdir = tempfile.mkdtemp(prefix="agent-bench-")
+    durations, peaks, answers = [], [], set()
+    rss_start = current_rss()
+    try:
+        for i in range(warmup + iterations):
+            model = ScriptedModel(responses, latency=latency)
+            if trace_memory:
+                tracemalloc.start()
+            start = time.perf_counter()
+            agent = build_host_agent(model, workdir)
+            answer = agent.run(QUESTION)
+            elapsed = time.perf_counter() - start
+            peak = tracemalloc.get_traced_memory()[1] if trace_memory else 0
+            if trace_memory:
+                tracemalloc.stop()
+            if i >= warmup:
+                durations.append(elapsed)
+                peaks.append(peak)
+                answers.add(str(answer))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    result = {
+        "duration": summarize(durations, 1000),
+        "rss_growth_mb": round((current_rss() - rss_start) / 2 ** 20, 2),
+        "answers": sorted(answers),
+    }
+    if trace_memory:
+        result["python_peak_memory"] = summarize(peaks, 1 / 2 ** 20, "mb")
+    return result
+
+
+class CollectingRegistry:
+    """包装指标注册表，同时保留每个任务的记录"""
+
+    def __init__(self):
+        from sandbox_metrics import MetricsRegistry
+        self._log = tempfile.NamedTemporaryFile(prefix="agent-bench-", suffix=".jsonl", delete=False)
+        self._log.close()
+        self.registry = MetricsRegistry(log_path=self._log.name)
+        self.traces: List[Dict[str, Any]] = []
+
+    def record(self, trace) -> None:
+        self.registry.record(trace)
+        self.traces.append(trace.to_dict())
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.registry, name)
+
+    def close(self) -> None:
+        os.unlink(self._log.name)
+
+
+def bench_sandbox(responses: Optional[List[Any]], latency: float, iterations: int, warmup: int,
+                  use_worker: bool = False) -> Dict[str, Any]:
+    """通过DockerSandbox用默认模板重复执行，容器内使用scripted模型后端"""
+    from dockersandbox import DockerSandbox
+
+    # 容器启动时读取这些变量(见dockersandbox.container_environment)，因此要在创建沙盒前设置
+    os.environ["AGENT_MODEL_BACKEND"] = "scripted"
+    os.environ["AGENT_MODEL_LATENCY"] = str(latency)
+    os.environ.setdefault("PROXY_IN_DOCKER", "")
+    script_path = None
+    if responses is not None:
+        # 回放脚本放在挂载到/app/output的工作目录中
+        os.makedirs("./workspace", exist_ok=True)
+        script_path = os.path.abspath("./workspace/.agent_benchmark_script.json")
+        with open(script_path, "w", encoding="utf-8") as f:
+            json.dump(responses, f, ensure_ascii=False)
+        os.environ["AGENT_MODEL_SCRIPT"] = "/app/output/.agent_benchmark_script.json"
+
+    collector = CollectingRegistry()
+    sandbox = DockerSandbox(use_worker=use_worker, metrics=collector)
+    durations, failures = [], 0
+    try:
+        for i in range(warmup + iterations):
+            start = time.perf_counter()
+            sandbox.run_code(QUESTION, use_cache=False)
+            elapsed = time.perf_counter() - start
+            if i >= warmup:
+                durations.append(elapsed)
+    finally:
+        sandbox.cleanup()
+        collector.close()
+        if script_path:
+            os.unlink(script_path)
+
+    traces = collector.traces[warmup:]
+    phases: Dict[str, List[float]] = {}
+    peaks = []
+    for trace in traces:
+        if trace["status"] != "succeeded":
+            failures += 1
+        for name, seconds in trace["phases"].items():
+            phases.setdefault(name, []).append(seconds)
+        if trace["resources"].get("samples"):
+            peaks.append(trace["resources"]["peak_memory_bytes"])
+    return {
+        "worker": use_worker,
+        "duration": summarize(durations, 1000),
+        "phases": {name: summarize(samples, 1000) for name, samples in phases.items()},
+        "container_peak_memory": summarize(peaks, 1 / 2 ** 20, "mb"),
+        "failures": failures,
+    }
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="智能体端到端的离线基准(使用脚本化模型)")
+    parser.add_argument("--mode", choices=["host", "sandbox", "both"], default="host",
+                        help="在当前进程、DockerSandbox中或两者都运行(默认host)")
+    parser.add_argument("--iterations", type=int, default=10, help="计入统计的运行次数(默认10)")
+    parser.add_argument("--warmup", type=int, default=1, help="不计入统计的预热次数(默认1)")
+    parser.add_argument("--script", help="回放的模型响应文件(JSON列表或JSONL)，默认为models.DEFAULT_SCRIPT")
+    parser.add_argument("--latency", type=float, default=0, help="每次模型调用的模拟延迟秒数(默认0)")
+    parser.add_argument("--worker", action="store_true", help="sandbox模式下通过容器内常驻worker执行")
+    parser.add_argument("--no-tracemalloc", action="store_true",
+                        help="host模式下不用tracemalloc跟踪内存峰值(跟踪会让耗时偏高)")
+    parser.add_argument("--json", dest="json_path", help="结果另存为JSON文件")
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    responses = ScriptedModel.from_file(args.script).responses if args.script else None
+    report: Dict[str, Any] = {
+        "iterations": args.iterations,
+        "warmup": args.warmup,
+        "latency": args.latency,
+        "script": args.script or "DEFAULT_SCRIPT",
+    }
+    if args.mode in ("host", "both"):
+        print("在当前进程中运行智能体...", flush=True)
+        report["host"] = bench_host(responses, args.latency, args.iterations, args.warmup,
+                                    trace_memory=not args.no_tracemalloc)
+    if args.mode in ("sandbox", "both"):
+        print("在DockerSandbox中运行智能体...", flush=True)
+        report["sandbox"] = bench_sandbox(responses, args.latency, args.iterations, args.warmup,
+                                          use_worker=args.worker)
+
+    for section in ("host", "sandbox"):
+        if section not in report:
+            continue
+        print(f"\n== {section} ==")
+        for name, values in report[section].items():
+            if name == "phases":
+                for phase_name, phase_values in values.items():
+                    print(f"  phase {phase_name:<20}" + "  ".join(f"{k}={v}" for k, v in phase_values.items()))
+            elif isinstance(values, dict):
+                print(f"{name:<24}" + "  ".join(f"{k}={v}" for k, v in values.items()))
+            else:
+                print(f"{name:<24}{values}")
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\n结果已写入{args.json_path}")
+
+
+if __name__ == "__main__":
+    main()
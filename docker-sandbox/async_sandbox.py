@@ -0,0 +1,404 @@
+"""
+异步Docker沙盒
+
+AsyncDockerSandbox直接通过unix socket调用Docker Engine HTTP API(httpx异步客户端)，
+提供与DockerSandbox相同的create_container/run_code/cleanup接口，但不占用线程：
+一个事件循环中可以同时执行成百上千个任务。多个沙盒可以共享同一个AsyncDockerAPI，
+复用其连接池(exec输出流在任务结束前会占用一个连接)。
+
+SyncDockerSandbox是同步外观，在后台线程的事件循环中执行异步沙盒，
+可以直接替换run_cli.py等脚本中的DockerSandbox。
+
+镜像解析和构建仍使用docker SDK(见sandbox_image)，在线程中执行，且只在进程内首次创建容器时发生。
+"""
+import asyncio
+import atexit
+import codecs
+import os
+import threading
+import time
+from typing import Optional, Dict, Any, AsyncIterator, List, Tuple, Generator
+
+import docker
+import httpx
+from docker.utils import parse_bytes
+
+from dockersandbox import DEFAULT_TEMPLATE, WORKER_TEMPLATE, default_workspace_volumes, job_command, \
+    container_environment, shared_cache_volumes
+from resource_profiles import ResourceProfile, get_profile
+from sandbox_image import resolve_image
+from sandbox_metrics import JobTrace, MetricsRegistry, REGISTRY
+from sandbox_snapshot import resolve_snapshot
+from template_registry import TemplateRegistry
+
+DEFAULT_SOCKET = "/var/run/docker.sock"
+# 使用固定的API版本，Docker 20.10及以上版本支持
+API_VERSION = "v1.41"
+# exec输出流的帧头：1字节流类型、3字节填充、4字节大端长度
+_FRAME_HEADER = 8
+_STREAM_NAMES = {1: "stdout", 2: "stderr"}
+
+
+def docker_socket_path() -> str:
+    """从DOCKER_HOST(unix://...)读取socket路径，默认/var/run/docker.sock"""
+    host = os.getenv("DOCKER_HOST", "")
+    if host.startswith("unix://"):
+        return host[len("unix://"):]
+    return DEFAULT_SOCKET
+
+
+class AsyncDockerAPI:
+    """
+    Docker Engine HTTP API的最小异步客户端
+
+    只实现沙盒需要的接口：创建/启动/停止容器、exec及其输出流。
+    """
+
+    def __init__(self, socket_path: Optional[str] = None, max_connections: int = 512,
+                 timeout: float = 60.0):
+        """
+        参数:
+            socket_path: Docker守护进程的unix socket路径
+            max_connections: 连接池的最大连接数，限制同时执行的exec数量
+            timeout: 普通请求的超时秒数(exec输出流不受限制)
+        """
+        self.socket_path = socket_path or docker_socket_path()
+        self._client = httpx.AsyncClient(
+            transport=httpx.AsyncHTTPTransport(uds=self.socket_path),
+            base_url=f"http://docker/{API_VERSION}",
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=32),
+            timeout=timeout,
+        )
+
+    @staticmethod
+    def _raise_for_status(response: httpx.Response, body: bytes) -> None:
+        if response.status_code < 400:
+            return
+        explanation = body.decode("utf-8", errors="replace")
+        message = f"{response.status_code} {response.request.method} {response.request.url.path}"
+        if response.status_code == 404:
+            raise docker.errors.NotFound(message, explanation=explanation)
+        raise docker.errors.APIError(message, explanation=explanation)
+
+    async def request(self, method: str, path: str, **kwargs) -> Any:
+        """发送请求并返回解析后的JSON(无内容时返回None)"""
+        response = await self._client.request(method, path, **kwargs)
+        self._raise_for_status(response, response.content)
+        if response.content and response.headers.get("content-type", "").startswith("application/json"):
+            return response.json()
+        return None
+
+    async def create_container(self, config: Dict[str, Any]) -> str:
+        return (await self.request("POST", "/containers/create", json=config))["Id"]
+
+    async def start_container(self, container_id: str) -> None:
+        await self.request("POST", f"/containers/{container_id}/start")
+
+    async def stop_container(self, container_id: str, timeout: int = 10) -> None:
+        await self.request("POST", f"/containers/{container_id}/stop", params={"t": timeout},
+                           timeout=timeout + 30)
+
+    async def inspect_container(self, container_id: str) -> Dict[str, Any]:
+        return await self.request("GET", f"/containers/{container_id}/json")
+
+    async def exec_create(self, container_id: str, cmd: List[str], user: str = "nobody") -> str:
+        config = {"Cmd": cmd, "User": user, "AttachStdout": True, "AttachStderr": True, "Tty": False}
+        return (await self.request("POST", f"/containers/{container_id}/exec", json=config))["Id"]
+
+    async def exec_start(self, exec_id: str) -> AsyncIterator[Tuple[str, bytes]]:
+        """启动exec并按帧产出(流名称, 数据)"""
+        async with self._client.stream("POST", f"/exec/{exec_id}/start",
+                                       json={"Detach": False, "Tty": False},
+                                       timeout=httpx.Timeout(None)) as response:
+            if response.status_code >= 400:
+                self._raise_for_status(response, await response.aread())
+            buffer = bytearray()
+            async for chunk in response.aiter_raw():
+                buffer += chunk
+                while len(buffer) >= _FRAME_HEADER:
+                    size = int.from_bytes(buffer[4:_FRAME_HEADER], "big")
+                    if len(buffer) < _FRAME_HEADER + size:
+                        break
+                    name = _STREAM_NAMES.get(buffer[0], "stdout")
+                    data = bytes(buffer[_FRAME_HEADER:_FRAME_HEADER + size])
+                    del buffer[:_FRAME_HEADER + size]
+                    yield name, data
+
+    async def exec_inspect(self, exec_id: str) -> Dict[str, Any]:
+        return await self.request("GET", f"/exec/{exec_id}/json")
+
+    async def exec_run(self, container_id: str, cmd: List[str], user: str = "nobody") -> Tuple[int, bytes]:
+        """执行命令直到结束，返回(退出码, 合并的输出)"""
+        exec_id = await self.exec_create(container_id, cmd, user)
+        output = b"".join([data async for _, data in self.exec_start(exec_id)])
+        return (await self.exec_inspect(exec_id)).get("ExitCode"), output
+
+    async def aclose(self) -> None:
+        await self._client.aclose()
+
+
+def _container_config(image: str, volumes: Dict[str, Any], profile: ResourceProfile) -> Dict[str, Any]:
+    """与start_sandbox_container相同的容器配置，转换为Engine API格式"""
+    limits = profile.run_kwargs()
+    return {
+        "Image": image,
+        "Cmd": ["tail", "-f", "/dev/null"],  # 保持容器运行
+        "Tty": True,
+        "Env": [key if value is None else f"{key}={value}"
+                for key, value in container_environment().items()],
+        "HostConfig": {
+            "Memory": parse_bytes(limits["mem_limit"]),
+            "CpuPeriod": limits["cpu_period"],
+            "CpuQuota": limits["cpu_quota"],
+            "PidsLimit": limits["pids_limit"],
+            "SecurityOpt": ["no-new-privileges"],
+            "CapDrop": ["ALL"],
+            "Binds": [f"{os.path.abspath(host)}:{spec['bind']}:{spec.get('mode', 'rw')}"
+                      for host, spec in {**volumes, **shared_cache_volumes()}.items()],
+            "AutoRemove": True,
+        },
+    }
+
+
+class AsyncDockerSandbox:
+    """
+    基于Docker Engine HTTP API的异步沙盒
+
+    属性:
+        api: 共享的AsyncDockerAPI
+        container_id: 当前容器的ID
+        templates: code_template/目录的模板注册表
+        use_worker: 是否通过容器内的常驻worker执行代码
+    """
+
+    def __init__(self, api: Optional[AsyncDockerAPI] = None, use_worker: bool = False,
+                 snapshot: bool = False, metrics: Optional[MetricsRegistry] = None):
+        """
+        参数:
+            api: 可选的共享AsyncDockerAPI，多个沙盒共享时复用同一个连接池
+            use_worker: 为True时代码交给容器内常驻的agent_runtime.worker执行
+            snapshot: 是否从预热快照镜像启动容器
+            metrics: 可选的指标注册表，默认使用sandbox_metrics.REGISTRY
+        """
+        self._owns_api = api is None
+        self.api = api or AsyncDockerAPI()
+        self.container_id: Optional[str] = None
+        self._container_key = None
+        self.templates = TemplateRegistry()
+        self.use_worker = use_worker
+        self.default_template = WORKER_TEMPLATE if use_worker else DEFAULT_TEMPLATE
+        self.default_volumes = default_workspace_volumes()
+        self.snapshot = snapshot
+        self.metrics = metrics or REGISTRY
+        self._lock = asyncio.Lock()
+        self._running_jobs: Dict[str, str] = {}  # 任务ID -> 容器ID
+        self._sync_client: Optional[docker.DockerClient] = None
+
+    def _resolve_image(self) -> str:
+        if self._sync_client is None:
+            self._sync_client = docker.from_env()
+        return resolve_snapshot(self._sync_client) if self.snapshot else resolve_image(self._sync_client)
+
+    async def create_container(self, force: bool = False, volumes: Optional[Dict[str, Any]] = None,
+                               profile: Optional[str] = None) -> None:
+        """
+        创建并启动容器，运行中的容器配置相同时不做任何操作
+
+        参数:
+            force: 是否强制重建容器
+            volumes: 可选的卷配置，格式为{"主机路径": {"bind": "容器路径", "mode": "rw/ro"}}
+            profile: 资源配置档名称，默认为default
+        """
+        volumes = self.default_volumes if volumes is None else volumes
+        profile = get_profile(profile)
+        key = (tuple(sorted((os.path.abspath(h), s["bind"], s.get("mode", "rw")) for h, s in volumes.items())),
+               profile.name)
+        async with self._lock:
+            if self.container_id and not force and key == self._container_key and await self._is_running():
+                return
+            if self.container_id:
+                await self._stop()
+            image = await asyncio.to_thread(self._resolve_image)
+            container_id = await self.api.create_container(_container_config(image, volumes, profile))
+            await self.api.start_container(container_id)
+            self.container_id = container_id
+            self._container_key = key
+
+    async def _is_running(self) -> bool:
+        try:
+            info = await self.api.inspect_container(self.container_id)
+        except docker.errors.APIError:
+            return False
+        return info.get("State", {}).get("Running", False)
+
+    async def _stream(self, code: str, template_file: Optional[str], job_id: Optional[str],
+                      cpu_seconds: Optional[int], volumes: Optional[Dict[str, Any]],
+                      profile: Optional[str], outcome: Dict[str, Any]) -> AsyncIterator[Tuple[str, str]]:
+        """run_code_stream的实现，结束后把退出码写入outcome["exit_code"]"""
+        template_file = template_file or self.default_template
+        trace = JobTrace(job_id, template_file, get_profile(profile).name)
+        status = "error"
+        try:
+            with trace.phase("render"):
+                code = self.templates.render(template_file, question=code)
+            with trace.phase("container_acquire"):
+                if not self.container_id or volumes is not None or profile is not None:
+                    await self.create_container(volumes=volumes, profile=profile)
+            container_id = self.container_id
+            cmd = job_command(code, self.use_worker, job_id, cpu_seconds)
+            if job_id is not None:
+                self._running_jobs[job_id] = container_id
+            try:
+                with trace.phase("exec"):
+                    exec_id = await self.api.exec_create(container_id, cmd)
+                    # 多字节UTF-8字符可能被拆分到两帧中，使用增量解码器
+                    decoders = {name: codecs.getincrementaldecoder("utf-8")(errors="replace")
+                                for name in ("stdout", "stderr")}
+                    decode_seconds = 0.0
+                    async for name, data in self.api.exec_start(exec_id):
+                        start = time.perf_counter()
+                        text = decoders[name].decode(data)
+                        decode_seconds += time.perf_counter() - start
+                        if text:
+                            yield name, text
+                    for name, decoder in decoders.items():
+                        text = decoder.decode(b"", final=True)
+                        if text:
+                            yield name, text
+                    trace.add("output_decode", decode_seconds)
+                    outcome["exit_code"] = (await self.api.exec_inspect(exec_id)).get("ExitCode")
+            finally:
+                if job_id is not None:
+                    self._running_jobs.pop(job_id, None)
+            status = "succeeded" if outcome["exit_code"] == 0 else "failed"
+        except (GeneratorExit, asyncio.CancelledError):
+            status = "aborted"
+            raise
+        finally:
+            trace.finish(status, outcome.get("exit_code"))
+            self.metrics.record(trace)
+
+    async def run_code_stream(self, code: str, template_file: Optional[str] = None,
+                              job_id: Optional[str] = None, cpu_seconds: Optional[int] = None,
+                              volumes: Optional[Dict[str, Any]] = None,
+                              profile: Optional[str] = None) -> AsyncIterator[Tuple[str, str]]:
+        """
+        在容器中执行代码，边执行边产出(流名称, 文本块)
+
+        参数与DockerSandbox.run_code_stream相同
+        """
+        async for item in self._stream(code, template_file, job_id, cpu_seconds, volumes, profile, {}):
+            yield item
+
+    async def run_code(self, code: str, template_file: Optional[str] = None,
+                       profile: Optional[str] = None) -> Optional[str]:
+        """
+        在容器中执行代码
+
+        返回:
+            代码执行输出，如果无输出则返回None
+        """
+        output = "".join([text async for _, text in self.run_code_stream(code, template_file, profile=profile)])
+        return output or None
+
+    async def cancel_job(self, job_id: str) -> bool:
+        """结束一个正在执行的任务(整个进程组)，容器保持运行"""
+        container_id = self._running_jobs.get(job_id)
+        if container_id is None:
+            return False
+        exit_code, _ = await self.api.exec_run(
+            container_id, ["python", "-m", "agent_runtime.job_launcher", "--kill", job_id])
+        return exit_code == 0
+
+    async def _stop(self) -> None:
+        try:
+            await self.api.stop_container(self.container_id)
+        except docker.errors.NotFound:
+            # 容器已被删除是预期行为
+            pass
+        except Exception as e:
+            print(f"沙盒关闭时出错，请检查py-sandbox是否异常退出: {e}")
+        finally:
+            self.container_id = None
+
+    async def cleanup(self) -> None:
+        """停止当前容器"""
+        async with self._lock:
+            if self.container_id:
+                await self._stop()
+
+    async def aclose(self) -> None:
+        """停止容器，并在API客户端由本沙盒创建时关闭它"""
+        await self.cleanup()
+        if self._owns_api:
+            await self.api.aclose()
+
+    async def __aenter__(self) -> "AsyncDockerSandbox":
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        await self.aclose()
+
+
+class SyncDockerSandbox:
+    """
+    AsyncDockerSandbox的同步外观
+
+    在后台线程中运行一个事件循环，接口与DockerSandbox一致，
+    run_code_stream返回的生成器同样可以通过yield from获取退出码。
+    """
+
+    def __init__(self, **kwargs):
+        """参数与AsyncDockerSandbox相同"""
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="async-sandbox", daemon=True)
+        self._thread.start()
+        self.sandbox: AsyncDockerSandbox = self._call(self._create(kwargs))
+        atexit.register(self.close)
+
+    @staticmethod
+    async def _create(kwargs: Dict[str, Any]) -> AsyncDockerSandbox:
+        # 在事件循环中创建，asyncio.Lock等对象绑定到该循环
+        return AsyncDockerSandbox(**kwargs)
+
+    def _call(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result()
+
+    def create_container(self, force: bool = False, volumes: Optional[Dict[str, Any]] = None,
+                         profile: Optional[str] = None) -> None:
+        self._call(self.sandbox.create_container(force, volumes, profile))
+
+    def run_code_stream(self, code: str, template_file: Optional[str] = None,
+                        job_id: Optional[str] = None, cpu_seconds: Optional[int] = None,
+                        volumes: Optional[Dict[str, Any]] = None,
+                        profile: Optional[str] = None) -> Generator[Tuple[str, str], None, Optional[int]]:
+        outcome: Dict[str, Any] = {}
+        stream = self.sandbox._stream(code, template_file, job_id, cpu_seconds, volumes, profile, outcome)
+        try:
+            while True:
+                try:
+                    item = self._call(stream.__anext__())
+                except StopAsyncIteration:
+                    return outcome.get("exit_code")
+                yield item
+        finally:
+            self._call(stream.aclose())
+
+    def run_code(self, code: str, template_file: Optional[str] = None,
+                 profile: Optional[str] = None) -> Optional[str]:
+        return self._call(self.sandbox.run_code(code, template_file, profile))
+
+    def cancel_job(self, job_id: str) -> bool:
+        return self._call(self.sandbox.cancel_job(job_id))
+
+    def cleanup(self) -> None:
+        if self._loop.is_running():
+            self._call(self.sandbox.cleanup())
+
+    def close(self) -> None:
+        """停止容器并结束后台事件循环"""
+        if not self._loop.is_running():
+            return
+        self._call(self.sandbox.aclose())
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
@@ -0,0 +1,172 @@
+"""
+批量执行问题或脚本
+
+从JSONL文件读取任务，通过容器池和JobScheduler并行执行，结果按完成顺序逐行写入JSONL文件。
+结果文件同时作为断点记录：重新运行时跳过其中已经结束的任务ID，中断后可以直接续跑。
+
+输入文件每行一个JSON对象:
+    {"id": "q1", "question": "今天美国股市的情况如何？"}            # 用默认模板执行的问题
+    {"id": "s1", "script": "print('hello')"}                       # 原样执行的Python脚本
+    {"id": "s2", "file": "agent_code.py"}                          # 相对输入文件所在目录的脚本文件
+可选字段: template(模板文件名)、profile(资源配置档)、timeout(超时秒数)。缺少id时使用行号。
+
+用法:
+    python batch_runner.py questions.jsonl -o results.jsonl --concurrency 4
+"""
+import argparse
+import json
+import os
+import queue
+import time
+from typing import Optional, Dict, Any, List, Iterator, Set
+
+from dockersandbox import DockerSandbox, RAW_TEMPLATE
+from job_scheduler import JobScheduler, Job, SUCCEEDED
+from result_cache import ResultCache
+from sandbox_pool import SandboxPool
+
+
+def read_tasks(path: str) -> Iterator[Dict[str, Any]]:
+    """读取输入文件，产出带id、code、template字段的任务"""
+    base_dir = os.path.dirname(os.path.abspath(path))
+    with open(path, "r", encoding="utf-8") as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            item = json.loads(line)
+            task = {
+                "id": str(item.get("id", f"line-{line_no}")),
+                "profile": item.get("profile"),
+                "timeout": item.get("timeout"),
+            }
+            if "question" in item:
+                task["code"], task["template"] = item["question"], item.get("template")
+            elif "script" in item:
+                task["code"], task["template"] = item["script"], item.get("template", RAW_TEMPLATE)
+            elif "file" in item:
+                with open(os.path.join(base_dir, item["file"]), "r", encoding="utf-8") as script:
+                    task["code"] = script.read()
+                task["template"] = item.get("template", RAW_TEMPLATE)
+            else:
+                raise ValueError(f"{path}第{line_no}行缺少question、script或file字段")
+            yield task
+
+
+def finished_ids(path: str, retry_failed: bool = False) -> Set[str]:
+    """读取已有的结果文件，返回不需要再执行的任务ID(中断时写了一半的行会被忽略)"""
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if not retry_failed or record.get("status") == SUCCEEDED:
+                done.add(record["id"])
+    return done
+
+
+def _result(task_id: str, job: Job) -> Dict[str, Any]:
+    return {
+        "id": task_id,
+        "status": job.status,
+        "exit_code": job.exit_code,
+        "error": job.error,
+        "output": job.output,
+        "duration": round(job.finished_at - job.started_at, 3) if job.started_at else None,
+        "finished_at": job.finished_at,
+    }
+
+
+def run_batch(input_path: str, output_path: str, concurrency: int = 4,
+              timeout: Optional[float] = 1800, profile: Optional[str] = None,
+              retry_failed: bool = False, use_worker: bool = False, snapshot: bool = False,
+              use_cache: bool = False) -> Dict[str, int]:
+    """
+    批量执行输入文件中的任务，结果追加写入output_path
+
+    参数:
+        input_path: 输入JSONL文件
+        output_path: 结果JSONL文件，已存在时跳过其中已结束的任务
+        concurrency: 同时执行的任务数，也是容器池的大小
+        timeout: 每个任务默认的超时秒数
+        profile: 默认的资源配置档
+        retry_failed: 是否重新执行结果文件中未成功的任务
+        use_worker: 是否使用容器内的常驻worker
+        snapshot: 是否从预热快照镜像启动容器
+        use_cache: 是否使用执行结果缓存(见result_cache)，相同的问题直接返回缓存的输出
+
+    返回:
+        各状态的任务数
+    """
+    done = finished_ids(output_path, retry_failed)
+    tasks: List[Dict[str, Any]] = [t for t in read_tasks(input_path) if t["id"] not in done]
+    print(f"共{len(tasks) + len(done)}个任务，跳过已完成的{len(done)}个，待执行{len(tasks)}个")
+    counts: Dict[str, int] = {}
+    if not tasks:
+        return counts
+
+    finished: "queue.Queue[Job]" = queue.Queue()
+    pool = SandboxPool(min_size=min(concurrency, len(tasks)), max_size=concurrency,
+                       warm_worker=use_worker, snapshot=snapshot)
+    sandbox = DockerSandbox(pool=pool, use_worker=use_worker,
+                            result_cache=ResultCache() if use_cache else None)
+    scheduler = JobScheduler(sandbox, max_concurrency=concurrency, max_queue=len(tasks),
+                             default_timeout=timeout, on_finish=finished.put)
+    task_ids: Dict[str, str] = {}  # 调度器任务ID -> 输入中的任务ID
+    try:
+        for task in tasks:
+            options = {"profile": task["profile"] or profile}
+            job_id = scheduler.submit(task["code"], task["template"], timeout=task["timeout"], **options)
+            task_ids[job_id] = task["id"]
+
+        start = time.time()
+        with open(output_path, "a", encoding="utf-8") as out:
+            for index in range(1, len(tasks) + 1):
+                job = finished.get()
+                record = _result(task_ids[job.id], job)
+                # 每个结果单独一行并立即刷新，中断后可以从结果文件续跑
+                out.write(json.dumps(record, ensure_ascii=False) + "\n")
+                out.flush()
+                counts[job.status] = counts.get(job.status, 0) + 1
+                print(f"[{index}/{len(tasks)}] {record['id']}: {job.status} "
+                      f"({time.time() - start:.1f}s)", flush=True)
+    finally:
+        scheduler.shutdown()
+        pool.close()
+    return counts
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="在Docker沙盒中批量执行问题或脚本")
+    parser.add_argument("input", help="输入JSONL文件")
+    parser.add_argument("-o", "--output", help="结果JSONL文件(默认为<输入文件名>.results.jsonl)")
+    parser.add_argument("--concurrency", type=int, default=4, help="同时执行的任务数(默认4)")
+    parser.add_argument("--timeout", type=float, default=1800, help="每个任务的超时秒数(默认1800)")
+    parser.add_argument("--profile", default=None, help="默认的资源配置档")
+    parser.add_argument("--retry-failed", action="store_true", help="重新执行未成功的任务")
+    parser.add_argument("--worker", action="store_true", help="使用容器内的常驻worker")
+    parser.add_argument("--snapshot", action="store_true", help="从预热快照镜像启动容器")
+    parser.add_argument("--cache", action="store_true", help="使用执行结果缓存")
+    return parser.parse_args()
+
+
+def default_output_path(input_path: str) -> str:
+    root, _ = os.path.splitext(input_path)
+    return f"{root}.results.jsonl"
+
+
+def main():
+    args = parse_args()
+    counts = run_batch(args.input, args.output or default_output_path(args.input),
+                       concurrency=args.concurrency, timeout=args.timeout, profile=args.profile,
+                       retry_failed=args.retry_failed, use_worker=args.worker, snapshot=args.snapshot,
+                       use_cache=args.cache)
+    print("批量执行结束:", ", ".join(f"{status} {n}" for status, n in sorted(counts.items())) or "无任务")
+
+
+if __name__ == "__main__":
+    main()
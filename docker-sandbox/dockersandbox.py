@@ -8,15 +8,238 @@ Docker沙盒实现模块
 4. 禁止特权提升
 5. 移除所有Linux capabilities
 6. 以nobody用户身份运行代码
+
+配合sandbox_pool.SandboxPool使用时，每次执行从预热的容器池中租用容器。
 """
 import os
 import atexit
+import asyncio
+import codecs
+import shlex
+import threading
 import docker
+import time
+from contextlib import contextmanager, ExitStack
+from docker.models.containers import Container
 from dotenv import load_dotenv
-from typing import Optional, Dict, Any
+import staging
+import sandbox_metrics
+from sandbox_metrics import JobTrace, MetricsRegistry, StatsSampler
+from sandbox_image import resolve_image, context_hash
+from result_cache import ResultCache, CACHE_ROOT
+from sandbox_snapshot import resolve_snapshot
+from resource_profiles import ResourceProfile, get_profile, apply_profile
+from template_registry import TemplateRegistry
+from typing import (Optional, Dict, Any, Iterator, AsyncIterator, Generator,
+                    List, Tuple, Hashable, TYPE_CHECKING)
+
+if TYPE_CHECKING:
+    from sandbox_pool import SandboxPool
 
 load_dotenv()  # 加载环境变量
 
+DEFAULT_TEMPLATE = "default.tmpl"
+# 常驻worker模式使用的模板，复用worker中已初始化的模型和工具
+WORKER_TEMPLATE = "worker.tmpl"
+# 原样执行代码的模板，用于运行完整的脚本
+RAW_TEMPLATE = "raw.tmpl"
+
+# 稳定父目录在容器内的挂载点(同一主机目录分别以只读和读写方式挂载)，
+# 每个任务通过符号链接把/workdir/input等路径切换到其中的子目录
+WORKDIR_MOUNT_RO = "/mnt/workdir-ro"
+WORKDIR_MOUNT_RW = "/mnt/workdir"
+
+# 共享HTTP抓取缓存在容器内的挂载点(见agent_runtime.http_cache)，
+# 主机目录为<SANDBOX_CACHE_DIR>/http，所有容器共用；设置SANDBOX_HTTP_CACHE=0时不挂载
+HTTP_CACHE_MOUNT = "/cache/http"
+# 容器内模型调用缓存(agent_runtime.model_cache)的挂载点
+MODEL_CACHE_MOUNT = "/cache/model"
+
+# arun_code_stream中表示输出结束的哨兵对象
+_STREAM_END = object()
+
+
+def start_sandbox_container(client: docker.DockerClient, volumes: Dict[str, Any],
+                            profile: Optional[ResourceProfile] = None,
+                            snapshot: bool = False) -> Container:
+    """
+    以沙盒安全约束启动一个常驻的py-sandbox容器
+
+    参数:
+        client: Docker客户端实例
+        volumes: 卷配置，格式为{"主机路径": {"bind": "容器路径", "mode": "rw/ro"}}
+        profile: 资源配置档(内存、CPU、进程数上限)，默认为default配置档
+        snapshot: 是否从预热快照镜像启动(见sandbox_snapshot)
+
+    返回:
+        已启动的容器实例
+
+    异常:
+        docker.errors.BuildError: 镜像构建失败
+        docker.errors.APIError: 容器创建失败
+    """
+    profile = get_profile(profile)
+    with sandbox_metrics.phase("image_resolve"):
+        image = resolve_snapshot(client) if snapshot else resolve_image(client)
+    try:
+        # 创建并启动容器
+        with sandbox_metrics.phase("container_start"):
+            return client.containers.run(
+                image,
+                command="tail -f /dev/null",  # 保持容器运行
+                detach=True,
+                tty=True,
+                **profile.run_kwargs(),  # 内存限制、CPU配额、进程数限制
+                security_opt=["no-new-privileges"],  # 禁止特权提升
+                cap_drop=["ALL"],  # 移除所有Linux capabilities
+                environment=container_environment(),
+                volumes={**volumes, **shared_cache_volumes()},
+                auto_remove=True  # 容器退出时自动删除
+            )
+    except docker.errors.APIError as e:
+        print(f"创建沙盒时发生错误: {str(e)}")
+        raise
+
+
+def volumes_key(volumes: Dict[str, Any]) -> Hashable:
+    """把卷配置规范化为可比较的键"""
+    return tuple(sorted(
+        (os.path.abspath(host), spec["bind"], spec.get("mode", "rw"))
+        for host, spec in volumes.items()
+    ))
+
+
+def stable_root_volumes(host_root: str) -> Dict[str, Any]:
+    """
+    返回绑定稳定父目录的卷配置
+
+    父目录分别以只读和读写方式挂载一次，容器创建后不再因为任务目录变化而重建。
+    """
+    host_root = os.path.abspath(host_root)
+    return {
+        host_root: {'bind': WORKDIR_MOUNT_RW, 'mode': 'rw'},
+        # 同一主机目录不能作为字典的两个键，只读挂载通过带/.的等价路径表示
+        os.path.join(host_root, '.'): {'bind': WORKDIR_MOUNT_RO, 'mode': 'ro'},
+    }
+
+
+def subpath_links(host_root: str, volumes: Dict[str, Any]) -> Optional[List[Tuple[str, str]]]:
+    """
+    把位于稳定父目录下的卷配置转换为容器内的符号链接
+
+    参数:
+        host_root: 稳定父目录
+        volumes: 任务需要的卷配置
+
+    返回:
+        [(容器内路径, 链接目标)]，有目录不在host_root下时返回None
+    """
+    host_root = os.path.abspath(host_root)
+    links = []
+    for host_path, spec in volumes.items():
+        rel_path = os.path.relpath(os.path.abspath(host_path), host_root)
+        if rel_path == os.pardir or rel_path.startswith(os.pardir + os.sep):
+            return None
+        mount = WORKDIR_MOUNT_RO if spec.get("mode", "rw") == "ro" else WORKDIR_MOUNT_RW
+        target = mount if rel_path == os.curdir else f"{mount}/{rel_path.replace(os.sep, '/')}"
+        links.append((spec["bind"], target))
+    return links
+
+
+def job_command(code: str, use_worker: bool = False, job_id: Optional[str] = None,
+                cpu_seconds: Optional[int] = None) -> List[str]:
+    """
+    构造在容器中执行代码的命令
+
+    参数:
+        code: 渲染后的Python代码
+        use_worker: 是否把代码交给常驻worker执行
+        job_id: 可选的任务ID，设置后通过job_launcher在独立进程组中运行
+        cpu_seconds: 可选的CPU时间上限(秒)
+    """
+    if use_worker:
+        # 通过exec运行的客户端把代码转发给常驻worker，worker未运行时自动启动
+        cmd = ["python", "-m", "agent_runtime.worker_client", code]
+    else:
+        cmd = ["python", "-c", code]
+    if job_id is None:
+        return cmd
+    # 带任务ID时通过启动器在独立进程组中运行，便于单独取消
+    launcher = ["python", "-m", "agent_runtime.job_launcher", "--job-id", job_id]
+    if cpu_seconds:
+        launcher += ["--cpu-seconds", str(int(cpu_seconds))]
+    return launcher + ["--"] + cmd
+
+
+def http_cache_enabled() -> bool:
+    return os.getenv("SANDBOX_HTTP_CACHE", "1") != "0"
+
+
+def model_cache_mode() -> Optional[str]:
+    """容器内模型调用缓存的模式，取自主机的AGENT_MODEL_CACHE，passthrough视为不使用"""
+    mode = os.getenv("AGENT_MODEL_CACHE")
+    return mode if mode and mode != "passthrough" else None
+
+
+def _shared_dir(name: str) -> str:
+    host_dir = os.path.join(CACHE_ROOT, name)
+    os.makedirs(host_dir, exist_ok=True)
+    try:
+        # 容器内以nobody用户写入缓存
+        os.chmod(host_dir, 0o777)
+    except OSError:
+        pass
+    return host_dir
+
+
+def shared_cache_volumes() -> Dict[str, Any]:
+    """所有沙盒容器共享的缓存目录挂载，不参与容器池的卷配置匹配"""
+    volumes = {}
+    if http_cache_enabled():
+        volumes[_shared_dir("http")] = {'bind': HTTP_CACHE_MOUNT, 'mode': 'rw'}
+    if model_cache_mode():
+        # 与主机上agent_runtime.model_cache的默认缓存文件位于同一目录，主机脚本和容器共用录制的响应
+        volumes[_shared_dir("model")] = {'bind': MODEL_CACHE_MOUNT, 'mode': 'rw'}
+    return volumes
+
+
+def container_environment() -> Dict[str, Optional[str]]:
+    """传入沙盒容器的环境变量"""
+    env = {
+        "OPENAI_TOKEN": os.getenv("OPENAI_TOKEN"),
+        "MODEL_NAME": os.getenv("MODEL_NAME"),
+        "PROXY": os.getenv("PROXY_IN_DOCKER")
+    }
+    if http_cache_enabled():
+        env["AGENT_HTTP_CACHE_DIR"] = HTTP_CACHE_MOUNT
+    if os.getenv("SANDBOX_MEMORY_EXPORT") == "1":
+        # 模板结束时把完整的智能体记忆压缩写入/app/output/agent_memory.jsonl.gz
+        env["AGENT_MEMORY_EXPORT"] = "1"
+    # 模型后端的选择(见agent_runtime.models)原样传入容器
+    for name in ("AGENT_MODEL_BACKEND", "AGENT_MODEL_SCRIPT", "AGENT_MODEL_LATENCY", "AGENT_MODEL_API_BASE"):
+        if os.getenv(name):
+            env[name] = os.environ[name]
+    if os.getenv("AGENT_MODEL_GATEWAY_IN_DOCKER"):
+        # 容器内经主机上的共享模型网关访问模型，与PROXY_IN_DOCKER一样使用容器内可达的地址
+        env["AGENT_MODEL_GATEWAY"] = os.environ["AGENT_MODEL_GATEWAY_IN_DOCKER"]
+    if model_cache_mode():
+        env["AGENT_MODEL_CACHE"] = model_cache_mode()
+        env["AGENT_MODEL_CACHE_PATH"] = f"{MODEL_CACHE_MOUNT}/responses.sqlite"
+    if os.getenv("SANDBOX_STEP_TRACE") == "1":
+        # 每一步的token和耗时追加到/app/output/agent_trace.jsonl(见agent_runtime.step_trace)
+        env["AGENT_STEP_TRACE"] = "/app/output/agent_trace.jsonl"
+    return env
+
+
+def default_workspace_volumes() -> Dict[str, Any]:
+    """返回默认的工作目录卷配置"""
+    return {
+        os.path.abspath('./workspace'): {
+            'bind': '/app/output',  # 挂载到容器内的/app/output目录
+            'mode': 'rw'  # 读写模式
+        }
+    }
+
 
 class DockerSandbox:
     """
@@ -24,20 +247,56 @@ class DockerSandbox:
     
     属性:
         client: Docker客户端实例
-        container: 当前运行的容器实例
+        container: 当前运行的容器实例(未使用容器池时)
+        pool: 可选的容器池，设置后每次run_code从池中租用容器
+        templates: code_template/目录的模板注册表
+        use_worker: 是否通过容器内的常驻worker执行代码
+        metrics: 记录每个任务阶段耗时和资源使用的指标注册表
     """
     
-    def __init__(self):
-        """初始化Docker沙盒"""
+    def __init__(self, pool: Optional["SandboxPool"] = None, use_worker: bool = False,
+                 workdir_root: Optional[str] = None, staging: bool = False,
+                 metrics: Optional[MetricsRegistry] = None, snapshot: bool = False,
+                 result_cache: Optional[ResultCache] = None):
+        """
+        初始化Docker沙盒
+
+        参数:
+            pool: 可选的SandboxPool，设置后run_code不再使用单个共享容器
+            use_worker: 为True时代码交给容器内常驻的agent_runtime.worker执行，
+                        默认模板改为worker.tmpl
+            workdir_root: 可选的稳定父目录。容器只挂载一次该目录(见stable_root_volumes)，
+                          任务的卷配置位于其下时通过符号链接切换子目录，无需重建容器
+            staging: 为True时容器不绑定任何主机目录，卷配置中的目录在执行前通过tar流
+                     同步进容器，执行后把读写目录同步回主机(见staging模块)。
+                     此时配合使用的SandboxPool应设置volumes={}
+            metrics: 可选的指标注册表，默认使用sandbox_metrics.REGISTRY
+            snapshot: 未使用容器池时，是否从预热快照镜像启动容器(容器池通过SandboxPool(snapshot=True)设置)
+            result_cache: 可选的执行结果缓存，相同的渲染代码、模型和工具集直接返回缓存的输出
+        """
         self.client = docker.from_env()  # 创建Docker客户端
         self.container = None  # 当前容器实例
+        self._container_key = None  # 当前容器的卷配置键
+        self._container_profile = None  # 当前容器的资源配置档
+        self.pool = pool
+        self.workdir_root = os.path.abspath(workdir_root) if workdir_root else None
+        self.templates = TemplateRegistry()  # 已编译代码模板的缓存
+        self.use_worker = use_worker
+        self.default_template = WORKER_TEMPLATE if use_worker else DEFAULT_TEMPLATE
+        self._job_containers: Dict[str, Container] = {}  # 执行中的任务ID -> 所在容器
+        self._jobs_lock = threading.Lock()
         atexit.register(self.cleanup)  # 注册退出时清理函数
-        self.default_volumes = {
-            os.path.abspath('./workspace'): {
-                'bind': '/app/output',  # 挂载到容器内的/workdir目录
-                'mode': 'rw'  # 读写模式
-            }
-        }
+        self.staging = staging
+        self.metrics = metrics or sandbox_metrics.REGISTRY
+        self.snapshot = snapshot
+        self.result_cache = result_cache
+        if staging:
+            # 容器本身不挂载目录，默认工作目录改为通过tar流暂存
+            self.default_volumes = {}
+            self.stage_volumes = default_workspace_volumes()
+        else:
+            self.default_volumes = (stable_root_volumes(self.workdir_root) if self.workdir_root
+                                    else default_workspace_volumes())
         self.default_code_template = """
 
         """
@@ -48,107 +307,351 @@ class DockerSandbox:
         self.cleanup()
         print("沙盒清理完毕。")
     
-    def create_container(self, force = False, volumes: Optional[Dict[str, Any]] = None) -> None:
+    def create_container(self, force = False, volumes: Optional[Dict[str, Any]] = None,
+                         profile: Optional[str] = None) -> None:
         """
         创建并启动Docker容器
+
+        运行中的容器卷配置与请求一致时不做任何操作，只有资源配置档不同时通过container.update()
+        原地调整；卷配置不同、配置档无法原地调整或force为True时重建容器。
         
         参数:
+            force: 是否强制重建容器
             volumes: 可选的自定义卷配置，格式为{"主机路径": {"bind": "容器路径", "mode": "rw/ro"}}
+            profile: 资源配置档名称(见resource_profiles)，默认为default
                     
         异常:
             docker.errors.BuildError: 镜像构建失败
             docker.errors.APIError: 容器创建失败
         """
-        try:
-            # 检查镜像是否存在
-            existing_images = self.client.images.list(name="py-sandbox")
-            if not existing_images:
-                print("开始构建py-sandbox...")
-                # 构建新镜像
-                dockerfile_path = os.path.join(os.path.dirname(__file__), 'Dockerfile')
-                image, _ = self.client.images.build(
-                    path=os.path.dirname(__file__),
-                    dockerfile=dockerfile_path,
-                    tag="py-sandbox",
-                    rm=True,
-                    forcerm=True,
-                    buildargs={}
-                )
-            else:
-                # 使用现有镜像
-                image = existing_images[0]
-        except docker.errors.BuildError as e:
-            print("构建错误日志:")
-            for log in e.build_log:
-                if 'stream' in log:
-                    print(log['stream'].strip())
-            raise
-
         # 设置默认卷配置
         if volumes is None:
             volumes = self.default_volumes
-            print("使用默认卷配置。")
-        else:
-            print("使用自定义卷配置。")
+        key = volumes_key(volumes)
+        profile = get_profile(profile)
+        if self.container and not force and key == self._container_key and self._is_running():
+            if profile == self._container_profile:
+                return
+            try:
+                if apply_profile(self.container, self._container_profile, profile):
+                    print(f"沙盒资源配置已调整为: {profile.name}")
+                    self._container_profile = profile
+                    return
+            except docker.errors.APIError as e:
+                print(f"调整沙盒资源配置失败，将重建沙盒: {e}")
+        print("使用默认卷配置。" if volumes is self.default_volumes else "使用自定义卷配置。")
         print(volumes) 
+        if self.container:
+            print("正在销毁沙盒...")
+            self.cleanup()
+        self.container = start_sandbox_container(self.client, volumes, profile, self.snapshot)
+        self._container_key = key
+        self._container_profile = profile
+        print("沙盒创建成功。") 
+
+    def _is_running(self) -> bool:
+        """检查当前容器是否仍在运行"""
         try:
-            if (not self.container) or force:
-                if self.container:
-                    print("正在销毁沙盒...")
-                    self.container.cleanup()
-                # 创建并启动容器
-                self.container = self.client.containers.run(
-                    "py-sandbox",
-                    command="tail -f /dev/null",  # 保持容器运行
-                    detach=False,
-                    tty=True,
-                    mem_limit="512m",  # 内存限制
-                    cpu_quota=50000,  # CPU配额
-                    pids_limit=100,  # 进程数限制
-                    security_opt=["no-new-privileges"],  # 禁止特权提升
-                    cap_drop=["ALL"],  # 移除所有Linux capabilities
-                    environment={
-                        "OPENAI_TOKEN": os.getenv("OPENAI_TOKEN"),
-                        "MODEL_NAME": os.getenv("MODEL_NAME"),
-                        "PROXY": os.getenv("PROXY_IN_DOCKER")
-                    },
-                    volumes=volumes,
-                    auto_remove=True  # 容器退出时自动删除
-                )
-                print("沙盒创建成功。") 
-        except docker.errors.APIError as e:
-            print(f"创建沙盒时发生错误: {str(e)}")
-            raise
+            self.container.reload()
+            return self.container.status == "running"
+        except docker.errors.APIError:
+            return False
+
+    def _resolve_volumes(self, volumes: Optional[Dict[str, Any]]):
+        """
+        决定任务实际使用的卷配置
+
+        返回:
+            (容器卷配置, 符号链接列表, 需要tar暂存的卷配置)。
+            暂存模式下容器不挂载目录；任务目录都位于workdir_root下时复用稳定父目录的挂载，
+            通过符号链接切换子目录；否则直接绑定任务目录。
+        """
+        if self.staging:
+            return self.default_volumes, None, (self.stage_volumes if volumes is None else volumes)
+        if volumes is None or not self.workdir_root:
+            return volumes, None, None
+        links = subpath_links(self.workdir_root, volumes)
+        if links is None:
+            return volumes, None, None
+        return self.default_volumes, links, None
+
+    @staticmethod
+    def _stage_in(container: Container, volumes: Dict[str, Any]) -> None:
+        """执行前把卷配置中的主机目录同步到容器"""
+        for host_dir, spec in volumes.items():
+            os.makedirs(host_dir, exist_ok=True)
+            staging.push_dir(container, host_dir, spec["bind"])
+
+    @staticmethod
+    def _stage_out(container: Container, volumes: Dict[str, Any]) -> None:
+        """执行后把读写目录同步回主机，只读目录不回传"""
+        for host_dir, spec in volumes.items():
+            if spec.get("mode", "rw") == "rw":
+                staging.pull_dir(container, spec["bind"], host_dir)
+
+    @contextmanager
+    def lease_container(self, volumes: Optional[Dict[str, Any]] = None,
+                        profile: Optional[str] = None) -> Iterator[Container]:
+        """
+        获取一个用于执行任务的容器
+
+        配置了容器池时从池中租用一个(卷配置和资源配置档匹配的)预热容器，用完后归还；
+        否则使用(必要时创建或调整)沙盒自身持有的单个容器。
+
+        参数:
+            volumes: 可选的卷配置，默认使用池或沙盒的默认卷配置
+            profile: 可选的资源配置档名称，默认使用池的配置档或default
+        """
+        if self.pool is not None:
+            with self.pool.lease(volumes=volumes, profile=profile) as container:
+                yield container
+            return
+        if not self.container:
+            print("沙盒不存在，尝试创建...")
+            self.create_container(volumes=volumes, profile=profile)
+        elif volumes is not None or get_profile(profile) != self._container_profile:
+            # 配置相同时不会重建容器
+            self.create_container(volumes=volumes, profile=profile)
+        yield self.container
     
-    def run_code(self, code: str, template_file: str = "default.tmpl") -> str:
+    def _render_code(self, code: str, template_file: str) -> str:
+        """使用code_template/中的代码模板把问题渲染成要在容器中执行的脚本"""
+        return self.templates.render(template_file, question=code)
+
+    @staticmethod
+    def _exec_stream(container: Container, cmd: List[str], user: str = "nobody",
+                     trace: Optional[JobTrace] = None) -> Generator[Tuple[str, str], None, Optional[int]]:
+        """
+        在容器中执行命令并逐块产出输出
+
+        设置trace时把解码输出所用的时间累计到其output_decode阶段
+
+        产出:
+            (流名称, 文本块)，流名称为"stdout"或"stderr"
+
+        返回:
+            命令的退出码
+        """
+        api = container.client.api
+        exec_id = api.exec_create(container.id, cmd, stdout=True, stderr=True, user=user)["Id"]
+        # 多字节UTF-8字符可能被拆分到两个数据块中，使用增量解码器
+        decoders = {name: codecs.getincrementaldecoder("utf-8")(errors="replace")
+                    for name in ("stdout", "stderr")}
+        decode_seconds = 0.0
+        for stdout, stderr in api.exec_start(exec_id, stream=True, demux=True):
+            for name, data in (("stdout", stdout), ("stderr", stderr)):
+                if data:
+                    start = time.perf_counter()
+                    text = decoders[name].decode(data)
+                    decode_seconds += time.perf_counter() - start
+                    if text:
+                        yield name, text
+        if trace is not None:
+            trace.add("output_decode", decode_seconds)
+        for name, decoder in decoders.items():
+            text = decoder.decode(b"", final=True)
+            if text:
+                yield name, text
+        return api.exec_inspect(exec_id).get("ExitCode")
+
+    def _job_command(self, code: str, job_id: Optional[str] = None,
+                     cpu_seconds: Optional[int] = None) -> List[str]:
+        """构造在容器中执行代码的命令"""
+        return job_command(code, self.use_worker, job_id, cpu_seconds)
+
+    def run_code_stream(self, code: str, template_file: Optional[str] = None,
+                        job_id: Optional[str] = None, cpu_seconds: Optional[int] = None,
+                        volumes: Optional[Dict[str, Any]] = None,
+                        profile: Optional[str] = None,
+                        use_cache: bool = True) -> Generator[Tuple[str, str], None, Optional[int]]:
+        """
+        在容器中执行代码，边执行边产出输出
+
+        参数:
+            code: 要执行的Python代码字符串
+            template_file: code_template/下用于包装代码的模板文件名，默认为default_template
+            job_id: 可选的任务ID，设置后可以通过cancel_job单独结束该任务
+            cpu_seconds: 可选的CPU时间上限(秒)，需要同时设置job_id
+            volumes: 可选的卷配置，使用容器池时租用配置匹配的容器
+            profile: 可选的资源配置档名称(small/default/pandas-heavy/browser，见resource_profiles)
+            use_cache: 设置了result_cache时是否使用缓存，False表示绕过缓存重新执行
+
+        产出:
+            (流名称, 文本块)，流名称为"stdout"或"stderr"
+
+        返回:
+            代码的退出码(可通过yield from获取)
+
+        每个任务的阶段耗时和资源采样在结束时记录到self.metrics
+        """
+        template_file = template_file or self.default_template
+        trace = JobTrace(job_id, template_file, get_profile(profile).name)
+        status, exit_code = "error", None
+        try:
+            with trace.phase("render"):
+                code = self._render_code(code, template_file)
+            cache_key = self._cache_key(code) if self.result_cache is not None and use_cache else None
+            if cache_key:
+                with trace.phase("cache_lookup"):
+                    cached = self.result_cache.get(cache_key)
+                if cached is not None:
+                    yield from cached.chunks
+                    status, exit_code = "cache_hit", cached.exit_code
+                    return exit_code
+            chunks: List[Tuple[str, str]] = []
+            stream = self._run_traced(code, job_id, cpu_seconds, volumes, profile, trace)
+            while True:
+                try:
+                    item = next(stream)
+                except StopIteration as stop:
+                    exit_code = stop.value
+                    break
+                if cache_key:
+                    chunks.append(item)
+                try:
+                    yield item
+                except GeneratorExit:
+                    stream.close()
+                    raise
+            status = "succeeded" if exit_code == 0 else "failed"
+            if cache_key and exit_code == 0:
+                self.result_cache.put(cache_key, chunks, exit_code)
+            return exit_code
+        except GeneratorExit:
+            # 消费方提前关闭了输出流
+            status = "aborted"
+            raise
+        finally:
+            trace.finish(status, exit_code)
+            self.metrics.record(trace)
+
+    def _cache_key(self, rendered_code: str) -> str:
+        """结果缓存的键：渲染后的代码、模型名称和工具集(执行方式+镜像内容哈希)"""
+        tool_set = f"{'worker' if self.use_worker else 'direct'}:{context_hash()}"
+        model = os.getenv("MODEL_NAME")
+        if os.getenv("AGENT_MODEL_BACKEND"):
+            # 不同的模型后端(如scripted回放)不共用缓存
+            model = f"{os.environ['AGENT_MODEL_BACKEND']}:{model}"
+        return self.result_cache.key(rendered_code, model, tool_set)
+
+    def _run_traced(self, code: str, job_id: Optional[str],
+                    cpu_seconds: Optional[int], volumes: Optional[Dict[str, Any]],
+                    profile: Optional[str], trace: JobTrace) -> Generator[Tuple[str, str], None, Optional[int]]:
+        """在容器中执行已渲染的代码，各阶段耗时记录到trace"""
+        # 在容器中执行代码，以非特权用户运行
+        cmd = self._job_command(code, job_id, cpu_seconds)
+        volumes, links, staged = self._resolve_volumes(volumes)
+        if links:
+            # 在同一次exec中先切换子目录链接再执行任务，不增加额外的往返
+            script = " && ".join(
+                f"mkdir -p {shlex.quote(os.path.dirname(path))} && ln -sfn {shlex.quote(target)} {shlex.quote(path)}"
+                for path, target in links
+            )
+            cmd = ["sh", "-c", f'{script} && exec "$@"', "sh"] + cmd
+        with ExitStack() as stack:
+            # 容器启动发生在租用过程中，镜像解析和启动的耗时由start_sandbox_container记录
+            with trace.phase("container_acquire"), sandbox_metrics.activate(trace):
+                container = stack.enter_context(self.lease_container(volumes, profile))
+            if staged:
+                with trace.phase("stage_in"):
+                    self._stage_in(container, staged)
+            if job_id is not None:
+                with self._jobs_lock:
+                    self._job_containers[job_id] = container
+            sampler = StatsSampler(container).start()
+            try:
+                with trace.phase("exec"):
+                    exit_code = yield from self._exec_stream(container, cmd, trace=trace)
+            finally:
+                trace.resources = sampler.stop()
+                if job_id is not None:
+                    with self._jobs_lock:
+                        self._job_containers.pop(job_id, None)
+            if staged:
+                with trace.phase("stage_out"):
+                    self._stage_out(container, staged)
+        return exit_code
+
+    def cancel_job(self, job_id: str) -> bool:
+        """
+        结束一个正在执行的任务(整个进程组)，容器保持运行
+
+        参数:
+            job_id: run_code_stream时指定的任务ID
+
+        返回:
+            是否找到并结束了该任务
+        """
+        with self._jobs_lock:
+            container = self._job_containers.get(job_id)
+        if container is None:
+            return False
+        result = container.exec_run(
+            cmd=["python", "-m", "agent_runtime.job_launcher", "--kill", job_id],
+            user="nobody"
+        )
+        return result.exit_code == 0
+
+    async def arun_code_stream(self, code: str,
+                               template_file: Optional[str] = None) -> AsyncIterator[Tuple[str, str]]:
+        """
+        run_code_stream的异步版本，在线程池中执行阻塞的Docker调用
+
+        产出:
+            (流名称, 文本块)，流名称为"stdout"或"stderr"
+        """
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+        stopped = threading.Event()
+
+        def emit(item):
+            if not loop.is_closed():
+                loop.call_soon_threadsafe(queue.put_nowait, item)
+
+        def pump():
+            stream = self.run_code_stream(code, template_file)
+            try:
+                for item in stream:
+                    if stopped.is_set():
+                        break
+                    emit(item)
+            except BaseException as e:
+                emit(e)
+            finally:
+                stream.close()
+                emit(_STREAM_END)
+
+        loop.run_in_executor(None, pump)
+        try:
+            while True:
+                item = await queue.get()
+                if item is _STREAM_END:
+                    break
+                if isinstance(item, BaseException):
+                    raise item
+                yield item
+        finally:
+            # 消费方提前退出时通知后台线程停止读取
+            stopped.set()
+
+    def run_code(self, code: str, template_file: Optional[str] = None,
+                 profile: Optional[str] = None, use_cache: bool = True) -> str:
         """
         在容器中执行代码
         
         参数:
             code: 要执行的Python代码字符串
+            template_file: code_template/下用于包装代码的模板文件名，默认为default_template
+            profile: 可选的资源配置档名称，如pandas-heavy
+            use_cache: 设置了result_cache时是否使用缓存
             
         返回:
             代码执行输出，如果无输出则返回None
         """
-        if not self.container:
-            print("沙盒不存在，尝试创建...")
-            self.create_container()
-
-        
-        # 从code_template/default.py 中读取代码模板,使用Jinja2渲染模板
-        from jinja2 import Template
-        with open(os.path.join(os.path.dirname(__file__), 'code_template/default.tmpl'), 'r',encoding='utf-8') as f:
-            template = Template(f.read())
-            code = template.render(question=code)
-
-        # 在容器中执行代码
-        exec_result = self.container.exec_run(
-            cmd=["python", "-c", code],
-            user="nobody"  # 以非特权用户运行
-        )
-
+        output = "".join(text for _, text in self.run_code_stream(code, template_file, profile=profile,
+                                                                  use_cache=use_cache))
         # 返回执行结果
-        return exec_result.output.decode() if exec_result.output else None
+        return output or None
     
     def cleanup(self) -> None:
         """
@@ -4,8 +4,13 @@ import docker
 from dotenv import load_dotenv
 load_dotenv()
 
-import atexit
-from dockersandbox import DockerSandbox
+import uuid
+from dockersandbox import DockerSandbox, stable_root_volumes
+from job_scheduler import JobScheduler, SUCCEEDED
+from sandbox_pool import SandboxPool
+from sandbox_metrics import start_metrics_server
+from resource_profiles import PROFILES, DEFAULT_PROFILE
+from result_cache import ResultCache
 
 
 
@@ -35,9 +40,54 @@ print("处理完成，输出已保存到输出目录。")
     def __init__(self):
         self._init_directories()
         self.docker_available = self._check_docker_available()
-        self.sandbox = DockerSandbox() if self.docker_available else None
+        # 每次执行从容器池租用容器，不同会话的任务互不干扰；池大小同时决定并发上限。
+        # 池中容器只挂载稳定父目录tmp/，会话目录位于其下时按任务切换子目录，
+        # 切换目录不需要重建容器，预热的容器可以服务所有会话
+        # 设置SANDBOX_STAGING=1时不使用绑定挂载，目录通过tar流同步，任意主机目录都可以使用预热容器
+        self.pool_size = int(os.getenv("SANDBOX_POOL_MAX", "4"))
+        use_staging = os.getenv("SANDBOX_STAGING", "0") == "1"
+        # 设置SANDBOX_SNAPSHOT=1时池中容器从预热快照镜像启动
+        self.pool = SandboxPool(
+            min_size=min(int(os.getenv("SANDBOX_POOL_MIN", "1")), self.pool_size),
+            max_size=self.pool_size,
+            volumes={} if use_staging else stable_root_volumes(self.workdir_root),
+            snapshot=os.getenv("SANDBOX_SNAPSHOT", "0") == "1"
+        ) if self.docker_available else None
+        # 设置SANDBOX_RESULT_CACHE=1时相同的代码直接返回缓存的输出(不会重新生成输出目录中的文件)
+        self.sandbox = DockerSandbox(
+            pool=self.pool, workdir_root=self.workdir_root, staging=use_staging,
+            result_cache=ResultCache() if os.getenv("SANDBOX_RESULT_CACHE", "0") == "1" else None
+        ) if self.docker_available else None
+        # 任务超时时间(秒)，可通过环境变量SANDBOX_JOB_TIMEOUT调整
+        self.scheduler = JobScheduler(
+            self.sandbox, max_concurrency=self.pool_size,
+            default_timeout=float(os.getenv("SANDBOX_JOB_TIMEOUT", "1800"))
+        ) if self.sandbox else None
         os.makedirs(self.CODE_DIR, exist_ok=True)
-        self.selected_file = None  # 存储当前选中的文件名
+
+    @staticmethod
+    def new_session_state():
+        """
+        单个浏览器会话的状态，通过gr.State为每个会话单独保存
+
+        各处理函数直接修改这个字典，保证执行中的任务ID对停止按钮立即可见。
+        """
+        return {
+            "session_id": None,
+            "input_dir": None,
+            "output_dir": None,
+            "selected_file": None,  # 当前选中的文件名
+            "job_id": None,  # 当前正在执行的任务ID
+        }
+
+    def init_session(self, state):
+        """页面加载时初始化会话：输入目录默认共享(只读挂载)，输出目录每个会话独立"""
+        if not state.get("session_id"):
+            state["session_id"] = uuid.uuid4().hex[:12]
+            state["input_dir"] = self.input_dir
+            state["output_dir"] = os.path.join(self.sessions_dir, state["session_id"], "output")
+            os.makedirs(state["output_dir"], exist_ok=True)
+        return state, state["input_dir"], state["output_dir"]
 
     def get_python_files(self):
         """获取code目录下的Python文件列表"""
@@ -69,10 +119,13 @@ print("处理完成，输出已保存到输出目录。")
 
     def _init_directories(self):
         """初始化输入输出目录"""
-        self.input_dir = os.path.abspath('./docker-sandbox/tmp/input')
-        self.output_dir = os.path.abspath('./docker-sandbox/tmp/output')
+        self.workdir_root = os.path.abspath('./docker-sandbox/tmp')
+        self.input_dir = os.path.join(self.workdir_root, 'input')
+        self.output_dir = os.path.join(self.workdir_root, 'output')
+        self.sessions_dir = os.path.join(self.workdir_root, 'sessions')
         os.makedirs(self.input_dir, exist_ok=True)
         os.makedirs(self.output_dir, exist_ok=True)
+        os.makedirs(self.sessions_dir, exist_ok=True)
 
     def _check_docker_available(self):
         """检查Docker服务是否可用"""
@@ -82,58 +135,66 @@ print("处理完成，输出已保存到输出目录。")
         except Exception:
             return False
 
-    def update_directory(self, new_dir, is_input=True):
-        """更新目录路径"""
+    def update_directory(self, new_dir, state, is_input=True):
+        """
+        更新当前会话的目录路径，下次执行时生效
+
+        不会停止或重建容器：tmp/下的目录通过符号链接切换，
+        其他目录在执行时租用单独绑定该目录的容器
+        """
         if not new_dir or not os.path.isdir(new_dir):
             return f"无效的目录: {new_dir}"
         
         if is_input:
-            self.input_dir = new_dir
-            # 更新Docker卷配置
-            if self.sandbox and self.sandbox.container:
-                volumes = self._prepare_volumes()
-                self.sandbox.cleanup()  # 停止当前容器
-                self.sandbox.create_container(volumes=volumes)  # 使用新的卷配置创建容器
+            state["input_dir"] = new_dir
             return f"输入目录已更新为: {new_dir}"
         else:
-            self.output_dir = new_dir
-            # 更新Docker卷配置
-            if self.sandbox and self.sandbox.container:
-                volumes = self._prepare_volumes()
-                self.sandbox.cleanup()  # 停止当前容器
-                self.sandbox.create_container(volumes=volumes)  # 使用新的卷配置创建容器
+            state["output_dir"] = new_dir
             return f"输出目录已更新为: {new_dir}"
 
-    def execute_code(self, code):
-        """执行代码"""
+    def execute_code(self, code, profile, state):
+        """执行代码，以生成器方式逐步返回累计的输出和运行按钮状态，profile为资源配置档名称"""
         if not self.docker_available:
-            return "错误: Docker服务未运行或无法连接。请确保Docker已安装并启动。"
+            yield "错误: Docker服务未运行或无法连接。请确保Docker已安装并启动。", gr.update()
+            return
         if not code.strip():
-            return "错误: 代码不能为空"
+            yield "错误: 代码不能为空", gr.update()
+            return
 
+        self.init_session(state)
+        output = ""
+        # 只禁用当前会话的运行按钮
+        yield "任务排队中...", gr.update(interactive=False)
         try:
-            self.run_btn.interactive = False
-                
-            volumes = self._prepare_volumes()
-            self.sandbox.create_container(volumes=volumes)
-            result = self.sandbox.run_code(code)
-            return result if result else "代码执行完成，无输出"
+            volumes = self._prepare_volumes(state["input_dir"], state["output_dir"])
+            state["job_id"] = self.scheduler.submit(code, volumes=volumes, profile=profile)
+            # 边执行边刷新输出框
+            for chunk in self.scheduler.stream(state["job_id"]):
+                output += chunk
+                yield output, gr.update()
+            job = self.scheduler.get(state["job_id"])
+            if job.status != SUCCEEDED:
+                yield (f"{output}\n{job.error}" if output else job.error), gr.update(interactive=True)
+            else:
+                yield output or "代码执行完成，无输出", gr.update(interactive=True)
         except Exception as e:
-            return f"执行错误: {str(e)}"
+            message = f"{output}\n执行错误: {str(e)}" if output else f"执行错误: {str(e)}"
+            yield message, gr.update(interactive=True)
         finally:
-            self.run_btn.interactive = True
+            state["job_id"] = None
 
-    def _prepare_volumes(self):
+    @staticmethod
+    def _prepare_volumes(input_dir, output_dir):
         """准备Docker卷配置"""
         return {
-            self.input_dir: {'bind': '/workdir/input', 'mode': 'ro'},
-            self.output_dir: {'bind': '/workdir/output', 'mode': 'rw'}
+            input_dir: {'bind': '/workdir/input', 'mode': 'ro'},
+            output_dir: {'bind': '/workdir/output', 'mode': 'rw'}
         }
 
-    def stop_execution(self):
-        """停止代码执行"""
-        if self.sandbox and self.sandbox.container:
-            self.sandbox.cleanup()
+    def stop_execution(self, state):
+        """停止当前会话的代码执行，只结束该任务，容器继续保留"""
+        job_id = state.get("job_id")
+        if self.scheduler and job_id and self.scheduler.cancel(job_id):
             return "已停止代码执行"
         return "没有正在运行的代码"
 
@@ -147,6 +208,7 @@ def create_ui_components(ui):
             gr.Markdown("请确保Docker已安装并启动，然后刷新页面。")
         
         gr.Markdown("在安全的Docker环境中执行Python代码，处理输入文件并生成输出文件。")
+        session = gr.State(ui.new_session_state())
         
         with gr.Row():
             with gr.Column(scale=1):
@@ -167,40 +229,46 @@ def create_ui_components(ui):
             
             with gr.Column(scale=2):
                 code_input = gr.Code(language="python", label="Python代码", value=ui.DEFAULT_EXAMPLE_CODE)
+                # pandas/openpyxl等数据处理任务可以选择pandas-heavy，简单任务选择small
+                profile_input = gr.Dropdown(choices=list(PROFILES), value=DEFAULT_PROFILE, label="资源配置档")
                 with gr.Row():
                     run_btn = gr.Button("在Docker中执行代码", variant="primary")
                     stop_btn = gr.Button("停止执行", variant="stop")
                 output = gr.Textbox(label="执行结果", interactive=False)
         
-        setup_event_handlers(ui, input_dir, input_dir_btn, output_dir, output_dir_btn,
-                            dir_status, code_input, run_btn, stop_btn, output, file_list, load_btn)
+        setup_event_handlers(ui, session, input_dir, input_dir_btn, output_dir, output_dir_btn,
+                            dir_status, code_input, profile_input, run_btn, stop_btn, output,
+                            file_list, load_btn, demo)
         add_styles()
     
     return demo
 
-def setup_event_handlers(ui, input_dir, input_dir_btn, output_dir, output_dir_btn,
-                        dir_status, code_input, run_btn, stop_btn, output, file_list, load_btn):
-    """设置事件处理器"""
-    # 保存run_btn引用到UI实例中
-    ui.run_btn = run_btn
-    
-    input_dir_btn.click(lambda x: ui.update_directory(x, True),
-                       inputs=input_dir, outputs=dir_status)
-    output_dir_btn.click(lambda x: ui.update_directory(x, False),
-                        inputs=output_dir, outputs=dir_status)
-    run_btn.click(ui.execute_code, inputs=code_input, outputs=output)
-    stop_btn.click(ui.stop_execution, outputs=output)
+def setup_event_handlers(ui, session, input_dir, input_dir_btn, output_dir, output_dir_btn,
+                        dir_status, code_input, profile_input, run_btn, stop_btn, output,
+                        file_list, load_btn, demo):
+    """设置事件处理器，所有会话相关的数据都通过session(gr.State)传递"""
+    demo.load(ui.init_session, inputs=session, outputs=[session, input_dir, output_dir])
+
+    input_dir_btn.click(lambda x, state: ui.update_directory(x, state, True),
+                       inputs=[input_dir, session], outputs=dir_status)
+    output_dir_btn.click(lambda x, state: ui.update_directory(x, state, False),
+                        inputs=[output_dir, session], outputs=dir_status)
+    # 同时执行的任务数不超过容器池大小，多出的请求在Gradio队列中等待
+    run_btn.click(ui.execute_code, inputs=[code_input, profile_input, session], outputs=[output, run_btn],
+                  concurrency_limit=ui.pool_size)
+    stop_btn.click(ui.stop_execution, inputs=session, outputs=output, concurrency_limit=None)
     
     # 添加文件列表选择事件
-    def on_file_select(evt: gr.SelectData):
-        ui.selected_file = evt.value
+    def on_file_select(evt: gr.SelectData, state):
+        state["selected_file"] = evt.value
         return f"已选择文件: {evt.value}"
     
-    file_list.select(on_file_select, outputs=dir_status)
+    file_list.select(on_file_select, inputs=session, outputs=dir_status)
     
     # 修改加载按钮事件，使用选中的文件名
     load_btn.click(
-        fn=lambda: ui.load_file_content(ui.selected_file) if ui.selected_file else "请先选择一个文件",
+        fn=lambda state: ui.load_file_content(state["selected_file"]) if state["selected_file"] else "请先选择一个文件",
+        inputs=session,
         outputs=[code_input]
     )
 
@@ -220,7 +288,11 @@ def add_styles():
 
 def main():
     ui = DockerSandboxUI()
+    # 设置SANDBOX_METRICS_PORT时提供Prometheus格式的/metrics端点
+    if os.getenv("SANDBOX_METRICS_PORT"):
+        start_metrics_server(int(os.getenv("SANDBOX_METRICS_PORT")))
     demo = create_ui_components(ui)
+    demo.queue(max_size=int(os.getenv("SANDBOX_QUEUE_SIZE", "64")))
     demo.launch()
 
 if __name__ == "__main__":
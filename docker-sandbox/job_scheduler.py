@@ -0,0 +1,323 @@
+"""
+沙盒任务调度器
+
+在DockerSandbox之上提供有界的任务队列和可配置的并发度。
+每个任务有自己的任务ID、状态、墙钟超时和CPU时间上限；
+取消或超时只结束该任务在容器中的进程组，不会重启容器，也不影响其他任务。
+"""
+import itertools
+import queue
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Optional, Dict, List, Iterator, Any, Callable
+
+from dockersandbox import DockerSandbox
+
+# 任务状态
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+CANCELLED = "cancelled"
+TIMEOUT = "timeout"
+FINISHED_STATES = (SUCCEEDED, FAILED, CANCELLED, TIMEOUT)
+
+# job_launcher在任务因CPU时间超限被SIGXCPU/SIGKILL结束时的退出码
+_CPU_LIMIT_EXIT_CODES = (128 + 24, 128 + 9)
+
+
+class QueueFullError(RuntimeError):
+    """任务队列已满"""
+
+
+@dataclass
+class Job:
+    """
+    一个沙盒任务
+
+    属性:
+        id: 任务ID
+        status: 任务状态(queued/running/succeeded/failed/cancelled/timeout)
+        exit_code: 任务的退出码，未结束时为None
+        error: 失败、取消或超时的原因
+    """
+    id: str
+    code: str
+    template_file: Optional[str] = None
+    timeout: Optional[float] = None
+    cpu_seconds: Optional[int] = None
+    options: Dict[str, Any] = field(default_factory=dict, repr=False)
+    status: str = QUEUED
+    exit_code: Optional[int] = None
+    error: Optional[str] = None
+    submitted_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    chunks: List[str] = field(default_factory=list, repr=False)
+    _cond: threading.Condition = field(default_factory=threading.Condition, repr=False)
+
+    @property
+    def output(self) -> str:
+        """目前为止的全部输出"""
+        with self._cond:
+            return "".join(self.chunks)
+
+    @property
+    def finished(self) -> bool:
+        return self.status in FINISHED_STATES
+
+    def to_dict(self) -> Dict[str, Any]:
+        """返回任务状态摘要(不含输出)"""
+        return {
+            "id": self.id,
+            "status": self.status,
+            "exit_code": self.exit_code,
+            "error": self.error,
+            "submitted_at": self.submitted_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class JobScheduler:
+    """
+    DockerSandbox的并发任务调度器
+
+    属性:
+        sandbox: 执行任务的沙盒，配合SandboxPool使用时可以真正并行
+        max_concurrency: 同时执行的最多任务数
+        max_queue: 排队等待的最多任务数，超过后submit抛出QueueFullError
+    """
+
+    def __init__(self, sandbox: DockerSandbox, max_concurrency: int = 2, max_queue: int = 32,
+                 default_timeout: Optional[float] = 600, default_cpu_seconds: Optional[int] = None,
+                 history_size: int = 1000, on_finish: Optional[Callable[[Job], None]] = None):
+        """
+        初始化调度器并启动工作线程
+
+        参数:
+            sandbox: 执行任务的DockerSandbox
+            max_concurrency: 同时执行的最多任务数
+            max_queue: 排队等待的最多任务数
+            default_timeout: 默认的墙钟超时秒数，None表示不限制
+            default_cpu_seconds: 默认的CPU时间上限秒数，None表示不限制
+            history_size: 保留的已结束任务数量
+            on_finish: 可选的回调，每个任务结束(包括排队中被取消)时以任务对象调用一次
+        """
+        self.sandbox = sandbox
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.default_timeout = default_timeout
+        self.default_cpu_seconds = default_cpu_seconds
+        self.history_size = history_size
+        self.on_finish = on_finish
+
+        self._queue: "queue.Queue[Optional[Job]]" = queue.Queue(maxsize=max_queue)
+        self._jobs: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+        self._counter = itertools.count(1)
+        self._workers = [
+            threading.Thread(target=self._work, name=f"sandbox-job-{i}", daemon=True)
+            for i in range(max_concurrency)
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    def submit(self, code: str, template_file: Optional[str] = None,
+               timeout: Optional[float] = None, cpu_seconds: Optional[int] = None,
+               **options) -> str:
+        """
+        提交任务
+
+        参数:
+            code: 要执行的代码或问题
+            template_file: 代码模板文件名，默认使用沙盒的默认模板
+            timeout: 墙钟超时秒数，默认为default_timeout
+            cpu_seconds: CPU时间上限秒数，默认为default_cpu_seconds
+            options: 透传给DockerSandbox.run_code_stream的其他参数，如volumes
+
+        返回:
+            任务ID
+
+        异常:
+            QueueFullError: 等待队列已满
+        """
+        job_id = f"job-{next(self._counter)}-{uuid.uuid4().hex[:8]}"
+        job = Job(
+            id=job_id,
+            code=code,
+            template_file=template_file,
+            timeout=self.default_timeout if timeout is None else timeout,
+            cpu_seconds=self.default_cpu_seconds if cpu_seconds is None else cpu_seconds,
+            options=options,
+        )
+        with self._lock:
+            self._jobs[job_id] = job
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            with self._lock:
+                self._jobs.pop(job_id, None)
+            raise QueueFullError(f"任务队列已满(最多{self.max_queue}个等待中的任务)")
+        return job_id
+
+    def get(self, job_id: str) -> Job:
+        """
+        获取任务对象
+
+        异常:
+            KeyError: 任务不存在
+        """
+        with self._lock:
+            return self._jobs[job_id]
+
+    def status(self, job_id: str) -> Dict[str, Any]:
+        """返回任务状态摘要"""
+        return self.get(job_id).to_dict()
+
+    def list_jobs(self) -> List[Dict[str, Any]]:
+        """返回所有已知任务的状态摘要"""
+        with self._lock:
+            jobs = list(self._jobs.values())
+        return [job.to_dict() for job in jobs]
+
+    def cancel(self, job_id: str) -> bool:
+        """
+        取消任务：排队中的任务不再执行，执行中的任务结束其进程组
+
+        返回:
+            任务是否被取消(已结束的任务返回False)
+        """
+        return self._stop(self.get(job_id), CANCELLED, "任务已取消")
+
+    def _stop(self, job: Job, status: str, reason: str) -> bool:
+        with job._cond:
+            if job.finished:
+                return False
+            was_running = job.status == RUNNING
+            job.status = status
+            job.error = reason
+            if not was_running:
+                job.finished_at = time.time()
+            job._cond.notify_all()
+        if not was_running:
+            self._finished(job)
+        if was_running:
+            # 启动器可能还没有记录进程组，稍等后重试
+            for _ in range(20):
+                if self.sandbox.cancel_job(job.id):
+                    break
+                with job._cond:
+                    if job.finished_at is not None:
+                        break
+                time.sleep(0.1)
+        return True
+
+    def wait(self, job_id: str, timeout: Optional[float] = None) -> Job:
+        """等待任务结束并返回任务对象"""
+        job = self.get(job_id)
+        with job._cond:
+            job._cond.wait_for(lambda: job.finished_at is not None, timeout)
+        return job
+
+    def stream(self, job_id: str) -> Iterator[str]:
+        """按产生顺序逐块返回任务输出，直到任务结束"""
+        job = self.get(job_id)
+        index = 0
+        while True:
+            with job._cond:
+                job._cond.wait_for(lambda: len(job.chunks) > index or job.finished_at is not None)
+                chunks = job.chunks[index:]
+                done = job.finished_at is not None
+            index += len(chunks)
+            yield from chunks
+            if done and not chunks:
+                return
+
+    def _work(self) -> None:
+        while True:
+            job = self._queue.get()
+            if job is None:
+                return
+            try:
+                self._run(job)
+            finally:
+                self._queue.task_done()
+                self._trim_history()
+
+    def _run(self, job: Job) -> None:
+        with job._cond:
+            if job.finished:
+                # 排队期间已被取消
+                return
+            job.status = RUNNING
+            job.started_at = time.time()
+
+        timer = None
+        if job.timeout:
+            timer = threading.Timer(job.timeout, self._stop,
+                                    args=(job, TIMEOUT, f"任务运行超过{job.timeout}秒"))
+            timer.daemon = True
+            timer.start()
+        exit_code = None
+        error = None
+        try:
+            stream = self.sandbox.run_code_stream(job.code, job.template_file, job_id=job.id,
+                                                  cpu_seconds=job.cpu_seconds, **job.options)
+            while True:
+                try:
+                    _, chunk = next(stream)
+                except StopIteration as stop:
+                    exit_code = stop.value
+                    break
+                with job._cond:
+                    job.chunks.append(chunk)
+                    job._cond.notify_all()
+        except Exception as e:
+            error = f"执行错误: {e}"
+        finally:
+            if timer:
+                timer.cancel()
+
+        with job._cond:
+            job.exit_code = exit_code
+            if job.status == RUNNING:
+                if error:
+                    job.status, job.error = FAILED, error
+                elif exit_code == 0:
+                    job.status = SUCCEEDED
+                elif job.cpu_seconds and exit_code in _CPU_LIMIT_EXIT_CODES:
+                    job.status, job.error = TIMEOUT, f"任务CPU时间超过{job.cpu_seconds}秒"
+                else:
+                    job.status, job.error = FAILED, f"退出码: {exit_code}"
+            job.finished_at = time.time()
+            job._cond.notify_all()
+        self._finished(job)
+
+    def _finished(self, job: Job) -> None:
+        if self.on_finish is None:
+            return
+        try:
+            self.on_finish(job)
+        except Exception as e:
+            print(f"任务结束回调出错: {e}")
+
+    def _trim_history(self) -> None:
+        """只保留最近history_size个已结束的任务"""
+        with self._lock:
+            finished = sorted((job for job in self._jobs.values() if job.finished_at is not None),
+                              key=lambda job: job.finished_at)
+            for job in finished[:max(0, len(finished) - self.history_size)]:
+                self._jobs.pop(job.id, None)
+
+    def shutdown(self, cancel_running: bool = True) -> None:
+        """停止工作线程，可选地取消所有未结束的任务"""
+        if cancel_running:
+            with self._lock:
+                jobs = list(self._jobs.values())
+            for job in jobs:
+                self._stop(job, CANCELLED, "调度器已关闭")
+        for _ in self._workers:
+            self._queue.put(None)
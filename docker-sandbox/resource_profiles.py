@@ -0,0 +1,103 @@
+"""
+沙盒容器的资源配置档
+
+按名称选择容器的内存、CPU和进程数上限，代替原先写死的512m/0.5核/100进程：
+- small: 简单的计算或文本任务
+- default: 原先的默认配置
+- pandas-heavy: pandas/openpyxl等数据处理任务
+- browser: 需要无头浏览器等多进程工具的任务
+
+容器池按配置档区分容器；单个容器模式下通过container.update()原地调整。
+"""
+from dataclasses import dataclass
+from typing import Dict, Union, Optional
+
+from docker.models.containers import Container
+from docker.utils import parse_bytes
+
+DEFAULT_PROFILE = "default"
+# CFS调度周期(微秒)，cpu_quota / CPU_PERIOD 即可用的CPU核数
+CPU_PERIOD = 100000
+
+
+@dataclass(frozen=True)
+class ResourceProfile:
+    """
+    一组容器资源上限
+
+    属性:
+        name: 配置档名称
+        mem_limit: 内存上限，如"512m"
+        cpu_quota: 每个CFS周期可用的CPU时间(微秒)，50000即0.5核
+        pids_limit: 进程数上限
+    """
+    name: str
+    mem_limit: str
+    cpu_quota: int
+    pids_limit: int
+
+    @property
+    def cpus(self) -> float:
+        """可用的CPU核数"""
+        return self.cpu_quota / CPU_PERIOD
+
+    def run_kwargs(self) -> Dict[str, Union[str, int]]:
+        """containers.run使用的资源参数"""
+        return {
+            "mem_limit": self.mem_limit,
+            "cpu_period": CPU_PERIOD,
+            "cpu_quota": self.cpu_quota,
+            "pids_limit": self.pids_limit,
+        }
+
+
+PROFILES: Dict[str, ResourceProfile] = {
+    profile.name: profile for profile in (
+        ResourceProfile("small", mem_limit="256m", cpu_quota=25000, pids_limit=50),
+        ResourceProfile("default", mem_limit="512m", cpu_quota=50000, pids_limit=100),
+        ResourceProfile("pandas-heavy", mem_limit="2g", cpu_quota=200000, pids_limit=100),
+        ResourceProfile("browser", mem_limit="2g", cpu_quota=200000, pids_limit=512),
+    )
+}
+
+
+def register_profile(profile: ResourceProfile) -> None:
+    """注册或覆盖一个配置档"""
+    PROFILES[profile.name] = profile
+
+
+def get_profile(profile: Optional[Union[str, ResourceProfile]] = None) -> ResourceProfile:
+    """
+    按名称查找配置档
+
+    参数:
+        profile: 配置档名称或实例，None表示默认配置档
+
+    异常:
+        ValueError: 未知的配置档名称
+    """
+    if isinstance(profile, ResourceProfile):
+        return profile
+    name = profile or DEFAULT_PROFILE
+    try:
+        return PROFILES[name]
+    except KeyError:
+        raise ValueError(f"未知的资源配置档: {name}，可用的配置档: {', '.join(PROFILES)}") from None
+
+
+def apply_profile(container: Container, current: ResourceProfile, profile: ResourceProfile) -> bool:
+    """
+    通过container.update()把运行中的容器调整到另一个配置档
+
+    Docker不支持更新进程数上限，两个配置档的pids_limit不同时不做修改。
+
+    返回:
+        是否调整成功
+    """
+    if current.pids_limit != profile.pids_limit:
+        return False
+    mem_limit = parse_bytes(profile.mem_limit)
+    # 与启动时Docker的默认值一致，允许使用与内存等量的交换空间
+    container.update(mem_limit=mem_limit, memswap_limit=mem_limit * 2,
+                     cpu_period=CPU_PERIOD, cpu_quota=profile.cpu_quota)
+    return True
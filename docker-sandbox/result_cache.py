@@ -0,0 +1,154 @@
+"""
+沙盒执行结果缓存
+
+以"渲染后的代码 + 模型名称 + 工具集指纹"的哈希为键，把成功执行(退出码0)的输出保存在本地磁盘。
+相同的问题再次提交时直接回放缓存的输出，不再重新运行智能体(包括模型调用、搜索和网页抓取)。
+
+- 每个条目是一个JSON文件，写入时先写临时文件再原子替换，多个进程可以共享同一目录
+- 超过TTL的条目在读取时删除
+- 目录总大小超过上限时按最近使用时间(文件mtime，命中时更新)淘汰最久未用的条目
+
+注意：只缓存标准输出/错误输出，命中时不会重新产生任务写入挂载目录的文件。
+依赖文件输出的任务应使用run_code_stream(..., use_cache=False)绕过缓存。
+"""
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from dataclasses import dataclass
+from typing import Optional, List, Tuple
+
+# 缓存根目录，可通过环境变量SANDBOX_CACHE_DIR修改
+CACHE_ROOT = os.getenv("SANDBOX_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "py-sandbox"))
+# 缓存格式版本，格式变化时旧条目自动失效
+_FORMAT_VERSION = 1
+
+
+@dataclass
+class CachedResult:
+    """一次缓存的执行结果"""
+    chunks: List[Tuple[str, str]]  # (流名称, 文本块)
+    exit_code: int
+    created_at: float
+
+    @property
+    def output(self) -> str:
+        return "".join(text for _, text in self.chunks)
+
+
+class ResultCache:
+    """
+    内容寻址的执行结果缓存
+
+    属性:
+        root: 缓存目录
+        ttl: 条目的有效期(秒)
+        max_bytes: 缓存目录的总大小上限(字节)
+    """
+
+    def __init__(self, root: Optional[str] = None, ttl: float = 24 * 3600,
+                 max_bytes: int = 256 * 1024 * 1024):
+        """
+        参数:
+            root: 缓存目录，默认为<SANDBOX_CACHE_DIR>/results
+            ttl: 条目的有效期(秒)
+            max_bytes: 缓存目录的总大小上限(字节)
+        """
+        self.root = os.path.abspath(root or os.path.join(CACHE_ROOT, "results"))
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(self.root, exist_ok=True)
+
+    @staticmethod
+    def key(rendered_code: str, model: Optional[str] = None, tool_set: Optional[str] = None) -> str:
+        """
+        计算缓存键
+
+        参数:
+            rendered_code: 渲染后的完整代码(包含问题)
+            model: 模型名称
+            tool_set: 工具集指纹(执行方式与镜像内容哈希)
+        """
+        digest = hashlib.sha256()
+        for part in (str(_FORMAT_VERSION), model or "", tool_set or "", rendered_code):
+            digest.update(part.encode("utf-8"))
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, key[:2], f"{key}.json")
+
+    def get(self, key: str) -> Optional[CachedResult]:
+        """读取缓存条目，不存在或已过期时返回None"""
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if time.time() - data["created_at"] > self.ttl:
+            self._remove(path)
+            return None
+        try:
+            os.utime(path)  # 记录最近使用时间，供LRU淘汰
+        except OSError:
+            pass
+        return CachedResult([tuple(chunk) for chunk in data["chunks"]], data["exit_code"], data["created_at"])
+
+    def put(self, key: str, chunks: List[Tuple[str, str]], exit_code: int) -> None:
+        """写入缓存条目，然后按大小上限淘汰旧条目"""
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        data = {"created_at": time.time(), "exit_code": exit_code, "chunks": chunks}
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except BaseException:
+            self._remove(tmp_path)
+            raise
+        self._evict()
+
+    def _entries(self) -> List[Tuple[float, int, str]]:
+        entries = []
+        for root, _, files in os.walk(self.root):
+            for name in files:
+                if not name.endswith(".json"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, path))
+        return entries
+
+    def _evict(self) -> None:
+        """删除过期条目，并按最近使用时间淘汰到大小上限以内"""
+        with self._lock:
+            entries = sorted(self._entries())
+            now = time.time()
+            total = sum(size for _, size, _ in entries)
+            for mtime, size, path in entries:
+                # mtime不早于创建时间，mtime已超过TTL的条目一定已经过期
+                if total <= self.max_bytes and now - mtime <= self.ttl:
+                    break
+                self._remove(path)
+                total -= size
+
+    @staticmethod
+    def _remove(path: str) -> None:
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+
+    def clear(self) -> None:
+        """删除所有缓存条目"""
+        with self._lock:
+            for _, _, path in self._entries():
+                self._remove(path)
@@ -1,4 +1,12 @@
+import sys
 from dockersandbox import DockerSandbox
+
+if len(sys.argv) > 1:
+    # 批量模式: python run_cli.py questions.jsonl [results.jsonl]，并行执行文件中的所有问题
+    from batch_runner import run_batch, default_output_path
+    run_batch(sys.argv[1], sys.argv[2] if len(sys.argv) > 2 else default_output_path(sys.argv[1]))
+    sys.exit(0)
+
 sandbox = DockerSandbox()
 # result = sandbox.run_code("""
 # 帮我写一个python程序完成这个目标：
@@ -60,10 +68,12 @@ sandbox = DockerSandbox()
 # mcp工具都有哪些主流的工具，在哪些地方能找到比较全面的mcp工具列表？深度搜索网络信息，给出最常见的20种以上mcp工具，用中文回答，请注明出处，将结果以markdown格式写入工作目录下的output2.md
 # """)
 #print(result)
-result = sandbox.run_code("""
+stream = sandbox.run_code_stream("""
 1、今天2025年4月25日，请搜索8个关于今天美国股票市场的信息，将每个信息的title和link以json格式输出，注意字符串含有中文，字符串以utf-8编码输出
 2、读取json格式结果中每一个link的网页内容，并拼接成一个大的文本。
 3、根据这个大文本内容，写入工作目录result.txt，以utf-8编码输出
 4、读取工作目录中result.txt,分析中国股票市场的情况，用中文回答，将结果以markdown格式写入工作目录下的output4.md
 """)
-print(result)
\ No newline at end of file
+# 边执行边输出，不必等待智能体全部运行结束
+for _, chunk in stream:
+    print(chunk, end="", flush=True)
\ No newline at end of file
@@ -0,0 +1,151 @@
+"""
+py-sandbox镜像解析
+
+镜像以"Dockerfile+构建上下文"的内容哈希作为标签(py-sandbox:<hash>)。
+只有哈希变化时才重新构建，避免每次运行都上传构建上下文，
+也避免Dockerfile修改后仍然悄悄复用旧镜像。
+解析结果在进程内缓存，重复调用只需要遍历一次上下文文件的stat信息。
+"""
+import fnmatch
+import hashlib
+import os
+import threading
+from typing import Dict, List, Tuple, Iterator
+
+import docker
+
+IMAGE_NAME = "py-sandbox"
+# 镜像上记录内容哈希的标签名
+HASH_LABEL = "py-sandbox.context-hash"
+
+# 构建上下文是仓库根目录，镜像需要COPY其中的agent_runtime包
+BUILD_CONTEXT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# 相对于构建上下文的Dockerfile路径
+DOCKERFILE = "docker-sandbox/Dockerfile"
+
+_lock = threading.Lock()
+# (上下文文件的stat签名) -> 内容哈希
+_hash_cache: Dict[Tuple, str] = {}
+# 内容哈希 -> 已确认存在的镜像标签
+_resolved: Dict[str, str] = {}
+
+
+def _load_dockerignore(context_dir: str) -> List[str]:
+    path = os.path.join(context_dir, ".dockerignore")
+    if not os.path.exists(path):
+        return []
+    with open(path, "r", encoding="utf-8") as f:
+        lines = [line.strip() for line in f]
+    return [line.rstrip("/") for line in lines if line and not line.startswith("#")]
+
+
+def _is_ignored(rel_path: str, patterns: List[str]) -> bool:
+    """按.dockerignore的规则判断文件是否被排除(后出现的规则优先，!表示例外)"""
+    ignored = False
+    parts = rel_path.split("/")
+    prefixes = ["/".join(parts[:i]) for i in range(1, len(parts) + 1)]
+    for pattern in patterns:
+        negate = pattern.startswith("!")
+        pattern = pattern[1:] if negate else pattern
+        if any(fnmatch.fnmatchcase(prefix, pattern) for prefix in prefixes):
+            ignored = not negate
+    return ignored
+
+
+def iter_context_files(context_dir: str = BUILD_CONTEXT) -> Iterator[str]:
+    """按固定顺序列出构建上下文中会发送给Docker的文件(相对路径)"""
+    patterns = _load_dockerignore(context_dir)
+    exceptions = [p[1:] for p in patterns if p.startswith("!")]
+    for root, dirs, files in os.walk(context_dir):
+        rel_root = os.path.relpath(root, context_dir).replace(os.sep, "/")
+        rel_root = "" if rel_root == "." else rel_root + "/"
+        # 跳过被排除且不可能被!例外规则重新包含的目录(如.git)，避免遍历整个仓库
+        dirs[:] = sorted(
+            d for d in dirs
+            if not _is_ignored(rel_root + d, patterns)
+            or any(e.startswith(rel_root + d + "/") for e in exceptions)
+        )
+        for name in sorted(files):
+            rel_path = rel_root + name
+            # Dockerfile和.dockerignore总是会被发送
+            if rel_path in (DOCKERFILE, ".dockerignore") or not _is_ignored(rel_path, patterns):
+                yield rel_path
+
+
+def context_hash(context_dir: str = BUILD_CONTEXT) -> str:
+    """
+    计算Dockerfile与构建上下文的内容哈希
+
+    文件stat信息不变时直接返回缓存的哈希，不重新读取文件内容。
+    """
+    files = list(iter_context_files(context_dir))
+    signature = (context_dir,) + tuple(
+        (rel_path, st.st_size, st.st_mtime_ns)
+        for rel_path, st in ((p, os.stat(os.path.join(context_dir, p))) for p in files)
+    )
+    cached = _hash_cache.get(signature)
+    if cached:
+        return cached
+
+    digest = hashlib.sha256()
+    for rel_path in files:
+        digest.update(rel_path.encode("utf-8") + b"\0")
+        with open(os.path.join(context_dir, rel_path), "rb") as f:
+            for chunk in iter(lambda: f.read(65536), b""):
+                digest.update(chunk)
+        digest.update(b"\0")
+    value = digest.hexdigest()[:16]
+    _hash_cache[signature] = value
+    return value
+
+
+def _build(client: docker.DockerClient, tag: str, content_hash: str) -> None:
+    print(f"开始构建{tag}...")
+    try:
+        client.images.build(
+            path=BUILD_CONTEXT,
+            dockerfile=DOCKERFILE,
+            tag=tag,
+            labels={HASH_LABEL: content_hash},
+            rm=True,
+            forcerm=True,
+            buildargs={}
+        )
+    except docker.errors.BuildError as e:
+        print("构建错误日志:")
+        for log in e.build_log:
+            if 'stream' in log:
+                print(log['stream'].strip())
+        raise
+    # 同时更新py-sandbox:latest，方便手工调试时docker run py-sandbox
+    client.images.get(tag).tag(IMAGE_NAME, "latest")
+
+
+def resolve_image(client: docker.DockerClient) -> str:
+    """
+    返回与当前Dockerfile内容一致的py-sandbox镜像标签，必要时构建
+
+    参数:
+        client: Docker客户端实例
+
+    返回:
+        镜像标签，形如py-sandbox:<hash>
+
+    异常:
+        docker.errors.BuildError: 镜像构建失败
+    """
+    content_hash = context_hash()
+    tag = _resolved.get(content_hash)
+    if tag:
+        return tag
+    with _lock:
+        tag = _resolved.get(content_hash)
+        if tag:
+            return tag
+        tag = f"{IMAGE_NAME}:{content_hash}"
+        try:
+            client.images.get(tag)
+        except docker.errors.ImageNotFound:
+            _build(client, tag, content_hash)
+        _resolved[content_hash] = tag
+        return tag
@@ -2,29 +2,17 @@ import os
 import docker
 import argparse
 from typing import Optional
+from sandbox_image import resolve_image
+from resource_profiles import PROFILES, get_profile
 
 class DockerSandbox:
     def __init__(self):
         self.client = docker.from_env()
         self.container = None
 
-    def create_container(self, volumes=None):
-        try:
-            dockerfile_path = os.path.join(os.path.dirname(__file__), 'Dockerfile')
-            image, build_logs = self.client.images.build(
-                path=os.path.dirname(__file__),
-                dockerfile=dockerfile_path,
-                tag="py-sandbox",
-                rm=True,
-                forcerm=True,
-                buildargs={}
-            )
-        except docker.errors.BuildError as e:
-            print("Build error logs:")
-            for log in e.build_log:
-                if 'stream' in log:
-                    print(log['stream'].strip())
-            raise
+    def create_container(self, volumes=None, profile=None):
+        # Only builds when the Dockerfile/build context hash changed
+        image = resolve_image(self.client)
 
         # 如果没有提供自定义卷，使用默认卷配置
         if volumes is None:
@@ -37,13 +25,11 @@ class DockerSandbox:
 
         # Create container with security constraints and proper logging
         self.container = self.client.containers.run(
-            "py-sandbox",
+            image,
             command="tail -f /dev/null",  # Keep container running
             detach=True,
             tty=True,
-            mem_limit="512m",
-            cpu_quota=50000,
-            pids_limit=100,
+            **get_profile(profile).run_kwargs(),  # memory, CPU and pids limits of the resource profile
             security_opt=["no-new-privileges"],
             cap_drop=["ALL"],
             environment={
@@ -54,9 +40,9 @@ class DockerSandbox:
             volumes=volumes
         )
 
-    def run_code(self, code: str) -> Optional[str]:
+    def run_code(self, code: str, profile: Optional[str] = None) -> Optional[str]:
         if not self.container:
-            self.create_container()
+            self.create_container(profile=profile)
 
         # Execute code in container
         exec_result = self.container.exec_run(
@@ -84,11 +70,25 @@ def parse_args():
     parser = argparse.ArgumentParser(description='Run Python code in a Docker sandbox')
     parser.add_argument('--input-file', type=str, default='agent_code.py',
                       help='Python file to execute (default: agent_code.py)')
+    parser.add_argument('--profile', type=str, default='default', choices=list(PROFILES),
+                      help='Resource profile of the sandbox container (default: default)')
+    parser.add_argument('--batch', type=str, default=None,
+                      help='JSONL file of questions/scripts to run in parallel (see batch_runner.py)')
+    parser.add_argument('--output', type=str, default=None,
+                      help='JSONL results file for --batch (default: <batch>.results.jsonl)')
+    parser.add_argument('--concurrency', type=int, default=4,
+                      help='Number of sandboxes used in parallel for --batch (default: 4)')
     return parser.parse_args()
 
 # Example usage:
 if __name__ == '__main__':
     args = parse_args()
+    if args.batch:
+        # Batch mode: fan the file out over a pool of sandboxes, resuming from --output
+        from batch_runner import run_batch, default_output_path
+        run_batch(args.batch, args.output or default_output_path(args.batch),
+                  concurrency=args.concurrency, profile=args.profile)
+        raise SystemExit(0)
     sandbox = DockerSandbox()
 
     try:
@@ -101,7 +101,7 @@ if __name__ == '__main__':
             agent_code = f.read()
 
         # Run the code in the sandbox
-        output = sandbox.run_code(agent_code)
+        output = sandbox.run_code(agent_code, profile=args.profile)
         print(output)
 
     finally:
@@ -0,0 +1,327 @@
+"""
+沙盒执行指标
+
+记录每个任务各阶段的耗时(镜像解析、容器获取/启动、模板渲染、文件暂存、执行、输出解码)，
+并在执行期间采样container.stats：内存峰值(对比内存上限)、CPU限流(对比cpu_quota)、进程数。
+汇总结果以Prometheus文本格式通过HTTP提供，每个任务结束时另外输出一行JSON日志。
+
+用法:
+    start_metrics_server(9108)  # 之后访问 http://localhost:9108/metrics
+    设置环境变量SANDBOX_METRICS_LOG=<文件路径>可以把JSON日志写入文件(默认写到stderr)
+"""
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional, Dict, Any, List, Tuple, Iterator
+
+PHASE_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+MEMORY_BUCKETS = tuple(mb * 1024 * 1024 for mb in (32, 64, 128, 256, 384, 448, 512, 1024, 2048))
+PIDS_BUCKETS = (5, 10, 20, 50, 80, 100, 200)
+
+_local = threading.local()
+
+
+class JobTrace:
+    """
+    单个任务的阶段耗时和资源采样结果
+
+    属性:
+        job_id: 任务ID(未指定时为None)
+        phases: 阶段名 -> 累计耗时(秒)
+        resources: 资源采样汇总，见StatsSampler.summary
+    """
+
+    def __init__(self, job_id: Optional[str] = None, template: Optional[str] = None,
+                 profile: Optional[str] = None):
+        self.job_id = job_id
+        self.template = template
+        self.profile = profile
+        self.started_at = time.time()
+        self.phases: Dict[str, float] = {}
+        self.resources: Dict[str, Any] = {}
+        self.status: Optional[str] = None
+        self.exit_code: Optional[int] = None
+        self.duration: Optional[float] = None
+        self._start = time.perf_counter()
+
+    def add(self, name: str, seconds: float) -> None:
+        """累加一个阶段的耗时"""
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        """计时一个阶段"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def finish(self, status: str, exit_code: Optional[int] = None) -> None:
+        self.status = status
+        self.exit_code = exit_code
+        self.duration = time.perf_counter() - self._start
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.job_id,
+            "template": self.template,
+            "profile": self.profile,
+            "started_at": self.started_at,
+            "status": self.status,
+            "exit_code": self.exit_code,
+            "duration": self.duration,
+            "phases": {k: round(v, 6) for k, v in self.phases.items()},
+            "resources": self.resources,
+        }
+
+
+@contextmanager
+def activate(trace: Optional[JobTrace]) -> Iterator[None]:
+    """在当前线程中把trace设为活动任务，供phase()在深层调用中记录耗时"""
+    previous = getattr(_local, "trace", None)
+    _local.trace = trace
+    try:
+        yield
+    finally:
+        _local.trace = previous
+
+
+@contextmanager
+def phase(name: str) -> Iterator[None]:
+    """为当前线程的活动任务计时一个阶段，没有活动任务时不做任何事"""
+    trace = getattr(_local, "trace", None)
+    if trace is None:
+        yield
+        return
+    with trace.phase(name):
+        yield
+
+
+class StatsSampler:
+    """
+    在后台线程中读取容器的stats流，记录内存、CPU限流和进程数
+
+    stats流大约每秒产生一个样本；stop()后线程在下一个样本到达时退出。
+    """
+
+    def __init__(self, container):
+        self.container = container
+        self._stop = threading.Event()
+        self._first: Optional[Dict[str, Any]] = None
+        self._last: Optional[Dict[str, Any]] = None
+        self.samples = 0
+        self.peak_memory = 0
+        self.memory_limit = 0
+        self.peak_pids = 0
+        self.pids_limit = 0
+        self._thread = threading.Thread(target=self._run, name="sandbox-stats", daemon=True)
+
+    def start(self) -> "StatsSampler":
+        self._thread.start()
+        return self
+
+    def _run(self) -> None:
+        try:
+            for sample in self.container.stats(stream=True, decode=True):
+                self._record(sample)
+                if self._stop.is_set():
+                    return
+        except Exception:
+            # 容器已停止或stats接口不可用时不影响任务本身
+            return
+
+    def _record(self, sample: Dict[str, Any]) -> None:
+        memory = sample.get("memory_stats") or {}
+        usage = memory.get("max_usage") or memory.get("usage") or 0
+        self.peak_memory = max(self.peak_memory, usage)
+        self.memory_limit = memory.get("limit") or self.memory_limit
+        pids = sample.get("pids_stats") or {}
+        self.peak_pids = max(self.peak_pids, pids.get("current") or 0)
+        self.pids_limit = pids.get("limit") or self.pids_limit
+        if self._first is None:
+            self._first = sample
+        self._last = sample
+        self.samples += 1
+
+    def stop(self) -> Dict[str, Any]:
+        """停止采样并返回汇总"""
+        self._stop.set()
+        return self.summary()
+
+    @staticmethod
+    def _cpu(sample: Optional[Dict[str, Any]]) -> Tuple[int, int, int, int]:
+        """返回(CPU纳秒, CFS周期数, 被限流周期数, 被限流纳秒)"""
+        cpu = (sample or {}).get("cpu_stats") or {}
+        throttling = cpu.get("throttling_data") or {}
+        return ((cpu.get("cpu_usage") or {}).get("total_usage") or 0,
+                throttling.get("periods") or 0,
+                throttling.get("throttled_periods") or 0,
+                throttling.get("throttled_time") or 0)
+
+    def summary(self) -> Dict[str, Any]:
+        first_usage, first_periods, first_throttled, first_time = self._cpu(self._first)
+        last_usage, last_periods, last_throttled, last_time = self._cpu(self._last)
+        periods = last_periods - first_periods
+        throttled = last_throttled - first_throttled
+        return {
+            "samples": self.samples,
+            "peak_memory_bytes": self.peak_memory,
+            "memory_limit_bytes": self.memory_limit,
+            "peak_memory_ratio": round(self.peak_memory / self.memory_limit, 4) if self.memory_limit else None,
+            "cpu_seconds": round((last_usage - first_usage) / 1e9, 3),
+            "cpu_periods": periods,
+            "cpu_throttled_periods": throttled,
+            "cpu_throttled_ratio": round(throttled / periods, 4) if periods else None,
+            "cpu_throttled_seconds": round((last_time - first_time) / 1e9, 3),
+            "peak_pids": self.peak_pids,
+            "pids_limit": self.pids_limit,
+        }
+
+
+class _Histogram:
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+        self.sum += value
+        self.count += 1
+
+
+def _labels(**labels: str) -> str:
+    if not labels:
+        return ""
+    body = ",".join(f'{k}="{str(v).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+                    for k, v in labels.items())
+    return "{" + body + "}"
+
+
+class MetricsRegistry:
+    """汇总所有任务的指标，并渲染为Prometheus文本格式"""
+
+    def __init__(self, log_path: Optional[str] = None):
+        """
+        参数:
+            log_path: JSON日志文件路径，默认读取环境变量SANDBOX_METRICS_LOG，未设置时写到stderr
+        """
+        self.log_path = log_path or os.getenv("SANDBOX_METRICS_LOG")
+        self._lock = threading.Lock()
+        self._jobs: Dict[str, int] = {}
+        self._phases: Dict[str, _Histogram] = {}
+        self._memory = _Histogram(MEMORY_BUCKETS)
+        self._pids = _Histogram(PIDS_BUCKETS)
+        self._throttled_seconds = 0.0
+        self._throttled_periods = 0
+        self._cpu_periods = 0
+        self._cpu_seconds = 0.0
+
+    def record(self, trace: JobTrace) -> None:
+        """记录一个已结束的任务并输出一行JSON日志"""
+        with self._lock:
+            self._jobs[trace.status] = self._jobs.get(trace.status, 0) + 1
+            for name, seconds in trace.phases.items():
+                self._phases.setdefault(name, _Histogram(PHASE_BUCKETS)).observe(seconds)
+            res = trace.resources
+            if res.get("samples"):
+                self._memory.observe(res["peak_memory_bytes"])
+                self._pids.observe(res["peak_pids"])
+                self._throttled_seconds += res["cpu_throttled_seconds"]
+                self._throttled_periods += res["cpu_throttled_periods"]
+                self._cpu_periods += res["cpu_periods"]
+                self._cpu_seconds += res["cpu_seconds"]
+        self._log(trace)
+
+    def _log(self, trace: JobTrace) -> None:
+        line = json.dumps({"event": "sandbox_job", **trace.to_dict()}, ensure_ascii=False)
+        if self.log_path:
+            with open(self.log_path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+        else:
+            print(line, file=sys.stderr, flush=True)
+
+    def render(self) -> str:
+        """渲染Prometheus文本格式"""
+        lines: List[str] = []
+        with self._lock:
+            lines += ["# HELP sandbox_jobs_total Sandbox jobs by final status.",
+                      "# TYPE sandbox_jobs_total counter"]
+            for status, count in sorted(self._jobs.items()):
+                lines.append(f"sandbox_jobs_total{_labels(status=status)} {count}")
+
+            lines += ["# HELP sandbox_phase_seconds Time spent per job phase.",
+                      "# TYPE sandbox_phase_seconds histogram"]
+            for name, hist in sorted(self._phases.items()):
+                lines += self._render_histogram("sandbox_phase_seconds", hist, phase=name)
+
+            lines += ["# HELP sandbox_job_peak_memory_bytes Peak container memory per job.",
+                      "# TYPE sandbox_job_peak_memory_bytes histogram"]
+            lines += self._render_histogram("sandbox_job_peak_memory_bytes", self._memory)
+            lines += ["# HELP sandbox_job_peak_pids Peak process count per job.",
+                      "# TYPE sandbox_job_peak_pids histogram"]
+            lines += self._render_histogram("sandbox_job_peak_pids", self._pids)
+
+            lines += ["# HELP sandbox_cpu_seconds_total CPU time used by sandbox jobs.",
+                      "# TYPE sandbox_cpu_seconds_total counter",
+                      f"sandbox_cpu_seconds_total {self._cpu_seconds}",
+                      "# HELP sandbox_cpu_periods_total CFS periods elapsed during jobs.",
+                      "# TYPE sandbox_cpu_periods_total counter",
+                      f"sandbox_cpu_periods_total {self._cpu_periods}",
+                      "# HELP sandbox_cpu_throttled_periods_total CFS periods in which jobs were throttled.",
+                      "# TYPE sandbox_cpu_throttled_periods_total counter",
+                      f"sandbox_cpu_throttled_periods_total {self._throttled_periods}",
+                      "# HELP sandbox_cpu_throttled_seconds_total Time jobs spent throttled by cpu_quota.",
+                      "# TYPE sandbox_cpu_throttled_seconds_total counter",
+                      f"sandbox_cpu_throttled_seconds_total {self._throttled_seconds}"]
+        return "\n".join(lines) + "\n"
+
+    @staticmethod
+    def _render_histogram(name: str, hist: _Histogram, **labels: str) -> List[str]:
+        lines = []
+        for bound, count in zip(hist.buckets, hist.counts):
+            lines.append(f"{name}_bucket{_labels(**labels, le=repr(float(bound)))} {count}")
+        lines.append(f'{name}_bucket{_labels(**labels, le="+Inf")} {hist.count}')
+        lines.append(f"{name}_sum{_labels(**labels)} {hist.sum}")
+        lines.append(f"{name}_count{_labels(**labels)} {hist.count}")
+        return lines
+
+
+# 进程内默认的指标注册表，DockerSandbox未指定时使用
+REGISTRY = MetricsRegistry()
+
+
+def start_metrics_server(port: int, registry: MetricsRegistry = REGISTRY,
+                         host: str = "0.0.0.0") -> ThreadingHTTPServer:
+    """
+    在后台线程中启动/metrics HTTP端点
+
+    返回:
+        HTTP服务器实例，调用shutdown()停止
+    """
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = registry.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, name="sandbox-metrics", daemon=True).start()
+    return server
@@ -0,0 +1,303 @@
+"""
+Docker沙盒容器池
+
+预先启动若干py-sandbox容器并保持预热，每次执行任务时租用一个容器，
+任务结束后重置并归还。后台线程负责把空闲容器补足到最小数量，
+并定期检查空闲容器的健康状态，替换异常退出的容器。
+
+池中的容器按卷配置和资源配置档区分：租用时可以指定卷配置和配置档，优先复用配置相同的空闲容器，
+池满时淘汰其他配置的空闲容器。预热的容器使用池的默认卷配置和配置档。
+"""
+import atexit
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Optional, Dict, Any, Iterator, Deque, Set, Hashable
+
+import docker
+from docker.models.containers import Container
+
+from dockersandbox import start_sandbox_container, default_workspace_volumes, volumes_key
+from resource_profiles import ResourceProfile, get_profile
+
+# 归还容器时执行的重置命令：结束任务遗留的进程并清理/tmp，
+# 容器的1号进程和常驻worker不受影响
+RESET_COMMAND = ["python", "-m", "agent_runtime.reset"]
+# 预热时启动常驻worker的命令
+WORKER_START_COMMAND = ["python", "-m", "agent_runtime.worker_client", "--start"]
+
+
+class PoolExhaustedError(RuntimeError):
+    """在等待时间内无法租用到容器"""
+
+
+class SandboxPool:
+    """
+    预热的py-sandbox容器池
+
+    属性:
+        min_size: 保持预热的最少容器数
+        max_size: 同时存在的最多容器数(空闲+租用中)
+        max_uses: 单个容器最多执行的任务数，超过后销毁并替换
+    """
+
+    def __init__(self, min_size: int = 1, max_size: int = 4,
+                 volumes: Optional[Dict[str, Any]] = None,
+                 max_uses: int = 50, health_interval: float = 10.0,
+                 warm_worker: bool = False,
+                 client: Optional[docker.DockerClient] = None,
+                 profile: Optional[str] = None, snapshot: bool = False):
+        """
+        初始化容器池并启动后台维护线程
+
+        参数:
+            min_size: 保持预热的最少容器数
+            max_size: 同时存在的最多容器数
+            volumes: 池中容器的卷配置，默认挂载./workspace
+            max_uses: 单个容器最多执行的任务数
+            health_interval: 后台健康检查的间隔秒数
+            warm_worker: 容器启动后立即启动常驻worker(配合DockerSandbox(use_worker=True))
+            client: 可选的Docker客户端实例
+            profile: 预热容器使用的资源配置档名称，默认为default
+            snapshot: 从预热快照镜像(见sandbox_snapshot)启动容器，首次使用时制作快照
+        """
+        if min_size < 0 or max_size < 1 or min_size > max_size:
+            raise ValueError(f"无效的容器池大小: min_size={min_size}, max_size={max_size}")
+        self.client = client or docker.from_env()
+        self.min_size = min_size
+        self.max_size = max_size
+        self.max_uses = max_uses
+        self.health_interval = health_interval
+        self.warm_worker = warm_worker
+        self.volumes = volumes if volumes is not None else default_workspace_volumes()
+        self.profile = get_profile(profile)
+        self.snapshot = snapshot
+
+        self._cond = threading.Condition()
+        self._idle: Deque[Container] = deque()
+        self._leased: Set[str] = set()
+        self._uses: Dict[str, int] = {}
+        self._keys: Dict[str, Hashable] = {}  # 容器ID -> (卷配置键, 配置档名称)
+        self._starting = 0
+        self._closed = False
+
+        self._maintainer = threading.Thread(target=self._maintain, name="sandbox-pool", daemon=True)
+        self._maintainer.start()
+        atexit.register(self.close)
+
+    @property
+    def size(self) -> int:
+        """当前容器总数(空闲+租用中+启动中)"""
+        with self._cond:
+            return self._total()
+
+    def _total(self) -> int:
+        return len(self._idle) + len(self._leased) + self._starting
+
+    @staticmethod
+    def _key(volumes: Dict[str, Any], profile: ResourceProfile) -> Hashable:
+        return volumes_key(volumes), profile.name
+
+    def _start_one(self, volumes: Dict[str, Any], profile: ResourceProfile) -> Container:
+        """启动一个新容器，调用方须已预留_starting计数"""
+        try:
+            container = start_sandbox_container(self.client, volumes, profile, self.snapshot)
+            if self.warm_worker:
+                container.exec_run(cmd=WORKER_START_COMMAND, user="nobody")
+        except Exception:
+            with self._cond:
+                self._starting -= 1
+                self._cond.notify_all()
+            raise
+        with self._cond:
+            self._starting -= 1
+            self._uses[container.id] = 0
+            self._keys[container.id] = self._key(volumes, profile)
+        return container
+
+    def _take_idle(self, key: Hashable) -> Optional[Container]:
+        """取出一个卷配置和配置档匹配的空闲容器，调用方须持有锁"""
+        for container in self._idle:
+            if self._keys.get(container.id) == key:
+                self._idle.remove(container)
+                return container
+        return None
+
+    def _discard(self, container: Container) -> None:
+        """销毁容器(auto_remove会在退出后删除它)"""
+        with self._cond:
+            self._uses.pop(container.id, None)
+            self._keys.pop(container.id, None)
+            self._cond.notify_all()
+        try:
+            container.kill()
+        except docker.errors.NotFound:
+            pass
+        except Exception as e:
+            print(f"销毁池中容器时出错: {e}")
+
+    @staticmethod
+    def _is_healthy(container: Container) -> bool:
+        try:
+            container.reload()
+            return container.status == "running"
+        except docker.errors.NotFound:
+            return False
+        except docker.errors.APIError:
+            return False
+
+    def _reset(self, container: Container) -> bool:
+        """任务结束后重置容器，返回容器是否可以继续复用"""
+        if self._uses.get(container.id, 0) >= self.max_uses:
+            return False
+        try:
+            result = container.exec_run(cmd=RESET_COMMAND, user="nobody")
+            if result.exit_code != 0:
+                return False
+            if self.warm_worker:
+                # 任务被取消或超时时重置会结束worker，这里重新启动以保持预热(worker在运行时立即返回)
+                container.exec_run(cmd=WORKER_START_COMMAND, user="nobody")
+            return True
+        except Exception:
+            return False
+
+    def acquire(self, timeout: Optional[float] = None,
+                volumes: Optional[Dict[str, Any]] = None,
+                profile: Optional[str] = None) -> Container:
+        """
+        租用一个容器，使用完毕后必须调用release归还
+
+        参数:
+            timeout: 最长等待秒数，None表示一直等待
+            volumes: 需要的卷配置，默认为池的卷配置
+            profile: 需要的资源配置档名称，默认为池的配置档
+
+        异常:
+            PoolExhaustedError: 等待超时
+        """
+        volumes = self.volumes if volumes is None else volumes
+        profile = self.profile if profile is None else get_profile(profile)
+        key = self._key(volumes, profile)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            evicted = None
+            with self._cond:
+                if self._closed:
+                    raise RuntimeError("容器池已关闭")
+                container = self._take_idle(key)
+                start_new = False
+                if container is None:
+                    if self._total() < self.max_size:
+                        start_new = True
+                    elif self._idle:
+                        # 池已满但有其他配置的空闲容器，淘汰最早的一个
+                        evicted = self._idle.popleft()
+                        start_new = True
+                    if start_new:
+                        self._starting += 1
+                if container is None and not start_new:
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        raise PoolExhaustedError(f"{timeout}秒内没有可用的沙盒容器")
+                    self._cond.wait(remaining)
+                    continue
+                if container is not None:
+                    self._leased.add(container.id)
+
+            if evicted is not None:
+                self._discard(evicted)
+            if start_new:
+                container = self._start_one(volumes, profile)
+                with self._cond:
+                    self._leased.add(container.id)
+            elif not self._is_healthy(container):
+                # 空闲期间异常退出的容器直接丢弃，重新获取
+                with self._cond:
+                    self._leased.discard(container.id)
+                self._discard(container)
+                continue
+
+            with self._cond:
+                self._uses[container.id] = self._uses.get(container.id, 0) + 1
+            return container
+
+    def release(self, container: Container, reusable: bool = True) -> None:
+        """
+        归还租用的容器，重置成功的容器回到空闲队列，否则销毁
+
+        参数:
+            container: acquire返回的容器
+            reusable: 调用方认为容器是否还可以复用
+        """
+        keep = reusable and not self._closed and self._reset(container)
+        with self._cond:
+            self._leased.discard(container.id)
+            if keep:
+                self._idle.append(container)
+            self._cond.notify_all()
+        if not keep:
+            self._discard(container)
+
+    @contextmanager
+    def lease(self, timeout: Optional[float] = None,
+              volumes: Optional[Dict[str, Any]] = None,
+              profile: Optional[str] = None) -> Iterator[Container]:
+        """以上下文管理器方式租用容器，退出时自动归还"""
+        container = self.acquire(timeout, volumes, profile)
+        reusable = True
+        try:
+            yield container
+        except BaseException:
+            reusable = self._is_healthy(container)
+            raise
+        finally:
+            self.release(container, reusable)
+
+    def _maintain(self) -> None:
+        """后台维护：补足空闲容器并替换不健康的容器"""
+        while True:
+            with self._cond:
+                if self._closed:
+                    return
+                idle = list(self._idle)
+            for container in idle:
+                if not self._is_healthy(container):
+                    with self._cond:
+                        if container not in self._idle:
+                            continue
+                        self._idle.remove(container)
+                    print("检测到异常的沙盒容器，正在替换...")
+                    self._discard(container)
+
+            while True:
+                with self._cond:
+                    if self._closed or len(self._idle) + self._starting >= self.min_size \
+                            or self._total() >= self.max_size:
+                        break
+                    self._starting += 1
+                try:
+                    container = self._start_one(self.volumes, self.profile)
+                except Exception as e:
+                    print(f"预热沙盒容器失败: {e}")
+                    break
+                with self._cond:
+                    self._idle.append(container)
+                    self._cond.notify_all()
+
+            with self._cond:
+                if self._closed:
+                    return
+                self._cond.wait(self.health_interval)
+
+    def close(self) -> None:
+        """关闭容器池并销毁所有空闲容器，租用中的容器在归还时销毁"""
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            idle = list(self._idle)
+            self._idle.clear()
+            self._cond.notify_all()
+        for container in idle:
+            self._discard(container)
@@ -0,0 +1,129 @@
+"""
+预热快照镜像
+
+在py-sandbox:<hash>容器中执行agent_runtime.preload(编译site-packages并导入重量级依赖)，
+然后把容器提交为派生镜像py-sandbox-warm:<hash>。容器池从快照启动容器，
+新容器不再需要在首次导入smolagents/litellm时编译字节码。
+
+快照以基础镜像的内容哈希为标签，Dockerfile或构建上下文变化后会自动重新制作。
+制作失败时退回使用基础镜像，同一基础镜像不会重复尝试。
+
+用法:
+    python sandbox_snapshot.py  # 预先制作快照
+"""
+import threading
+from typing import Dict, Set
+
+import docker
+
+from sandbox_image import resolve_image, HASH_LABEL
+
+SNAPSHOT_NAME = "py-sandbox-warm"
+# 快照镜像上记录基础镜像标签的标签名
+BASE_LABEL = "py-sandbox.snapshot-base"
+# 以root身份执行，使编译出的.pyc可以写入root所有的site-packages
+PRELOAD_COMMAND = ["python", "-m", "agent_runtime.preload"]
+
+_lock = threading.Lock()
+# 基础镜像标签 -> 快照镜像标签
+_resolved: Dict[str, str] = {}
+# 制作快照失败的基础镜像标签
+_failed: Set[str] = set()
+
+
+class SnapshotError(RuntimeError):
+    """预热脚本执行失败"""
+
+
+def snapshot_tag(base_image: str) -> str:
+    """返回基础镜像对应的快照标签"""
+    return f"{SNAPSHOT_NAME}:{base_image.rsplit(':', 1)[-1]}"
+
+
+def create_snapshot(client: docker.DockerClient, base_image: str) -> str:
+    """
+    从基础镜像启动容器、执行预热脚本并提交为快照镜像
+
+    参数:
+        client: Docker客户端实例
+        base_image: 基础镜像标签，形如py-sandbox:<hash>
+
+    返回:
+        快照镜像标签
+
+    异常:
+        SnapshotError: 预热脚本执行失败
+        docker.errors.APIError: 容器创建或提交失败
+    """
+    tag = snapshot_tag(base_image)
+    print(f"正在制作预热快照{tag}...")
+    container = client.containers.run(
+        base_image,
+        command="tail -f /dev/null",
+        detach=True,
+        tty=True,
+        network_mode="none",  # 预热只需要本地文件，避免导入时的联网检查拖慢制作
+        security_opt=["no-new-privileges"],
+        cap_drop=["ALL"],
+        auto_remove=True
+    )
+    try:
+        result = container.exec_run(cmd=PRELOAD_COMMAND, user="root")
+        output = result.output.decode("utf-8", errors="replace") if result.output else ""
+        if result.exit_code != 0:
+            raise SnapshotError(f"预热脚本执行失败(退出码{result.exit_code}):\n{output}")
+        print(output.strip())
+        repository, version = tag.rsplit(":", 1)
+        base_labels = client.images.get(base_image).labels or {}
+        container.commit(
+            repository=repository,
+            tag=version,
+            message=f"warm snapshot of {base_image}",
+            changes=[
+                f"LABEL {BASE_LABEL}={base_image}",
+                f"LABEL {HASH_LABEL}={base_labels.get(HASH_LABEL, version)}",
+                # 恢复基础镜像的默认命令，而不是制作时使用的tail -f /dev/null
+                'CMD ["python", "-c", "print(\'Container ready\')"]',
+            ]
+        )
+    finally:
+        try:
+            container.kill()
+        except docker.errors.APIError:
+            pass
+    print(f"预热快照{tag}制作完成。")
+    return tag
+
+
+def resolve_snapshot(client: docker.DockerClient) -> str:
+    """
+    返回当前基础镜像对应的快照镜像标签，必要时制作快照
+
+    制作失败时打印原因并返回基础镜像标签。
+    """
+    base_image = resolve_image(client)
+    tag = _resolved.get(base_image)
+    if tag:
+        return tag
+    with _lock:
+        tag = _resolved.get(base_image)
+        if tag:
+            return tag
+        if base_image in _failed:
+            return base_image
+        tag = snapshot_tag(base_image)
+        try:
+            client.images.get(tag)
+        except docker.errors.ImageNotFound:
+            try:
+                create_snapshot(client, base_image)
+            except (SnapshotError, docker.errors.APIError) as e:
+                print(f"制作预热快照失败，使用基础镜像{base_image}: {e}")
+                _failed.add(base_image)
+                return base_image
+        _resolved[base_image] = tag
+        return tag
+
+
+if __name__ == "__main__":
+    print(resolve_snapshot(docker.from_env()))
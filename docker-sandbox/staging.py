@@ -0,0 +1,232 @@
+"""
+通过tar流在主机和容器之间暂存文件
+
+代替绑定挂载：执行前用put_archive把主机目录同步到容器，执行后用get_archive
+把输出目录同步回主机。tar数据边生成边上传、边下载边解包，主机上不产生临时文件。
+同步是增量的：按文件大小和修改时间(秒)比较两侧，只传输有变化的文件，
+并删除目标一侧多余的文件，因此池中的容器可以依次服务不同任务的目录。
+"""
+import io
+import os
+import posixpath
+import stat
+import tarfile
+import time
+from typing import Dict, Iterator, Iterable, Tuple, Optional, List
+
+from docker.models.containers import Container
+
+# 容器内nobody用户和nogroup组的ID，暂存的文件归其所有，任务可以读写
+SANDBOX_UID = 65534
+SANDBOX_GID = 65534
+CHUNK_SIZE = 64 * 1024
+# 变化文件超过该比例时下载整个目录，否则逐个文件下载
+BULK_PULL_RATIO = 0.5
+
+FileIndex = Dict[str, Tuple[int, int]]  # 相对路径 -> (大小, 修改时间秒)
+
+
+def scan_host_dir(host_dir: str) -> FileIndex:
+    """列出主机目录中的普通文件"""
+    index = {}
+    for root, _, files in os.walk(host_dir):
+        for name in files:
+            path = os.path.join(root, name)
+            st = os.lstat(path)
+            if stat.S_ISREG(st.st_mode):
+                rel_path = os.path.relpath(path, host_dir).replace(os.sep, "/")
+                index[rel_path] = (st.st_size, int(st.st_mtime))
+    return index
+
+
+def scan_container_dir(container: Container, container_dir: str) -> FileIndex:
+    """列出容器目录中的普通文件，目录不存在时返回空字典"""
+    result = container.exec_run(
+        cmd=["find", container_dir, "-type", "f", "-printf", "%P\\0%s\\0%T@\\0"],
+        user="nobody"
+    )
+    if result.exit_code != 0 or not result.output:
+        return {}
+    fields = result.output.decode("utf-8", errors="surrogateescape").split("\0")
+    index = {}
+    for i in range(0, len(fields) - 2, 3):
+        index[fields[i]] = (int(fields[i + 1]), int(float(fields[i + 2])))
+    return index
+
+
+def _tar_header(name: str, size: int = 0, mtime: Optional[float] = None, is_dir: bool = False) -> bytes:
+    info = tarfile.TarInfo(name)
+    info.type = tarfile.DIRTYPE if is_dir else tarfile.REGTYPE
+    info.size = 0 if is_dir else size
+    info.mode = 0o755 if is_dir else 0o644
+    info.mtime = int(time.time() if mtime is None else mtime)
+    info.uid, info.gid = SANDBOX_UID, SANDBOX_GID
+    return info.tobuf(format=tarfile.PAX_FORMAT, encoding="utf-8", errors="surrogateescape")
+
+
+def tar_stream(host_dir: str, arc_root: str, files: Iterable[str]) -> Iterator[bytes]:
+    """
+    逐块生成tar数据，文件内容分块读取，内存占用与文件大小无关
+
+    参数:
+        host_dir: 主机目录
+        arc_root: 归档中的根目录名
+        files: 需要打包的相对路径
+    """
+    yield _tar_header(arc_root, is_dir=True)
+    dirs_written = set()
+    for rel_path in sorted(files):
+        # 先写出中间目录，保证其属主是nobody
+        parts = rel_path.split("/")[:-1]
+        for i in range(1, len(parts) + 1):
+            sub_dir = "/".join(parts[:i])
+            if sub_dir not in dirs_written:
+                dirs_written.add(sub_dir)
+                yield _tar_header(f"{arc_root}/{sub_dir}", is_dir=True)
+        path = os.path.join(host_dir, *rel_path.split("/"))
+        try:
+            f = open(path, "rb")
+        except OSError:
+            continue  # 扫描后被删除的文件
+        with f:
+            st = os.fstat(f.fileno())
+            size = st.st_size
+            yield _tar_header(f"{arc_root}/{rel_path}", size, st.st_mtime)
+            remaining = size
+            while remaining > 0:
+                chunk = f.read(min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    # 文件在打包过程中被截断，用0补齐已声明的大小
+                    chunk = b"\0" * min(CHUNK_SIZE, remaining)
+                remaining -= len(chunk)
+                yield chunk
+            padding = -size % tarfile.BLOCKSIZE
+            if padding:
+                yield b"\0" * padding
+    yield b"\0" * (tarfile.BLOCKSIZE * 2)
+
+
+class _IterReader(io.RawIOBase):
+    """把字节块迭代器包装成只读的流，供tarfile以流模式读取"""
+
+    def __init__(self, chunks: Iterator[bytes]):
+        self._chunks = iter(chunks)
+        self._buffer = b""
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        while not self._buffer:
+            try:
+                self._buffer = next(self._chunks)
+            except StopIteration:
+                return 0
+        n = min(len(b), len(self._buffer))
+        b[:n] = self._buffer[:n]
+        self._buffer = self._buffer[n:]
+        return n
+
+
+def _remove_remote(container: Container, container_dir: str, rel_paths: List[str]) -> None:
+    for i in range(0, len(rel_paths), 500):
+        batch = [posixpath.join(container_dir, p) for p in rel_paths[i:i + 500]]
+        container.exec_run(cmd=["rm", "-f", "--"] + batch, user="nobody")
+
+
+def push_dir(container: Container, host_dir: str, container_dir: str) -> int:
+    """
+    把主机目录增量同步到容器目录(容器一侧多余的文件会被删除)
+
+    参数:
+        container: 目标容器
+        host_dir: 主机目录
+        container_dir: 容器内的绝对路径，其父目录必须已存在
+
+    返回:
+        上传的文件数
+    """
+    container_dir = container_dir.rstrip("/")
+    local = scan_host_dir(host_dir)
+    remote = scan_container_dir(container, container_dir)
+    changed = [p for p, meta in local.items() if remote.get(p) != meta]
+    stale = [p for p in remote if p not in local]
+    if stale:
+        _remove_remote(container, container_dir, stale)
+    if changed or not remote:
+        # 目录本身总是包含在归档中，保证容器目录存在且属于nobody
+        parent, arc_root = posixpath.split(container_dir)
+        container.put_archive(parent or "/", tar_stream(host_dir, arc_root, changed))
+    return len(changed)
+
+
+def _safe_target(host_dir: str, rel_path: str) -> Optional[str]:
+    if not rel_path or rel_path.startswith("/") or ".." in rel_path.split("/"):
+        return None
+    return os.path.join(host_dir, *rel_path.split("/"))
+
+
+def _extract(chunks: Iterator[bytes], host_dir: str, strip: str, wanted: Optional[set]) -> int:
+    """流式解包get_archive的数据，只写出wanted中的普通文件"""
+    count = 0
+    with tarfile.open(fileobj=io.BufferedReader(_IterReader(chunks), CHUNK_SIZE), mode="r|") as tf:
+        for member in tf:
+            name = member.name
+            if strip:
+                if not name.startswith(strip + "/"):
+                    continue
+                name = name[len(strip) + 1:]
+            if not member.isfile() or (wanted is not None and name not in wanted):
+                continue
+            target = _safe_target(host_dir, name)
+            if target is None:
+                continue
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            source = tf.extractfile(member)
+            with open(target, "wb") as out:
+                while True:
+                    chunk = source.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    out.write(chunk)
+            os.utime(target, (member.mtime, member.mtime))
+            count += 1
+    return count
+
+
+def pull_dir(container: Container, container_dir: str, host_dir: str, delete: bool = False) -> int:
+    """
+    把容器目录增量同步回主机目录
+
+    参数:
+        container: 源容器
+        container_dir: 容器内的绝对路径
+        host_dir: 主机目录
+        delete: 是否删除主机一侧在容器中已不存在的文件
+
+    返回:
+        下载的文件数
+    """
+    container_dir = container_dir.rstrip("/")
+    os.makedirs(host_dir, exist_ok=True)
+    remote = scan_container_dir(container, container_dir)
+    local = scan_host_dir(host_dir)
+    changed = [p for p, meta in remote.items() if local.get(p) != meta]
+    count = 0
+    if changed and len(changed) > len(remote) * BULK_PULL_RATIO:
+        chunks, _ = container.get_archive(container_dir)
+        count = _extract(chunks, host_dir, posixpath.basename(container_dir), set(changed))
+    else:
+        for rel_path in changed:
+            chunks, _ = container.get_archive(posixpath.join(container_dir, rel_path))
+            # 单个文件的归档中只有该文件，按文件名定位
+            parent = posixpath.dirname(rel_path)
+            count += _extract(chunks, os.path.join(host_dir, *parent.split("/")) if parent else host_dir,
+                              "", {posixpath.basename(rel_path)})
+    if delete:
+        for rel_path in local:
+            if rel_path not in remote:
+                target = _safe_target(host_dir, rel_path)
+                if target:
+                    os.unlink(target)
+    return count
@@ -0,0 +1,80 @@
+"""
+代码模板注册表
+
+从code_template/目录加载Jinja2模板，编译结果缓存在进程内。
+每次取用时只比较模板文件的修改时间，文件被修改后自动重新编译，
+因此多个模板可以同时存在，且不需要在每次请求时读取和编译模板。
+"""
+import os
+import threading
+from typing import List, Optional
+
+TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "code_template")
+TEMPLATE_SUFFIX = ".tmpl"
+
+
+class TemplateRegistry:
+    """
+    Jinja2代码模板注册表
+
+    属性:
+        template_dir: 模板所在目录
+    """
+
+    def __init__(self, template_dir: Optional[str] = None, cache_size: int = 50):
+        """
+        初始化模板注册表
+
+        参数:
+            template_dir: 模板目录，默认为code_template/
+            cache_size: 最多缓存的已编译模板数量
+        """
+        self.template_dir = template_dir or TEMPLATE_DIR
+        self.cache_size = cache_size
+        self._env = None
+        self._lock = threading.Lock()
+
+    def _environment(self):
+        # 延迟导入jinja2，只在第一次渲染时创建环境
+        if self._env is None:
+            with self._lock:
+                if self._env is None:
+                    from jinja2 import Environment, FileSystemLoader
+                    self._env = Environment(
+                        loader=FileSystemLoader(self.template_dir, encoding="utf-8"),
+                        auto_reload=True,  # 模板文件的mtime变化时重新编译
+                        cache_size=self.cache_size,
+                        keep_trailing_newline=True,
+                    )
+        return self._env
+
+    def names(self) -> List[str]:
+        """列出模板目录中可用的模板文件名"""
+        if not os.path.isdir(self.template_dir):
+            return []
+        return sorted(name for name in os.listdir(self.template_dir) if name.endswith(TEMPLATE_SUFFIX))
+
+    def get(self, template_file: str):
+        """
+        获取已编译的模板
+
+        参数:
+            template_file: code_template/下的模板文件名，如default.tmpl
+
+        异常:
+            jinja2.TemplateNotFound: 模板不存在
+        """
+        return self._environment().get_template(template_file)
+
+    def render(self, template_file: str, **context) -> str:
+        """
+        渲染指定模板
+
+        参数:
+            template_file: code_template/下的模板文件名
+            context: 模板变量，如question
+
+        返回:
+            渲染后的代码字符串
+        """
+        return self.get(template_file).render(**context)
@@ -1,25 +1,14 @@
-from smolagents import ToolCollection, CodeAgent
+from smolagents import CodeAgent
 from mcp import StdioServerParameters
-from smolagents import OpenAIServerModel
+from agent_runtime.models import create_model
+from agent_runtime.mcp_manager import shared_manager
 import os
 # 设置HTTP代理
 os.environ['HTTP_PROXY'] = os.environ["PROXY"]
 os.environ['HTTPS_PROXY'] = os.environ["PROXY"]
 
-amodel = OpenAIServerModel(
-    model_id=os.environ["MODEL_NAME"],
-    api_base="https://openrouter.ai/api/v1",
-    api_key=os.environ["OPENAI_TOKEN"],
-)
-server_parameters = StdioServerParameters(
-    command="python",
-    args=["-m", "mcp_server_fetch"],
-    env={
-        "HTTP_PROXY": os.environ["PROXY"],
-        "HTTPS_PROXY": os.environ["PROXY"]
-    },
-)
-
+# 默认为openrouter上的OpenAIServerModel，可通过AGENT_MODEL_BACKEND切换(例如scripted离线回放)
+amodel = create_model("openai")
 server_parameters1 = StdioServerParameters(
     command="python",
     args=["-m", "mcp_server_baidu_maps"],
@@ -30,6 +19,9 @@ server_parameters1 = StdioServerParameters(
     },
 )
 
-with ToolCollection.from_mcp(server_parameters1, trust_remote_code=True) as tool_collection:
-    agent = CodeAgent(tools=[*tool_collection.tools], model=amodel, add_base_tools=True)
-    agent.run("从广州珠江新城到荔湾的游览路线，已经应该怎么乘坐公共交通工具，要给出每个参观景点的路线、耗时、交通方式，最终以markdown格式告诉我结果")
\ No newline at end of file
+# 从共享的MCP服务管理器获取工具，服务在这里第一次用到时才启动
+mcp_servers = shared_manager()
+mcp_servers.add("baidu_maps", server_parameters1)
+tool_collection = mcp_servers.tools("baidu_maps")
+agent = CodeAgent(tools=[*tool_collection.tools], model=amodel, add_base_tools=True)
+agent.run("从广州珠江新城到荔湾的游览路线，已经应该怎么乘坐公共交通工具，要给出每个参观景点的路线、耗时、交通方式，最终以markdown格式告诉我结果")
\ No newline at end of file
@@ -1,27 +1,16 @@
-from smolagents import ToolCollection, CodeAgent
+from smolagents import CodeAgent
 from mcp import StdioServerParameters
-from smolagents import OpenAIServerModel
+from agent_runtime.models import create_model
+from agent_runtime.mcp_manager import shared_manager
+from agent_runtime.step_trace import instrument
 import os
 
 # 设置HTTP代理
 os.environ['HTTP_PROXY'] = os.environ["PROXY"]
 os.environ['HTTPS_PROXY'] = os.environ["PROXY"]
 
-amodel = OpenAIServerModel(
-    model_id=os.environ["MODEL_NAME"],
-    api_base="https://openrouter.ai/api/v1",
-    api_key=os.environ["OPENAI_TOKEN"],
-)
-fetch_parameters = StdioServerParameters(
-    command="python",
-    args=["-m", "mcp_server_fetch"],
-    env={
-        "HTTP_PROXY": os.environ["PROXY"],
-        "HTTPS_PROXY": os.environ["PROXY"],
-        "USE_PROXY": "true"
-    },
-)
-
+# 默认为openrouter上的OpenAIServerModel，可通过AGENT_MODEL_BACKEND切换(例如scripted离线回放)
+amodel = create_model("openai")
 baidu_parameters = StdioServerParameters(
     command="python",
     args=["-m", "mcp_server_baidu_maps"],
@@ -31,22 +20,17 @@ baidu_parameters = StdioServerParameters(
         "HTTPS_PROXY": os.environ["PROXY"]
     },
 )
-currenttime_parameters = StdioServerParameters(
-    command="python",
-    args=["-m", "mcp_server_time","--local-timezone","Asia/Shanghai"],
-    env={
-        "HTTP_PROXY": os.environ["PROXY"],
-        "HTTPS_PROXY": os.environ["PROXY"]
-    },
-)
 
-with ToolCollection.from_mcp(fetch_parameters, trust_remote_code=True) as fetch_collection, \
-     ToolCollection.from_mcp(currenttime_parameters, trust_remote_code=True) as time_collection, \
-     ToolCollection.from_mcp(baidu_parameters, trust_remote_code=True) as baidu_collection:
-    agent = CodeAgent(
-        tools=[*fetch_collection.tools], 
-        model=amodel, 
-        add_base_tools=False
-    )
-    print([*fetch_collection.tools, *time_collection.tools])
-    agent.run("先搞清楚今天的日期，然后使用fetch的mcp工具，告诉我bbc今天有什么关于中美贸易战的新闻，用中文markdown格式总结，请注明信息来源")
\ No newline at end of file
+# fetch和time服务并发启动；baidu_maps只登记，没有用到就不会启动
+mcp_servers = shared_manager()
+mcp_servers.add("baidu_maps", baidu_parameters)
+tool_collection = mcp_servers.tools("fetch", "time")
+agent = CodeAgent(
+    tools=[*tool_collection.tools], 
+    model=amodel, 
+    add_base_tools=False
+)
+# 每一步的token和耗时写入agent_trace.jsonl，用python -m agent_runtime.step_trace agent_trace.jsonl汇总
+instrument(agent, os.getenv("AGENT_STEP_TRACE", "agent_trace.jsonl"), script="mcp_web_agent")
+print([*tool_collection.tools])
+agent.run("先搞清楚今天的日期，然后使用fetch的mcp工具，告诉我bbc今天有什么关于中美贸易战的新闻，用中文markdown格式总结，请注明信息来源")
\ No newline at end of file
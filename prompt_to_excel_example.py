@@ -1,16 +1,14 @@
-from smolagents import ToolCollection, CodeAgent
-from smolagents import OpenAIServerModel
+from smolagents import CodeAgent
+from agent_runtime.models import create_model
+from agent_runtime.step_trace import instrument
 import os
 
 # 设置HTTP代理
 os.environ['HTTP_PROXY'] = os.environ["PROXY"]
 os.environ['HTTPS_PROXY'] = os.environ["PROXY"]
 
-amodel = OpenAIServerModel(
-    model_id=os.environ["MODEL_NAME"],
-    api_base="https://openrouter.ai/api/v1",
-    api_key=os.environ["OPENAI_TOKEN"],
-)
+# 默认为openrouter上的OpenAIServerModel，可通过AGENT_MODEL_BACKEND切换(例如scripted离线回放)
+amodel = create_model("openai")
 
 
 agent = CodeAgent(
@@ -19,6 +17,8 @@ agent = CodeAgent(
     additional_authorized_imports=["pandas","openpyxl"],
     add_base_tools=False
 )
+# 每一步的token和耗时写入agent_trace.jsonl，用python -m agent_runtime.step_trace agent_trace.jsonl汇总
+instrument(agent, os.getenv("AGENT_STEP_TRACE", "agent_trace.jsonl"), script="prompt_to_excel_example")
 
 # agent.run("""
 # 你的运行环境中有这些包：